@@ -0,0 +1,6 @@
+# Entry point for `python -m bctcs_terrain_parser`; see cli.py
+import sys
+
+from .cli import main
+
+sys.exit(main())
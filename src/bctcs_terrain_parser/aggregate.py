@@ -0,0 +1,219 @@
+# Area-weighted summaries of terrain layers
+#
+# A TerrainAggregator takes (terrain code, area) pairs one at a time and accumulates, for every
+# vocabulary term (the 'category:letters' terms of catalog.py, e.g. 'material:C' or
+# 'process:R'), the area of the terrain types that use it. Memory use depends only on the
+# number of terms, so a province-scale layer can be summarised in a single pass. Partial
+# aggregates, e.g. one per worker process or per map sheet, are combined with merge():
+#
+#   total = TerrainAggregator()
+#   for part in pool.map(summarise_sheet, sheets):   # each returning a TerrainAggregator
+#       total.merge(part)
+#   total.proportions('material')
+#
+# SHARE OF EACH TERRAIN TYPE:
+# ===========================
+# The area of a polygon is split between the terrain types of its code:
+#   - by their deciles, when every terrain type ends with one (e.g. 'Mb7/Cv3'), normalised to
+#     their sum
+#   - otherwise by the separators, each giving the extent of the next terrain type relative
+#     to the previous one (EXTENT_RATIOS):  '='  1:1,  '/'  3:2,  '//'  4:1.  'Mb/Cv' is split
+#     60/40, 'Mb//Cv' 80/20 and 'Mb/Cv/Rs' 9:6:4
+#
+# A terrain type counts fully towards every term it uses, so the shares of a category do not
+# necessarily add up to one: sandy gravel (sg) counts towards both texture:s and texture:g,
+# and a terrain type without processes towards no process. Undefined letters are not counted;
+# the area of codes with unparsed terms is reported as invalid_area.
+#
+# USAGE:
+# ======
+#   python -m bctcs_terrain_parser.aggregate layer.csv --column terrain --area-column area_ha
+
+import argparse
+import csv
+import functools
+import re
+import sys
+
+from . import bctcs_terrain_parser as _parser
+from .bctcs_terrain_parser import (ENGINES, surficial_material_terms, surface_expression_terms,
+                                   textural_terms, geomorphological_process_terms,
+                                   bedrock_R_subclass_terms, _engine, _split_composite, is_valid)
+from .catalog import component_terms
+
+# Extent of a terrain type relative to the one before it, by the separator between them
+EXTENT_RATIOS = {'=': 1.0, '/': 2 / 3, '//': 1 / 4}
+
+_decile = re.compile(r'(\d+)(?://|/|=)?\Z')
+
+
+def component_shares(terrain_code: str) -> tuple:
+    """
+    Returns the share of the polygon area of each terrain type of a code
+
+    >>> component_shares('Mb7/Cv3'), component_shares('Mb//Cv'), component_shares('Mb=Cv/Rs')
+    ((0.7, 0.3), (0.8, 0.2), (0.375, 0.375, 0.25))
+    """
+    strings = _split_composite(terrain_code)
+    if not strings:
+        return ()
+    deciles = [_decile.search(string) for string in strings]
+    if all(deciles):
+        deciles = [int(match.group(1)) for match in deciles]
+        total = sum(deciles)
+        if total > 0:
+            return tuple(decile / total for decile in deciles)
+    weights = [1.0]
+    for string in strings[:-1]:
+        separator = '//' if string.endswith('//') else string[-1]
+        weights.append(weights[-1] * EXTENT_RATIOS.get(separator, 1.0))
+    total = sum(weights)
+    return tuple(weight / total for weight in weights)
+
+
+@functools.lru_cache(maxsize=65536)
+def _code_shares(terrain_code: str, engine: str = 'legacy') -> tuple:
+    """
+    Returns ((term, share of the polygon area), ...) and whether the code is valid
+    """
+    shares = {}
+    for string, share in zip(_split_composite(terrain_code), component_shares(terrain_code)):
+        for term in component_terms(string):
+            shares[term] = shares.get(term, 0.0) + share
+    return tuple(shares.items()), is_valid(terrain_code, engine)
+
+
+def describe(term: str) -> str:
+    """
+    English description of a 'category:letters' term
+
+    >>> describe('material:C'), describe('subclass:Rd')
+    ('Colluvium (Active)', 'debris flow')
+    """
+    category, letters = term.split(':', 1)
+    if category == 'material':
+        return surficial_material_terms.get(letters, '')
+    if category == 'expression':
+        return surface_expression_terms.get(letters, '')
+    if category == 'texture':
+        return textural_terms.get(letters, '')
+    if category == 'process':
+        return geomorphological_process_terms.get(letters, '')
+    if category == 'bedrock':
+        return bedrock_R_subclass_terms.get(letters, '')
+    if category == 'subclass' and len(letters) == 2 and letters.isascii():
+        table = _parser._subclass_tables[ord(letters[0])]
+        return (table[ord(letters[1])] or '') if table else ''
+    return letters
+
+
+class TerrainAggregator:
+    """
+    Accumulates the area of every vocabulary term over (terrain code, area) pairs
+
+    >>> aggregator = TerrainAggregator()
+    >>> aggregator.add([('Mb7/Cv3', 10.0), ('Cv-A', 5.0), ('oNTA', 1.0)])
+    >>> aggregator.totals['material:C'], aggregator.invalid_area
+    (8.0, 1.0)
+    >>> aggregator.proportions('process')
+    {'process:A': 0.3125}
+    >>> other = TerrainAggregator()
+    >>> other.add([('Mb', 4.0)])
+    >>> aggregator.merge(other).proportions('material')
+    {'material:M': 0.55, 'material:C': 0.4}
+    """
+
+    def __init__(self, engine: str = 'legacy') -> None:
+        _engine(engine)
+        self.engine = engine
+        self.totals = {}
+        self.area = 0.0
+        self.invalid_area = 0.0
+        self.features = 0
+
+    def add_one(self, terrain_code: str, area: float) -> None:
+        shares, valid = _code_shares(terrain_code, self.engine)
+        totals = self.totals
+        for term, share in shares:
+            totals[term] = totals.get(term, 0.0) + share * area
+        self.area += area
+        if not valid:
+            self.invalid_area += area
+        self.features += 1
+
+    def add(self, pairs) -> None:
+        """
+        Adds (terrain code, area) pairs
+        """
+        for terrain_code, area in pairs:
+            self.add_one(terrain_code, area)
+
+    def merge(self, other: 'TerrainAggregator') -> 'TerrainAggregator':
+        """
+        Adds the totals of another aggregator to this one; returns this one
+        """
+        for term, area in other.totals.items():
+            self.totals[term] = self.totals.get(term, 0.0) + area
+        self.area += other.area
+        self.invalid_area += other.invalid_area
+        self.features += other.features
+        return self
+
+    def proportions(self, category: str = None) -> dict:
+        """
+        Share of the total area of every term (of one category if given), largest first
+        """
+        prefix = category + ':' if category else ''
+        terms = sorted((term for term in self.totals if term.startswith(prefix)),
+                       key=lambda term: (-self.totals[term], term))
+        return {term: self.totals[term] / self.area if self.area else 0.0 for term in terms}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m bctcs_terrain_parser.aggregate',
+                                     description='Area-weighted share of every terrain term in a CSV layer.')
+    parser.add_argument('input', nargs='?', default='-', help="input CSV (default '-' reads stdin)")
+    parser.add_argument('-o', '--output', default='-', help="output CSV (default '-' writes stdout)")
+    parser.add_argument('-c', '--column', default='terrain', help="terrain code column (default 'terrain')")
+    parser.add_argument('-a', '--area-column', default='area', help="polygon area column (default 'area')")
+    parser.add_argument('--engine', choices=list(ENGINES), default='legacy')
+    args = parser.parse_args(argv)
+
+    infile = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    aggregator = TerrainAggregator(args.engine)
+    try:
+        rows = csv.reader(infile)
+        header = next(rows, [])
+        try:
+            column, area_column = header.index(args.column), header.index(args.area_column)
+        except ValueError:
+            print('error: columns %r and %r expected in header %r' % (args.column, args.area_column, header),
+                  file=sys.stderr)
+            return 1
+        for line, row in enumerate(rows, 2):
+            try:
+                aggregator.add_one(row[column], float(row[area_column]))
+            except (IndexError, ValueError):
+                print('error: line %d: no terrain code and area' % line, file=sys.stderr)
+                return 1
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    try:
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(['term', 'description', 'area', 'proportion'])
+        for term, proportion in sorted(aggregator.proportions().items(),
+                                       key=lambda item: (item[0].split(':')[0], -item[1])):
+            writer.writerow([term, describe(term), aggregator.totals[term], round(proportion, 6)])
+        writer.writerow(['invalid', 'codes with unparsed terms', aggregator.invalid_area,
+                         round(aggregator.invalid_area / aggregator.area, 6) if aggregator.area else 0.0])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
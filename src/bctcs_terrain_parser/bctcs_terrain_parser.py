@@ -62,7 +62,13 @@
 #
 # Author: Pete Carvalho Apr 25, 2023
 
+import hashlib
+import json
 import re
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
 
 # Dictionary for Textural Terms
 textural_terms = {
@@ -298,34 +304,1752 @@ bedrock_R_subclass_terms = {
     'sm': 'non-foliated, serpentine marble',
 }
 
+# Dictionary for Qualifier Terms (superscript, or inline after '^': sgF^Gt-F^I)
+qualifier_terms = {
+    'A': 'Active',
+    'G': 'Glacial',
+    'I': 'Inactive',
+}
+
+# COMPILED LOOKUP TABLES
+# The dictionaries above are compiled into flat tables for the tokenizer engine, which then
+# needs a single indexed lookup per character:
+#   _char_flags                  character class flags of every ASCII character
+#   _texture_table etc.          description of every ASCII code letter (None if undefined)
+#   _subclass_tables             the subclass table to use after each process letter
+#   _bedrock_table               bedrock subclass descriptions indexed by both letters
+# Characters outside ASCII are classified with the str methods instead (see _char_class).
+# The tables are built at import and again whenever another vocabulary is installed
+# (see vocabulary.py).
+
+# Names of the compiled tables, as returned by _build_tables()
+TABLES = ('_char_flags', '_texture_table', '_expression_table', '_process_table', '_subclass_tables',
+          '_bedrock_table')
+
+_UPPER = 1      # str.isupper()
+_LOWER = 2      # str.islower()
+_HYPHEN = 4     # '-', start of the geomorphological processes
+_PROCESS = 8    # char.upper() is a geomorphological process letter
+
+def _char_class(char: str, process_terms: dict = None) -> int:
+    """
+    Returns the character class flags of char
+
+    >>> _char_class('V') == _UPPER | _PROCESS, _char_class('v') == _LOWER | _PROCESS, _char_class('-') == _HYPHEN
+    (True, True, True)
+    """
+    if process_terms is None:
+        process_terms = geomorphological_process_terms
+    flags = 0
+    if char.isupper():
+        flags |= _UPPER
+    elif char.islower():
+        flags |= _LOWER
+    if char == '-':
+        flags |= _HYPHEN
+    if char.upper() in process_terms:
+        flags |= _PROCESS
+    return flags
+
+def _ascii_table(terms: dict) -> list:
+    """
+    Compiles a dictionary of single-character codes into a list indexed by ord(code)
+
+    >>> _ascii_table(textural_terms)[ord('g')]
+    'Gravel'
+    """
+    table = [None] * 128
+    for code, description in terms.items():
+        table[ord(code)] = description
+    return table
+
+def _build_tables(terms: dict) -> dict:
+    """
+    Compiles vocabulary dictionaries (a mapping of the names in VOCABULARIES to dictionaries)
+    into the tables named in TABLES
+
+    >>> _build_tables(globals())['_process_table'][ord('F')]
+    'Slow mass movements (Active)'
+    """
+    process_terms = terms['geomorphological_process_terms']
+    tables = dict(
+        _char_flags=[_char_class(chr(i), process_terms) for i in range(128)],
+        _texture_table=_ascii_table(terms['textural_terms']),
+        _expression_table=_ascii_table(terms['surface_expression_terms']),
+        _process_table=_ascii_table(process_terms),
+        _subclass_tables=[None] * 128,
+        _bedrock_table=[None] * (128 * 128),
+    )
+    for letters, name in (('F', 'slow_mass_movement_F_subclass_terms'),
+                          ('R', 'rapid_mass_movement_R_subclass_terms'),
+                          ('A', 'snow_avalanches_A_subclass_terms'),
+                          ('BIJM', 'fluvial_B_I_J_M_subclass_terms'),
+                          ('XZ', 'permafrost_X_Z_subclass_terms')):
+        table = _ascii_table(terms[name])
+        for letter in letters:
+            tables['_subclass_tables'][ord(letter)] = table
+    for code, description in terms['bedrock_R_subclass_terms'].items():
+        tables['_bedrock_table'][ord(code[0]) * 128 + ord(code[1])] = description
+    return tables
+
+def _compile_tables() -> None:
+    """
+    (Re)builds the lookup tables from the vocabulary dictionaries
+    """
+    globals().update(_build_tables(globals()))
+
+_compile_tables()
+
+# Marker for a Terrain whose code has not been interpreted yet
+_UNPARSED = object()
+
+def _interpret(terrain_code: str) -> tuple:
+    """
+    Split and interpret a single terrain code.
+
+    Returns a pair (components, error_msg) where components is a tuple of eight-element
+    tuples (see Terrain.parsed) and error_msg is the concatenated description of any
+    unparsed terms ('' when the whole code was understood). Strict mode is applied by
+    the caller, so the same result can serve both modes.
+
+    >>> _interpret('Cv-A')
+    ((('Colluvium (Active)', 'veneer', '', 'Snow avalanches (Active) ', 'continuous', '', '', 'Cv-A'),), '')
+    """
+    if '^' in terrain_code and _qualifier.search(terrain_code):
+        return _interpret_qualified(terrain_code, _interpret)
+
+    # initialize an empty list called terrain_code_split
+    terrain_code_split = []
+
+    # initialize a variable called current_index and set its value to 0
+    current_index = 0
+    
+    # SPLIT THE CODE WHEN MULTIPLE TERRAIN TYPES ARE CONTAINED IN A CODE
+    # This occurs when code contains '/' '//' or '=' chars (except for
+    # position 0 where '/' indicates discontinuity) loop through the indices of terrain_code
+    for i in range(len(terrain_code)):
+        # if the current character is "/" or "=" and not the first character of terrain_code
+        if terrain_code[i] in ["/", "="] and i != 0:
+            #check for "double //" and perform that case, or single case if not double '//'
+            if i < len(terrain_code) - 1 and terrain_code[i+1] == '/':
+                terrain_code_split.append(terrain_code[current_index:i+2])
+                current_index = i + 2
+            else:
+                # split the string at the current index and append it to terrain_code_split
+                terrain_code_split.append(terrain_code[current_index:i+1])
+                # update current_index to be the index after the current split character
+                current_index = i + 1
+
+    # if there are characters remaining in terrain_code, append them to terrain_code_split
+    if current_index != len(terrain_code):
+        terrain_code_split.append(terrain_code[current_index:])
+
+    # strip any blank entries before moving on
+    terrain_code_split = [item for item in terrain_code_split if item.strip()]
+    
+    ###END SPLITTING SECTION
+
+    # PARSE/INTERPRET CODES IN THIS SECTION
+    # Take each split code and make a list containing 6 descriptors describing the terrain
+    # and a 7th descriptor that notes any code characters that are not defined in the BCTCS
+
+    # create a new list for each item in the terrain_code_split list
+    new_list = []
+    for string in terrain_code_split:
+        # initialize the values for the new list
+        first_val = ""
+        second_val = ""
+        third_val = ""
+        fourth_val = ""
+        fifth_val = ""
+
+        # *SURFICIAL MATERIAL*  check the first uppercase letter in the string
+        first_val = ""
+
+        # this conditional makes sure to include Bedrock modifier codes (if they exist)
+        # this occurs when 'R' is preded by lowercase chars that exist in bedrock_R_subclass_terms dictionary
+        if string.find("R") >= 2:
+            prev_two = string[string.find("R")-2:string.find("R")]
+            if prev_two in bedrock_R_subclass_terms.keys():
+                first_val += prev_two
+
+        # get all characters before the first hyphen
+        pre_hyphen = string.split('-')[0] if '-' in string else string
+
+        # get the first uppercase letter or consecutive uppercase letters
+        first_val = ''
+        
+        for i in range(len(pre_hyphen)):
+            if pre_hyphen[i].isupper():
+                first_val = pre_hyphen[i]
+                for j in range(i+1, len(pre_hyphen)):
+                    if pre_hyphen[j].isupper():
+                        first_val += pre_hyphen[j]
+                    else:
+                        break
+                break
+    
+        # *SURFACE EXPRESSION*  assign the second value
+        upper_found = False
+        second_val = ''
+        for char in string:
+            if char.isupper():
+                upper_found = True
+            elif char.islower() and upper_found and '-' not in string[string.index(char)-1:string.index(char)]:
+                second_val += char
+            elif char == '-':
+                upper_found = False
+        
+        # *TEXTURE* assign the third value
+        third_val = ""
+        for char in string:
+            if char.isupper():
+                break
+            elif char.islower():
+                third_val += char
+        
+        # *GEOMORPHOLOGICAL PROCESS* assign the fourth value
+        fourth_val = ""
+        # strip the '-' that indicates the following chars codify geomorph processes
+        if '-' in string:
+            i = string.index('-')
+            fourth_val = string[i:]
+            #remove / or = or numeric data
+            fourth_val = re.sub('[0-9/=-]', '', fourth_val)
+
+        # *CONTINUITY* assign the fifth value
+        fifth_val = ''
+        if string[0] == '/':
+            fifth_val = "discontinuous"
+        elif string[0] == '':
+            fifth_val = ''
+        else:
+            fifth_val = "continuous"
+
+        # *EXTENT RELATIVE TO NEXT TERRAIN TYPE* assign the sixth value (terrain extent relative to the following terrain)
+        sixth_val = ''
+        if string[-1] == "=":
+            sixth_val = "equal extent relative to next terrain type"
+        elif string[-1] == "/":
+            if len(string) > 1 and string[-2] == "/":
+                sixth_val = "much greater extent relative to next terrain type"
+            else:
+                sixth_val = "greater extent relative to next terrain type"
+        elif string[-1].isdigit():
+            sixth_val = string[-1]
+
+        # add the values to the new list
+        new_list.append([first_val, second_val, third_val, fourth_val, fifth_val, sixth_val, '', string])
+    
+    # DEBUGGING PRINT UPDATES
+#           print(new_list)
+    # print(new_list[0])
+    # print(new_list[0][0][:2])
+
+    # Loop over each list in new_list and replace coded characters with descriptive words in dictionaries
+    
+    for i in range(len(new_list)):
+        
+        # SURFICIAL MATERIAL CODE INTERPRETATION
+        # Replace the first value with the associated value in the surficial_material_terms dictionary
+        first_val = ''
+        if len(new_list[i][0]) > 2 and new_list[i][0][:2] in bedrock_R_subclass_terms:
+            first_val += bedrock_R_subclass_terms[new_list[i][0][:2]] + ' '
+    
+        # Remove any non-uppercase letters from new_list[i][0]
+        upper_case_letters = ''.join([char for char in new_list[i][0] if char.isupper()])
+
+        # Check for an activity modifier (I or A) then strip them from upper_case_letters and process 
+        # the modifiers after terrain expression interpretation is complete
+        activity_modifier = ''
+        # debugging --print(upper_case_letters, " ", len(upper_case_letters), type(upper_case_letters))
+        if len(upper_case_letters) > 1:
+            if 'I' in upper_case_letters[1:]:
+                activity_modifier = 'I'
+                upper_case_letters = upper_case_letters.replace('I', '')
+            elif 'A' in upper_case_letters[1:]:
+                activity_modifier = 'A'
+                upper_case_letters = upper_case_letters.replace('A', '')
+
+        # Count the number of uppercase letters
+        num_upper_case_letters = len(upper_case_letters)
+
+        if num_upper_case_letters == 1:
+            # Get the single uppercase letter
+            single_letter = upper_case_letters[0]
+
+            # Check if the surficial_material_terms dictionary has a value for that letter
+            if single_letter in surficial_material_terms:
+                # Add the associated value to new_first_val
+                first_val += surficial_material_terms[single_letter]
+            else:
+                # if the code is not found in dictionary, make note of this
+                new_list[i][6] += upper_case_letters + ': undefined surficial material code; '
+
+        elif num_upper_case_letters == 2:
+            # Get the two uppercase letters
+            two_letters = ''.join(upper_case_letters)
+
+            # Check if the surficial_material_terms dictionary has a value for those two letters taken together
+            if two_letters in surficial_material_terms:
+                # Add the associated value to new_first_val
+                first_val += surficial_material_terms[two_letters]
+            else:
+                # if the code is not found in dictionary, make note of this
+                new_list[i][6] = new_list[i][6] + two_letters + ': undefined surficial material code; '
+        elif num_upper_case_letters == 0:
+            new_list[i][6] = 'blank surficial material code; '
+        elif num_upper_case_letters > 2:
+            new_list[i][6] = ''.join(upper_case_letters) + ': undefined surficial material code; '
+
+        # Check is there was an Activity modifier in the code, and switch the activity status of the parsed
+        # code accordingly
+        if activity_modifier == 'A' and '(Inactive)' in first_val:
+            first_val = first_val.replace('(Inactive)', '(Active)')
+        elif activity_modifier == 'I' and '(Active)' in first_val:
+            first_val = first_val.replace('(Active)', '(Inactive)')
+        if (activity_modifier == 'A' or activity_modifier == 'I') and '(Activity status n/a)' in first_val:
+            new_list[i][6] += activity_modifier + ": Activity modifier attempting to modify a terrain type where Activity Status is n/a; "
+
+        new_list[i][0] = first_val
+
+        # if there is no terrain material identified, it cannot be continuous, so set blank
+        if first_val == '':
+            new_list[i][4] = ''
+        
+        # SURFACE EXPRESSION CODE INTERPRETATION
+        # first update str to remove any code items not in surface expression dictionary and made note
+        code_not_found = []
+        new_str = ""
+        for c in new_list[i][1]:
+            if c not in surface_expression_terms:
+                code_not_found.append(c)
+            else:
+                new_str += c
+
+        if len(code_not_found) > 0:
+            undefined_str = ' '.join([str(elem) for elem in code_not_found])
+            new_list[i][6] += undefined_str + ': undefined surface expression codes; '
+        new_list[i][1] = new_str
+        
+        # Replace the second value with the associated value in the surface_expression_terms dictionary for each character
+        new_list[i][1] = ' '.join([surface_expression_terms[c] if c in surface_expression_terms else c for c in new_list[i][1]])
+
+        # TEXTURE CODE INTERPRETATION
+        # first update str to remove any code items not in texture dictionary and made note
+        code_not_found = []
+        new_str = ""
+        for c in new_list[i][2]:
+            if c not in textural_terms:
+                code_not_found.append(c)
+            else:
+                new_str += c
+
+        if len(code_not_found) > 0:
+            undefined_str = ' '.join([str(elem) for elem in code_not_found])
+            new_list[i][6] += undefined_str + ': undefined texture codes; '
+        new_list[i][2] = new_str
+        
+        # Replace the third value in each list with the associated value in the textural_terms dictionary for each character
+        new_list[i][2] = ' '.join([textural_terms[c] if c in textural_terms else c for c in new_list[i][2]])
+
+        # GEOMORPHOLOGICAL PROCESSES CODE INTERPRATATION
+        # Replace 4th value w the associated value in the geomorphological_process_terms dictionary
+        # Initialize new_geomorph to empty string
+        new_geomorph = ''
+        undefined_str = ''
+        undefined_geomorph_process_terms = ''
+        for char in new_list[i][3]:
+            if char.isupper() and char not in geomorphological_process_terms:
+                undefined_geomorph_process_terms += char + ' '  
+        new_list[i][3] = ''.join([char for char in new_list[i][3] if char.upper() in geomorphological_process_terms])
+
+        if undefined_geomorph_process_terms:
+            new_list[i][6] += undefined_geomorph_process_terms[:-1] + ': undefined geomorphological process terms; '
+
+        # GEOMORPH SUBCLASS INTERPRETATIONS
+        # Loop through each character in new_list[i][3]
+        for char in new_list[i][3]:
+            # If character is uppercase, add the associated term from geomorphological_process_terms
+            if char.isupper():
+                new_geomorph += geomorphological_process_terms.get(char, char+'*') + ' '
+            # If character is lowercase and follows an 'F', add associated term from slow_mass_movement_F_subclass_terms
+            elif char.islower() and char.isalpha() and new_list[i][3][new_list[i][3].index(char)-1] == 'F':
+                new_geomorph += slow_mass_movement_F_subclass_terms.get(char, char+'*') + ' '
+                if slow_mass_movement_F_subclass_terms.get(char, 1) == 1:
+                    new_list[i][6] += char + ': undefined geomorphological subclass modifier for F(slow mass movements)'                                # If character is lowercase and follows an 'R', add associated term from rapid_mass_movement_R_subclass_terms
+            elif char.islower() and char.isalpha() and new_list[i][3][new_list[i][3].index(char)-1] == 'R':
+                new_geomorph += rapid_mass_movement_R_subclass_terms.get(char, char+'*') + ' '
+            # If character is lowercase and follows an 'A', add associated term from snow_avalanches_A_subclass_terms
+            elif char.islower() and char.isalpha() and new_list[i][3][new_list[i][3].index(char)-1] == 'A':
+                new_geomorph += snow_avalanches_A_subclass_terms.get(char, char+'*') + ' '
+            # If character is lowercase and follows a 'B', 'I', 'J', or 'M', add associated term from fluvial_B_I_J_M_subclass_terms
+            elif char.islower() and char.isalpha() and new_list[i][3][new_list[i][3].index(char)-1] in ['B', 'I', 'J', 'M']:
+                new_geomorph += fluvial_B_I_J_M_subclass_terms.get(char, char+'*') + ' '
+            # If character is lowercase and follows a 'X' or 'Z', add associated term from permafrost_X_Z_subclass_terms
+            elif char.islower() and char.isalpha() and new_list[i][3][new_list[i][3].index(char)-1] in ['X', 'Z']:
+                new_geomorph += permafrost_X_Z_subclass_terms.get(char, char+'*') + ' '
+
+        #update list with english geomorph terms     
+        new_list[i][3] = new_geomorph
+
+        # check the potential error string and remove the training two characters if there potential errors (string clean-up before returning)
+        if new_list[i][6][-2:] == ', ' or new_list[i][6][-2:] == '; ':
+            new_list[i][6] = new_list[i][6][:-2]
+#        print(new_list)
+    
+    error_msg = ''.join(sublist[6] for sublist in new_list if len(sublist[6]) > 0)
+    return tuple(tuple(sublist) for sublist in new_list), error_msg
+
+
+# SINGLE-PASS TOKENIZER ENGINE
+# An alternative to _interpret() that reads each terrain type left to right exactly once,
+# sorting every character into texture, surficial material, surface expression or process
+# tokens as it goes, instead of re-scanning the string once per descriptor. Selected with
+# engine='tokenizer' on Terrain and parse_many().
+#
+# Its output is identical to the legacy engine's, with two exceptions, both because the
+# legacy engine finds the process in front of a subclass letter with str.index(letter) - 1:
+#   - str.index() always returns the letter's first occurrence. When a letter repeats, the
+#     legacy engine can therefore attach a process subclass to the wrong process (e.g. the
+#     second 'c' in '-FcRc') or read a surface expression as a process subclass.
+#   - for a lowercase letter at the start of the processes, index - 1 is -1, which wraps
+#     around to the last process letter. In the Chilliwack code 'sgFGu-$sM' the 's' (once '$'
+#     is dropped) is read as the 'spring-fed backchannels' subclass of the 'M' after it.
+# The tokenizer always uses the character actually in front of the letter, and ignores
+# lowercase letters in front of the first process letter. _tokenizer_agrees() flags both
+# cases.
+
+_composite_separator = re.compile('[/=]')
+
+def _split_composite(terrain_code: str) -> list:
+    """
+    Split a code into the strings describing each terrain type, exactly as _interpret() does:
+    each '/', '//' or '=' (other than a leading '/') stays at the end of the preceding string.
+
+    >>> _split_composite('/Msa=Mw-V//Rsa')
+    ['/Msa=', 'Mw-V//', 'Rsa']
+    """
+    terrain_code_split = []
+    current_index = 0
+    for match in _composite_separator.finditer(terrain_code, 1):
+        i = match.start()
+        end = i + 2 if terrain_code[i + 1:i + 2] == '/' else i + 1
+        terrain_code_split.append(terrain_code[current_index:end])
+        current_index = end
+    if current_index != len(terrain_code):
+        terrain_code_split.append(terrain_code[current_index:])
+    return [item for item in terrain_code_split if item.strip()]
+
+def _tokenize_component(string: str) -> tuple:
+    """
+    Sort the characters of a single terrain type into code tokens in one left-to-right pass.
+    Returns (material, texture, expression, processes, undefined_processes): the uppercase
+    material letters, the texture and surface expression letters, the process letters with
+    their subclass letters, and any uppercase process letters that are not defined.
+
+    >>> _tokenize_component('sgFGt-Fe')
+    ('FG', ['s', 'g'], ['t', 'e'], ['F', 'e'], [])
+    """
+    char_flags = _char_flags
+    material = ''
+    material_closed = False   # the first run of uppercase letters has ended
+    upper_seen = False        # texture letters only come before the first uppercase letter
+    upper_found = False       # lowercase letters after an uppercase letter are surface expression
+    after_hyphen = False      # everything after the first '-' describes processes
+    texture = []
+    expression = []
+    processes = []            # process letters and their subclass letters
+    undefined_processes = []
+
+    for char in string:
+        code = ord(char)
+        flags = char_flags[code] if code < 128 else _char_class(char)
+        if flags & _UPPER:
+            upper_seen = upper_found = True
+            if after_hyphen:
+                if flags & _PROCESS:
+                    processes.append(char)
+                else:
+                    undefined_processes.append(char)
+            elif not material_closed:
+                material += char
+        else:
+            if material:
+                material_closed = True
+            if flags & _LOWER:
+                if not upper_seen:
+                    texture.append(char)
+                elif upper_found:
+                    expression.append(char)
+            elif flags & _HYPHEN:
+                upper_found = False
+                after_hyphen = True
+                material_closed = True
+            if after_hyphen and flags & _PROCESS:
+                processes.append(char)
+    return material, texture, expression, processes, undefined_processes
+
+def _split_activity_modifier(material: str) -> tuple:
+    """
+    Strips an activity modifier ('I' or 'A' after the first letter) from the material letters;
+    returns (material, activity_modifier)
+
+    >>> _split_activity_modifier('FGA')
+    ('FG', 'A')
+    """
+    if len(material) > 1:
+        if 'I' in material[1:]:
+            return material.replace('I', ''), 'I'
+        elif 'A' in material[1:]:
+            return material.replace('A', ''), 'A'
+    return material, ''
+
+def _interpret_component(string: str) -> tuple:
+    """
+    Interpret the string of a single terrain type in one left-to-right pass.
+    Returns the same eight-element tuple as _interpret().
+
+    >>> _interpret_component('sgFGt-F')
+    ('Glaciofluvial Material (Inactive)', 'terrace(s)', 'Sand Gravel', 'Slow mass movements (Active) ', 'continuous', '', '', 'sgFGt-F')
+    """
+    material, texture, expression, processes, undefined_processes = _tokenize_component(string)
+
+    # SURFICIAL MATERIAL
+    first_val, errors = _material_term(material)
+
+    # SURFACE EXPRESSION
+    second_val = ''
+    if expression:
+        terms, undefined = _translate(expression, _expression_table)
+        second_val = ' '.join(terms)
+        if undefined:
+            errors += ' '.join(undefined) + ': undefined surface expression codes; '
+
+    # TEXTURE
+    third_val = ''
+    if texture:
+        terms, undefined = _translate(texture, _texture_table)
+        third_val = ' '.join(terms)
+        if undefined:
+            errors += ' '.join(undefined) + ': undefined texture codes; '
+
+    # GEOMORPHOLOGICAL PROCESSES AND THEIR SUBCLASSES
+    if undefined_processes:
+        errors += ' '.join(undefined_processes) + ': undefined geomorphological process terms; '
+    fourth_val, process_errors = _process_terms(processes)
+    errors += process_errors
+
+    # CONTINUITY AND EXTENT RELATIVE TO NEXT TERRAIN TYPE
+    fifth_val = ''
+    if first_val:
+        fifth_val = 'discontinuous' if string[0] == '/' else 'continuous'
+    sixth_val = _coverage_term(string)
+
+    if errors[-2:] == ', ' or errors[-2:] == '; ':
+        errors = errors[:-2]
+    return (first_val, second_val, third_val, fourth_val, fifth_val, sixth_val, errors, string)
+
+def _material_term(material: str) -> tuple:
+    """
+    Interprets the surficial material letters of a terrain type, including an activity
+    modifier; returns (description, errors)
+
+    >>> _material_term('CI')
+    ('Colluvium (Inactive)', '')
+    """
+    errors = ''
+    material, activity_modifier = _split_activity_modifier(material)
+    first_val = ''
+    if 0 < len(material) <= 2:
+        if material in surficial_material_terms:
+            first_val = surficial_material_terms[material]
+        else:
+            errors += material + ': undefined surficial material code; '
+    elif not material:
+        errors += 'blank surficial material code; '
+    else:
+        errors += material + ': undefined surficial material code; '
+    if activity_modifier == 'A' and '(Inactive)' in first_val:
+        first_val = first_val.replace('(Inactive)', '(Active)')
+    elif activity_modifier == 'I' and '(Active)' in first_val:
+        first_val = first_val.replace('(Active)', '(Inactive)')
+    if activity_modifier and '(Activity status n/a)' in first_val:
+        errors += activity_modifier + ": Activity modifier attempting to modify a terrain type where Activity Status is n/a; "
+    return first_val, errors
+
+def _process_terms(processes: list) -> tuple:
+    """
+    Interprets the process tokens of a terrain type (process letters followed by their
+    subclass letters); returns (description, errors)
+    """
+    errors = ''
+    fourth_val = ''
+    char_flags = _char_flags
+    subclass_table = None
+    for char in processes:
+        code = ord(char)
+        if code < 128 and _process_table[code] is not None:
+            # a process letter (the lowercase process letters are only kept as subclasses)
+            if char_flags[code] & _UPPER:
+                fourth_val += _process_table[code] + ' '
+                subclass_table = _subclass_tables[code]
+                continue
+        if subclass_table is not None and char.islower() and char.isalpha():
+            term = subclass_table[code] if code < 128 else None
+            fourth_val += (term if term is not None else char + '*') + ' '
+            if term is None and subclass_table is _subclass_tables[ord('F')]:
+                errors += char + ': undefined geomorphological subclass modifier for F(slow mass movements)'
+        subclass_table = _subclass_tables[code] if code < 128 else None
+    return fourth_val, errors
+
+def _coverage_term(string: str) -> str:
+    """
+    Extent of a terrain type relative to the next one, from the end of its string
+    """
+    last = string[-1]
+    if last == '=':
+        return 'equal extent relative to next terrain type'
+    elif last == '/':
+        if len(string) > 1 and string[-2] == '/':
+            return 'much greater extent relative to next terrain type'
+        return 'greater extent relative to next terrain type'
+    elif last.isdigit():
+        return last
+    return ''
+
+def _translate(letters: list, table: list) -> tuple:
+    """
+    Looks up each code letter in a compiled table; returns (descriptions, undefined letters)
+    """
+    terms = []
+    undefined = []
+    for char in letters:
+        code = ord(char)
+        term = table[code] if code < 128 else None
+        if term is None:
+            undefined.append(char)
+        else:
+            terms.append(term)
+    return terms, undefined
+
+def _interpret_tokenized(terrain_code: str) -> tuple:
+    """
+    Same as _interpret(), using the single-pass tokenizer engine
+
+    >>> _interpret_tokenized('Mbv/Cv-VRAsd') == _interpret('Mbv/Cv-VRAsd')
+    True
+    >>> _interpret_tokenized('Cv-FcRc')[0][0][3]
+    'Slow mass movements (Active) soil creep Rapid mass movements (Active) c* '
+    >>> _interpret('sgFGu-$sM')[0][0][3], _interpret_tokenized('sgFGu-$sM')[0][0][3]
+    ('spring-fed backchannels Meandering channel (Active) ', 'Meandering channel (Active) ')
+    """
+    if '^' in terrain_code and _qualifier.search(terrain_code):
+        return _interpret_qualified(terrain_code, _interpret_tokenized)
+    components = tuple(_interpret_component(string) for string in _split_composite(terrain_code))
+    return components, ''.join(component[6] for component in components)
+
+# Parse engines selectable with the engine= option
+ENGINES = {
+    'legacy': _interpret,
+    'tokenizer': _interpret_tokenized,
+}
+
+
+# QUALIFIERS
+# Qualifiers are uppercase letters written as a superscript after a surficial material or a
+# geomorphological process; computer-drafted maps write each of them inline after a '^'. In
+# sgF^Gt-F^I, a glaciofluvial (F^G) terrace of sandy gravel is modified by slow mass
+# movements that are no longer active (F^I). Both engines read the '^' form the same way:
+#   - qualifiers of the surficial material are moved inline, where the material terms (FG,
+#     LG, WG) and the activity modifiers (A, I) already define them
+#   - an activity qualifier (A or I) of a process sets the activity status in the process
+#     description, e.g. 'Slow mass movements (Inactive)'
+# Letters missing from qualifier_terms, and qualifiers other than A and I after a process,
+# are reported as undefined qualifier codes.
+
+_qualifier = re.compile(r'\^([A-Z])')
+_activity_status = re.compile(r'\((?:Active|Inactive)\)')
+
+def _strip_qualifiers(string: str) -> tuple:
+    """
+    Moves the material qualifiers of the string of a terrain type inline and removes its
+    process qualifiers; returns (string, [(process letter, qualifier)], undefined letters)
+
+    >>> _strip_qualifiers('sgF^G^At-F^IR^Q')
+    ('sgFGAt-FR', [('F', 'I')], ['Q'])
+    """
+    hyphen = string.find('-')
+    stripped = ''
+    position = 0
+    process_qualifiers = []
+    undefined = []
+    for match in _qualifier.finditer(string):
+        stripped += string[position:match.start()]
+        position = match.end()
+        letter = match.group(1)
+        if hyphen < 0 or match.start() < hyphen:
+            stripped += letter
+            if letter not in qualifier_terms:
+                undefined.append(letter)
+            continue
+        process = ''
+        for char in reversed(stripped[stripped.find('-'):]):
+            if char in geomorphological_process_terms:
+                process = char
+                break
+        if process and letter in 'AI' and letter in qualifier_terms:
+            process_qualifiers.append((process, letter))
+        else:
+            undefined.append(letter)
+    return stripped + string[position:], process_qualifiers, undefined
+
+def _interpret_qualified(terrain_code: str, interpret) -> tuple:
+    """
+    Interprets a code containing '^' qualifiers with the given engine function
+
+    >>> _interpret_qualified('sgF^Gt-F^I', _interpret)[0][0]
+    ('Glaciofluvial Material (Inactive)', 'terrace(s)', 'Sand Gravel', 'Slow mass movements (Inactive) ', 'continuous', '', '', 'sgF^Gt-F^I')
+    """
+    components = []
+    for string in _split_composite(terrain_code):
+        stripped, process_qualifiers, undefined = _strip_qualifiers(string)
+        for component in interpret(stripped)[0]:
+            processes = component[3]
+            position = 0
+            for process, letter in process_qualifiers:
+                term = geomorphological_process_terms[process]
+                position = processes.find(term, position)
+                if position < 0:
+                    break
+                qualified = _activity_status.sub('(%s)' % qualifier_terms[letter], term)
+                processes = processes[:position] + qualified + processes[position + len(term):]
+                position += len(qualified)
+            errors = component[6]
+            if undefined:
+                errors += ('; ' if errors else '') + ' '.join(undefined) + ': undefined qualifier codes'
+            components.append(component[:3] + (processes,) + component[4:6] + (errors, string))
+    components = tuple(components)
+    return components, ''.join(component[6] for component in components)
+
+
+# SHARED COMPONENT RECORDS
+# Parsed terrain types are stored as immutable TerrainComponent records whose strings are
+# interned, and identical components (e.g. every plain 'Cv') are shared as one flyweight
+# record, so a few million parsed polygons hold only one copy of each description.
+
+class TerrainComponent(namedtuple('TerrainComponent', [
+        'surficial_material', 'surface_expression', 'texture', 'geomorphological_processes',
+        'extent', 'coverage_relative_to_next_terrain_type', 'unparsed_terms', 'code'])):
+    """
+    The eight descriptors of one terrain type, in the order of Terrain.parsed. Fields can be
+    read by name or by index.
+
+    >>> component = Terrain('Cv').components[0]
+    >>> component.surficial_material, component[1]
+    ('Colluvium (Active)', 'veneer')
+    """
+    __slots__ = ()
+
+_component_pool = {}
+_COMPONENT_POOL_MAXSIZE = 100000
+
+def _share(entry: tuple) -> tuple:
+    """
+    Converts an engine's (components, error_msg) pair into shared TerrainComponent records
+
+    >>> _share(_interpret('Cv'))[0][0] is _share(_interpret('Cv'))[0][0]
+    True
+    """
+    components, error_msg = entry
+    shared = []
+    for component in components:
+        record = _component_pool.get(component)
+        if record is None:
+            record = TerrainComponent._make(map(sys.intern, component))
+            if len(_component_pool) < _COMPONENT_POOL_MAXSIZE:
+                _component_pool[record] = record
+        shared.append(record)
+    return tuple(shared), sys.intern(error_msg)
+
+
+# PARSE CACHE
+# Terrain layers repeat a small vocabulary of codes, so interpreted codes are kept in a
+# process-wide, size-bounded cache shared by every Terrain instance. The least recently
+# used code is evicted once the cache is full. Entries are keyed on (code, engine) and are the
+# immutable pairs returned by the engine, so one entry serves strict and non-strict callers alike.
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_maxsize = 4096
+_cache_hits = 0
+_cache_misses = 0
+
+# Dictionaries that also receive every newly interpreted code as {(code, engine): entry}, however
+# soon the cache evicts it (see _start_recording and persistent_cache.py)
+_recorders = []
+
+def _engine(engine: str):
+    """
+    Returns the interpreting function of the named parse engine
+    """
+    try:
+        return ENGINES[engine]
+    except KeyError:
+        raise ValueError('unknown parse engine %r, expected one of %s' % (engine, ', '.join(ENGINES))) from None
+
+def _lookup(terrain_code: str, engine: str = 'legacy') -> tuple:
+    """
+    Return the (components, error_msg) pair for terrain_code, interpreting it only if it
+    is not already in the cache.
+    """
+    global _cache_hits, _cache_misses
+    key = (terrain_code, engine)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+            _cache_hits += 1
+            if _stats_enabled:
+                _stats['cache_hits'] += 1
+            return entry
+        _cache_misses += 1
+        if _stats_enabled:
+            _stats['cache_misses'] += 1
+    if _stats_enabled:
+        entry = _interpret_instrumented(terrain_code, engine)
+    else:
+        entry = _share(_engine(engine)(terrain_code))
+    _cache_put(terrain_code, engine, entry)
+    return entry
+
+def _cache_put(terrain_code: str, engine: str, entry: tuple) -> None:
+    """
+    Store an interpreted (components, error_msg) pair, evicting the least recently used code if full
+    """
+    with _cache_lock:
+        for recorded in _recorders:
+            recorded[(terrain_code, engine)] = entry
+        if _cache_maxsize != 0:
+            _cache[(terrain_code, engine)] = entry
+            if _cache_maxsize is not None and len(_cache) > _cache_maxsize:
+                _cache.popitem(last=False)
+
+def cache_info() -> CacheInfo:
+    """
+    Returns a named tuple of (hits, misses, maxsize, currsize) for the shared parse cache
+
+    >>> cache_clear()
+    >>> Terrain('Cv').json() == Terrain('Cv').json()
+    True
+    >>> cache_info()
+    CacheInfo(hits=1, misses=1, maxsize=4096, currsize=1)
+    """
+    with _cache_lock:
+        return CacheInfo(_cache_hits, _cache_misses, _cache_maxsize, len(_cache))
+
+def cache_clear() -> None:
+    """
+    Empties the shared parse cache and resets its hit/miss statistics
+    """
+    global _cache_hits, _cache_misses
+    with _cache_lock:
+        _cache.clear()
+        _projections.clear()
+        _cache_hits = 0
+        _cache_misses = 0
+
+def set_cache_maxsize(maxsize: int = 4096) -> None:
+    """
+    Sets the maximum number of distinct codes held by the shared parse cache.
+    None means unbounded and 0 disables caching. Shrinking the cache evicts the least
+    recently used codes straight away.
+
+    >>> set_cache_maxsize(2)
+    >>> for code in ('Cv', 'Mb', 'Rs'):
+    ...     _ = Terrain(code).components
+    >>> list(_cache)
+    [('Mb', 'legacy'), ('Rs', 'legacy')]
+    >>> set_cache_maxsize()
+    """
+    global _cache_maxsize
+    if maxsize is not None and maxsize < 0:
+        raise ValueError('maxsize must be None or a non-negative integer')
+    with _cache_lock:
+        _cache_maxsize = maxsize
+        if maxsize is not None:
+            while len(_cache) > maxsize:
+                _cache.popitem(last=False)
+            while len(_projections) > maxsize:
+                _projections.popitem(last=False)
+
+def _cache_entries(engine: str = 'legacy') -> list:
+    """
+    Snapshot of the cached (code, (components, error_msg)) pairs of one engine
+    """
+    with _cache_lock:
+        return [(code, entry) for (code, key_engine), entry in _cache.items() if key_engine == engine]
+
+def _cache_fill(engine: str, entries) -> int:
+    """
+    Adds (code, (components, error_msg)) pairs to the cache in bulk, up to its maximum size;
+    returns the number added
+    """
+    added = 0
+    with _cache_lock:
+        for code, entry in entries:
+            if _cache_maxsize is not None and len(_cache) >= _cache_maxsize:
+                break
+            _cache[(code, engine)] = _share(entry)
+            added += 1
+    return added
+
+def _start_recording() -> dict:
+    """
+    Returns a dictionary that receives every code interpreted from now on, as
+    {(code, engine): (components, error_msg)}, until _stop_recording() is called with it. It is
+    emptied whenever another vocabulary is installed.
+
+    >>> set_cache_maxsize(1)
+    >>> recorded = _start_recording()
+    >>> for code in ('Cv', 'Mb', 'Cv'):
+    ...     _ = Terrain(code).components
+    >>> sorted(recorded), len(_cache)
+    ([('Cv', 'legacy'), ('Mb', 'legacy')], 1)
+    >>> _stop_recording(recorded)
+    >>> set_cache_maxsize()
+    """
+    recorded = {}
+    with _cache_lock:
+        _recorders.append(recorded)
+    return recorded
+
+def _stop_recording(recorded: dict) -> None:
+    with _cache_lock:
+        if recorded in _recorders:
+            _recorders.remove(recorded)
+
+def _take_recorded(recorded: dict, engine: str = 'legacy') -> list:
+    """
+    Removes the (code, (components, error_msg)) pairs of one engine from a recording and
+    returns them
+    """
+    with _cache_lock:
+        keys = [key for key in recorded if key[1] == engine]
+        return [(key[0], recorded.pop(key)) for key in keys]
+
+# VERSION HASH
+# Parse results depend on the vocabularies and on the parsing code. version_hash() is a
+# fingerprint of both, so results stored elsewhere (see persistent_cache.py) are only reused
+# by the same parser with the same vocabularies. Increase PARSER_REVISION whenever a change
+# to the parsing code alters its output.
+
+PARSER_REVISION = 2
+
+# Names of the vocabulary dictionaries of this module
+VOCABULARIES = ('textural_terms', 'surficial_material_terms', 'surface_expression_terms',
+                'geomorphological_process_terms', 'slow_mass_movement_F_subclass_terms',
+                'rapid_mass_movement_R_subclass_terms', 'snow_avalanches_A_subclass_terms',
+                'fluvial_B_I_J_M_subclass_terms', 'permafrost_X_Z_subclass_terms',
+                'bedrock_R_subclass_terms', 'qualifier_terms')
+
+def _terms_hash(terms: dict) -> str:
+    """
+    Short hex digest of PARSER_REVISION and the vocabulary dictionaries in terms (a mapping
+    of the names in VOCABULARIES to dictionaries)
+    """
+    data = json.dumps([PARSER_REVISION] + [[name, list(terms[name].items())] for name in VOCABULARIES])
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+def version_hash() -> str:
+    """
+    Returns a short hex digest of PARSER_REVISION and the current contents of VOCABULARIES
+
+    >>> len(version_hash())
+    16
+    """
+    return _terms_hash(globals())
+
+# Process pool initializer (and its arguments) that gives parallel parse_many() workers the
+# installed vocabulary; None while the built-in vocabulary is in use
+_worker_init = None
+
+def _install_vocabulary(terms: dict, tables: dict = None, worker_init: tuple = None) -> None:
+    """
+    Replaces the contents of the vocabulary dictionaries with those of terms, installs their
+    compiled tables (built here if not given) and clears the parse cache and every recording
+    (see _start_recording). The dictionaries are updated in place, so modules that imported
+    them see the new terms. Not safe to call while other threads are parsing.
+    """
+    global _worker_init
+    if tables is None:
+        tables = _build_tables(terms)
+    module = globals()
+    for name in VOCABULARIES:
+        vocabulary = module[name]
+        if vocabulary is not terms[name]:
+            vocabulary.clear()
+            vocabulary.update(terms[name])
+    module.update((name, tables[name]) for name in TABLES)
+    _worker_init = worker_init
+    _component_pool.clear()
+    cache_clear()
+    with _cache_lock:
+        for recorded in _recorders:
+            recorded.clear()
+
+# FIELD-LEVEL DECODING
+# Jobs that need a single descriptor (say, only the surficial material) do not have to pay for
+# a full interpretation. The requested fields are decoded from one tokenization by the
+# single-pass tokenizer, skipping the translation of every other descriptor and the error
+# messages; codes already in the parse cache are served from it, and the decoded fields are
+# kept in a cache of their own, as large as the parse cache and cleared with it. Unparsed
+# terms are not reported here.
+#
+# For the legacy engine the tokenizer's fields are used only where both engines agree: a
+# terrain type that repeats a lowercase letter, or whose processes start with a lowercase
+# letter, falls back to the full legacy interpretation (see the SINGLE-PASS TOKENIZER ENGINE).
+# Codes with '^' qualifiers always take the full interpretation.
+
+# Descriptors that can be decoded on their own, by TerrainComponent field name
+FIELDS = tuple(name for name in TerrainComponent._fields if name != 'unparsed_terms')
+
+def _check_fields(fields) -> tuple:
+    if isinstance(fields, str):
+        fields = (fields,)
+    fields = tuple(fields)
+    for field in fields:
+        if field not in FIELDS:
+            raise ValueError('unknown field %r, expected one of %s' % (field, ', '.join(FIELDS)))
+    return fields
+
+def _tokenizer_agrees(string: str) -> bool:
+    """
+    True if the legacy engine is known to interpret the string of a terrain type exactly as
+    the tokenizer does: no lowercase letter repeats and the processes do not start with a
+    lowercase letter (see SINGLE-PASS TOKENIZER ENGINE)
+
+    >>> _tokenizer_agrees('Cv-Rd'), _tokenizer_agrees('Cv-FcRc'), _tokenizer_agrees('sgFGu-$sM')
+    (True, False, False)
+    """
+    lowercase = [char for char in string if char.islower()]
+    if len(set(lowercase)) != len(lowercase):
+        return False
+    hyphen = string.find('-')
+    if hyphen >= 0:
+        for char in string[hyphen:]:
+            if char.upper() in geomorphological_process_terms:
+                return not char.islower()
+    return True
+
+def _decode_component(string: str, fields: tuple) -> tuple:
+    """
+    Decodes the requested descriptors (names from FIELDS) of the string of a single terrain
+    type, tokenizing it once
+
+    >>> _decode_component('sgFGt-F', ('texture', 'extent'))
+    ('Sand Gravel', 'continuous')
+    >>> _decode_component('/Cv=', ('extent', 'coverage_relative_to_next_terrain_type'))
+    ('discontinuous', 'equal extent relative to next terrain type')
+    """
+    tokens = None
+    first_val = None
+    values = []
+    for field in fields:
+        if field == 'code':
+            values.append(string)
+            continue
+        if field == 'coverage_relative_to_next_terrain_type':
+            values.append(_coverage_term(string))
+            continue
+        if tokens is None:
+            tokens = _tokenize_component(string)
+        if field == 'surface_expression':
+            values.append(' '.join(_translate(tokens[2], _expression_table)[0]))
+        elif field == 'texture':
+            values.append(' '.join(_translate(tokens[1], _texture_table)[0]))
+        elif field == 'geomorphological_processes':
+            values.append(_process_terms(tokens[3])[0])
+        else:
+            if first_val is None:
+                first_val = _material_term(tokens[0])[0]
+            if field == 'surficial_material':
+                values.append(first_val)
+            else:
+                values.append(('discontinuous' if string[0] == '/' else 'continuous') if first_val else '')
+    return tuple(values)
+
+# Decoded fields by (code, engine, fields), bounded like the parse cache and cleared with it
+_projections = OrderedDict()
+
+def _decode_fields(terrain_code: str, fields: tuple, engine: str = 'legacy') -> tuple:
+    """
+    Returns, for each terrain type of terrain_code, a tuple of the requested fields
+
+    >>> _decode_fields('Rs/Cv-A', ('surficial_material', 'geomorphological_processes'))
+    (('Bedrock (Activity status n/a)', ''), ('Colluvium (Active)', 'Snow avalanches (Active) '))
+    """
+    tokenized = _engine(engine) is _interpret_tokenized
+    key = (terrain_code, engine, fields)
+    with _cache_lock:
+        decoded = _projections.get(key)
+        if decoded is not None:
+            _projections.move_to_end(key)
+            return decoded
+        entry = _cache.get((terrain_code, engine))
+    if entry is None:
+        strings = _split_composite(terrain_code)
+        if '^' not in terrain_code and (tokenized or all(map(_tokenizer_agrees, strings))):
+            decoded = tuple(_decode_component(string, fields) for string in strings)
+        else:
+            entry = _lookup(terrain_code, engine)
+    if entry is not None:
+        decoded = tuple(tuple(getattr(component, field) for field in fields) for component in entry[0])
+    if _cache_maxsize != 0:
+        with _cache_lock:
+            _projections[key] = decoded
+            if _cache_maxsize is not None and len(_projections) > _cache_maxsize:
+                _projections.popitem(last=False)
+    return decoded
+
+
+# VALIDATION
+# QA sweeps over large layers only need to know whether codes are valid and what is wrong
+# with the ones that are not. is_valid(), validate() and validate_many() check the code letters
+# against the vocabularies without building any description or error message and return
+# structured TerrainError records instead of raising. As with field-level decoding, the legacy
+# engine only takes this path where it agrees with the tokenizer.
+
+TerrainError = namedtuple('TerrainError', ['component', 'category', 'chars'])
+TerrainError.__doc__ = """
+An unparsed term: the index of the terrain type, the category ('surficial material',
+'blank surficial material', 'activity modifier', 'surface expression', 'texture',
+'geomorphological process', 'geomorphological subclass' or 'qualifier') and the offending
+characters
+"""
+
+ParseResult = namedtuple('ParseResult', ['components', 'errors'])
+ParseResult.__doc__ = """
+Non-raising parse result: the TerrainComponent records of every terrain type (including those
+with unparsed terms) and a tuple of TerrainError records, empty if the code is valid
+"""
+
+# '<letters>: undefined <category> ...' in the error messages of both engines
+_undefined_terms = re.compile(r'([^\s:;)]+(?: [^\s:;)])*): undefined (surficial material|surface expression|texture|'
+                              r'geomorphological process|geomorphological subclass|qualifier)')
+
+def _component_errors(i: int, string: str) -> list:
+    """
+    TerrainError records of the string of the i-th terrain type, from its tokens
+
+    >>> _component_errors(0, 'oNTA')
+    [TerrainError(component=0, category='surficial material', chars='NT'), TerrainError(component=0, category='texture', chars='o')]
+    """
+    material, texture, expression, processes, undefined_processes = _tokenize_component(string)
+    errors = []
+    material, activity_modifier = _split_activity_modifier(material)
+    if not material:
+        errors.append(TerrainError(i, 'blank surficial material', ''))
+    elif len(material) > 2 or material not in surficial_material_terms:
+        errors.append(TerrainError(i, 'surficial material', material))
+    elif activity_modifier and '(Activity status n/a)' in surficial_material_terms[material]:
+        errors.append(TerrainError(i, 'activity modifier', activity_modifier))
+    undefined = _translate(expression, _expression_table)[1]
+    if undefined:
+        errors.append(TerrainError(i, 'surface expression', ''.join(undefined)))
+    undefined = _translate(texture, _texture_table)[1]
+    if undefined:
+        errors.append(TerrainError(i, 'texture', ''.join(undefined)))
+    if undefined_processes:
+        errors.append(TerrainError(i, 'geomorphological process', ''.join(undefined_processes)))
+    # only the slow mass movement (F) subclasses are checked, as in interpretation
+    undefined = ''
+    subclass_table = None
+    for char in processes:
+        code = ord(char)
+        if code < 128 and _process_table[code] is not None and _char_flags[code] & _UPPER:
+            subclass_table = _subclass_tables[code]
+            continue
+        if (subclass_table is _subclass_tables[ord('F')] and char.islower() and char.isalpha()
+                and (code >= 128 or subclass_table[code] is None)):
+            undefined += char
+        subclass_table = _subclass_tables[code] if code < 128 else None
+    if undefined:
+        errors.append(TerrainError(i, 'geomorphological subclass', undefined))
+    return errors
+
+def _message_errors(i: int, message: str) -> list:
+    """
+    TerrainError records of the i-th terrain type, read back from its unparsed_terms message
+    """
+    errors = []
+    if message.startswith('blank surficial material code'):
+        errors.append(TerrainError(i, 'blank surficial material', ''))
+    modifier = message.find(': Activity modifier attempting')
+    if modifier > 0:
+        errors.append(TerrainError(i, 'activity modifier', message[modifier - 1]))
+    subclasses = ''
+    for letters, category in _undefined_terms.findall(message):
+        if category == 'geomorphological subclass':
+            subclasses += letters
+        else:
+            errors.append(TerrainError(i, category, letters.replace(' ', '')))
+    if subclasses:
+        errors.append(TerrainError(i, 'geomorphological subclass', subclasses))
+    return errors
+
+def validate(terrain_code: str, engine: str = 'legacy') -> tuple:
+    """
+    Returns the unparsed terms of a terrain code as a tuple of TerrainError records (empty
+    if the code is valid), without interpreting it
+
+    >>> validate('Cv/oNTA-Q')
+    (TerrainError(component=1, category='surficial material', chars='NT'), TerrainError(component=1, category='texture', chars='o'), TerrainError(component=1, category='geomorphological process', chars='Q'))
+    """
+    tokenized = _engine(engine) is _interpret_tokenized
+    with _cache_lock:
+        entry = _cache.get((terrain_code, engine))
+    if entry is None:
+        strings = _split_composite(terrain_code)
+        if '^' not in terrain_code and (tokenized or all(map(_tokenizer_agrees, strings))):
+            errors = []
+            for i, string in enumerate(strings):
+                errors.extend(_component_errors(i, string))
+            return tuple(errors)
+        entry = _lookup(terrain_code, engine)
+    return _entry_errors(entry)
+
+def _entry_errors(entry: tuple) -> tuple:
+    components, error_msg = entry
+    if not error_msg:
+        return ()
+    errors = []
+    for i, component in enumerate(components):
+        if component[6]:
+            errors.extend(_message_errors(i, component[6]))
+    return tuple(errors)
+
+def is_valid(terrain_code: str, engine: str = 'legacy') -> bool:
+    """
+    True if every term of the terrain code is defined, i.e. Terrain(terrain_code).parsed
+    would not raise
+
+    >>> is_valid('Rs/Cv-A'), is_valid('oNTA')
+    (True, False)
+    """
+    return not validate(terrain_code, engine)
+
+def validate_many(terrain_codes, engine: str = 'legacy', return_inverse: bool = False) -> list:
+    """
+    validate() for a whole column of codes, checking each distinct code once. Rows with the
+    same code share the same tuple; return_inverse works as in parse_many().
+
+    >>> validate_many(['Cv', 'Cv-Q', 'Cv'])
+    [(), (TerrainError(component=0, category='geomorphological process', chars='Q'),), ()]
+    """
+    index_of, inverse = _index_unique(terrain_codes)
+    _engine(engine)
+    unique_results = [validate(code, engine) for code in index_of]
+    if return_inverse:
+        return unique_results, inverse
+    return [unique_results[position] for position in inverse]
+
+# INSTRUMENTATION
+# Opt-in counters and per-stage timers showing where parsing time goes. Switch them on with
+# set_stats(True), read them with stats() and start over with stats_reset(). While disabled
+# (the default) the parse paths only test a single module flag, so the calls can stay in
+# production code. Only codes that are actually interpreted are timed; cache hits are counted.
+#
+# Stages timed per interpreted code:
+#   'split'      splitting a composite code into terrain types (tokenizer engine only, the
+#                legacy engine splits as part of its interpretation)
+#   'interpret'  extracting the code letters and translating them, including error messages
+#   'share'      interning the result into shared TerrainComponent records
+
+_STAGES = ('split', 'interpret', 'share')
+
+_stats_enabled = False
+_stats_callback = None
+_stats_lock = threading.Lock()
+
+def _new_stats() -> dict:
+    return dict(codes_parsed=0, components=0, codes_with_errors=0, unknown_terms={},
+                strict_raises=0, cache_hits=0, cache_misses=0, seconds=dict.fromkeys(_STAGES, 0.0))
+
+_stats = _new_stats()
+
+def _unknown_terms(error_msg: str) -> dict:
+    """
+    Counts the undefined code letters in an error message by category
+
+    >>> _unknown_terms(_interpret('oNTA')[1])
+    {'surficial material': 1, 'texture': 1}
+    """
+    counts = {}
+    for letters, category in _undefined_terms.findall(error_msg):
+        counts[category] = counts.get(category, 0) + len(letters.split())
+    blank = error_msg.count('blank surficial material code')
+    if blank:
+        counts['blank surficial material'] = blank
+    modifiers = error_msg.count('Activity modifier attempting')
+    if modifiers:
+        counts['activity modifier'] = modifiers
+    return counts
+
+def _record(terrain_code: str, engine: str, entry: tuple, seconds: dict = None) -> None:
+    """
+    Adds one interpreted code to the statistics and passes it on to the stats callback
+    """
+    components, error_msg = entry
+    unknown = _unknown_terms(error_msg) if error_msg else {}
+    with _stats_lock:
+        _stats['codes_parsed'] += 1
+        _stats['components'] += len(components)
+        if error_msg:
+            _stats['codes_with_errors'] += 1
+            totals = _stats['unknown_terms']
+            for category, count in unknown.items():
+                totals[category] = totals.get(category, 0) + count
+        if seconds:
+            totals = _stats['seconds']
+            for stage, elapsed in seconds.items():
+                totals[stage] += elapsed
+        callback = _stats_callback
+    if callback is not None:
+        callback(dict(code=terrain_code, engine=engine, components=len(components),
+                      unknown_terms=unknown, seconds=seconds or {}))
+
+def _record_strict_raise() -> None:
+    with _stats_lock:
+        _stats['strict_raises'] += 1
+
+def _interpret_instrumented(terrain_code: str, engine: str) -> tuple:
+    """
+    Same as _share(_engine(engine)(terrain_code)), timing every stage
+    """
+    interpret = _engine(engine)
+    clock = time.perf_counter
+    start = clock()
+    if interpret is _interpret_tokenized and '^' not in terrain_code:
+        # the tokenizer engine spelled out, so its splitting can be timed separately
+        strings = _split_composite(terrain_code)
+        split = clock()
+        components = tuple(_interpret_component(string) for string in strings)
+        entry = components, ''.join(component[6] for component in components)
+    else:
+        split = start
+        entry = interpret(terrain_code)
+    interpreted = clock()
+    entry = _share(entry)
+    shared = clock()
+    _record(terrain_code, engine, entry,
+            dict(split=split - start, interpret=interpreted - split, share=shared - interpreted))
+    return entry
+
+def set_stats(enabled: bool = True, callback=None) -> None:
+    """
+    Switches the parser statistics on or off. callback, if given, is called with a dict
+    (code, engine, components, unknown_terms, seconds) for every code interpreted while the
+    statistics are on, e.g. to push metrics to a monitoring system.
+    """
+    global _stats_enabled, _stats_callback
+    with _stats_lock:
+        _stats_enabled = bool(enabled)
+        _stats_callback = callback if enabled else None
+
+def stats() -> dict:
+    """
+    Returns a snapshot of the parser statistics gathered since the last stats_reset()
+
+    >>> set_stats(True); stats_reset(); cache_clear()
+    >>> Terrain('Cv').json() == Terrain('Cv').json()
+    True
+    >>> Terrain('oNTA/Cv', strictmode=1).parsed
+    Traceback (most recent call last):
+     ...
+    ValueError: NT: undefined surficial material code; o: undefined texture codes
+    >>> snapshot = stats()
+    >>> snapshot['codes_parsed'], snapshot['components'], snapshot['cache_hits'], snapshot['strict_raises']
+    (2, 3, 1, 1)
+    >>> snapshot['unknown_terms']
+    {'surficial material': 1, 'texture': 1}
+    >>> sorted(snapshot['seconds'])
+    ['interpret', 'share', 'split']
+    >>> set_stats(False)
+    """
+    with _stats_lock:
+        snapshot = dict(_stats, unknown_terms=dict(_stats['unknown_terms']), seconds=dict(_stats['seconds']))
+        snapshot['enabled'] = _stats_enabled
+    return snapshot
+
+def stats_reset() -> None:
+    """
+    Sets all parser statistics back to zero
+    """
+    global _stats
+    with _stats_lock:
+        _stats = _new_stats()
+
+# CANONICAL CODES
+# Mappers type the same code with stray whitespace ('Cv / Mb', 'Cv/Mb ', 'Mb- V').
+# canonicalize() removes the whitespace that neither engine reads, so that such variants share
+# cache entries and deduplicate in batch work (parse_many(canonical=True)):
+#
+#   - whitespace at the end of the code
+#   - whitespace at the start of the code, unless it precedes '/' or '=' (' /Mb' describes an
+#     empty terrain type followed by Mb)
+#   - whitespace between '-', '/' or '=' and a letter (but not between two of them: 'Cv/ /Mb'
+#     is not 'Cv//Mb')
+#
+# Nothing else is rewritten. Letters are never reordered or dropped: the engines read only the
+# first subclass letter after a process ('Cv-Rdb' is debris flow, 'Cv-Rbd' rockfall), and the
+# order of texture, expression and process letters is the order of their descriptions
+# ('Mvb' is 'veneer blanket', 'Mbv' 'blanket veneer'). Whitespace inside a run of letters is
+# kept as well, as it splits the run ('gF Gs' is not 'gFGs').
+
+_canonical_space = re.compile(r'\A\s+(?=[^\s/=])|(?<=[^\s/=])\s+(?=[-/=])|(?<=[-/=])\s+(?=[^\s/=])|\s+\Z')
+
+def canonicalize(terrain_code: str) -> str:
+    """
+    Returns the canonical spelling of a terrain code (see CANONICAL CODES)
+
+    >>> canonicalize(' Cv / Mb- V ') == canonicalize('Cv/Mb-V') == 'Cv/Mb-V'
+    True
+    >>> canonicalize('Cv-Rdb'), canonicalize('Mvb'), canonicalize(' /Mb')
+    ('Cv-Rdb', 'Mvb', ' /Mb')
+    """
+    return _canonical_space.sub('', terrain_code)
+
+def _respell(result: tuple, terrain_code: str, fields: tuple = None) -> tuple:
+    """
+    Returns the parse_many result of a canonical code with the code fields of its terrain
+    types set to the strings of terrain_code, a spelling of the same code
+    """
+    if result is None:
+        return None
+    strings = _split_composite(terrain_code)
+    if fields is None:
+        if all(component.code == string for component, string in zip(result, strings)):
+            return result
+        return tuple(component._replace(code=string) for component, string in zip(result, strings))
+    if 'code' not in fields:
+        return result
+    position = fields.index('code')
+    return tuple(values[:position] + (string,) + values[position + 1:] for values, string in zip(result, strings))
+
+def canonical_variants(terrain_codes) -> dict:
+    """
+    Groups the codes of a column by canonical code: returns {canonical code: {raw code: rows}}
+
+    >>> canonical_variants(['Cv/Mb', 'Cv / Mb', 'Cv/Mb', 'Mvb'])
+    {'Cv/Mb': {'Cv/Mb': 2, 'Cv / Mb': 1}, 'Mvb': {'Mvb': 1}}
+    """
+    index_of, inverse = _index_unique(terrain_codes)
+    rows = [0] * len(index_of)
+    for position in inverse:
+        rows[position] += 1
+    variants = {}
+    for code, count in zip(index_of, rows):
+        variants.setdefault(canonicalize(code), {})[code] = count
+    return variants
+
+# PARALLEL BATCH PARSING
+# parse_many(workers=N) sends distinct, uncached codes to a process pool only when there are
+# at least parallel_min_codes of them (PARALLEL_MIN_CODES by default).
+#
+# 'python -m bctcs_terrain_parser.benchmark --crossover WORKERS' measures the threshold: it
+# times parse_many() on 1000 to 50000 distinct synthetic codes in this process and in a warm
+# pool, taking the median of five cold-cache runs of each, and reports the smallest number of
+# codes from which the pool stays faster. On the single-CPU host used for development (Python
+# 3.11, Linux) there is no crossover with 2 or 4 workers: interpreting costs about 17
+# microseconds per code and the pool adds about 6 (sending the code, pickling the result,
+# decoding it here) at every size, so the pool is about 35% slower up to 50000 codes. The
+# default of 5000 therefore is not a measured crossover, only a batch size below which the
+# pool can win back little even with several CPUs; run --crossover on the production host
+# and pass its result as parallel_min_codes.
+#
+# The pool is started by the first parallel call and kept for later ones with the same number
+# of workers, so only that call pays for starting the worker processes. vocabulary.use() and
+# shutdown_workers() stop it.
+PARALLEL_MIN_CODES = 5000
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+def _process_pool(workers: int):
+    """
+    Returns the shared process pool with the given number of workers, starting it if needed
+    """
+    global _pool, _pool_workers
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            initializer, initargs = _worker_init or (None, ())
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+            _pool_workers = workers
+        return _pool
+
+def start_workers(workers: int) -> None:
+    """
+    Starts the worker processes used by parallel parse_many() calls ahead of the first one,
+    e.g. when a long-running service starts
+    """
+    _process_pool(workers).submit(_interpret_chunk, []).result()
+
+def shutdown_workers() -> None:
+    """
+    Stops the worker processes kept for parallel parse_many() calls; the next such call
+    starts them again
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        pool, _pool, _pool_workers = _pool, None, None
+    if pool is not None:
+        pool.shutdown()
+
+def _interpret_chunk(terrain_codes: list, engine: str = 'legacy') -> tuple:
+    """
+    Worker side of parallel parse_many(). Interprets a chunk of codes and returns them in a
+    compact, string-table encoded form so that little has to be pickled back: a pair
+    (strings, encoded) where every entry of encoded is a flat tuple of indices into
+    strings - the error message first, then eight indices per component.
+
+    >>> _decode_chunk(*_interpret_chunk(['Cv', 'Cv=Mb'])) == [_interpret('Cv'), _interpret('Cv=Mb')]
+    True
+    """
+    strings = {}
+    encoded = []
+    interpret = _engine(engine)
+    for code in terrain_codes:
+        components, error_msg = interpret(code)
+        flat = [strings.setdefault(error_msg, len(strings))]
+        for component in components:
+            for value in component:
+                flat.append(strings.setdefault(value, len(strings)))
+        encoded.append(tuple(flat))
+    return list(strings), encoded
+
+def _decode_chunk(strings: list, encoded: list) -> list:
+    """
+    Turns the output of _interpret_chunk() back into (components, error_msg) pairs
+    """
+    entries = []
+    for flat in encoded:
+        components = tuple(tuple(strings[i] for i in flat[k:k + 8]) for k in range(1, len(flat), 8))
+        entries.append((components, strings[flat[0]]))
+    return entries
+
+def _interpret_parallel(terrain_codes: list, workers: int, chunksize: int, engine: str = 'legacy') -> list:
+    """
+    Interprets terrain_codes in the shared process pool, chunksize codes per task, in input order
+    """
+    from concurrent.futures.process import BrokenProcessPool
+
+    chunks = [terrain_codes[i:i + chunksize] for i in range(0, len(terrain_codes), chunksize)]
+    entries = []
+    try:
+        for strings, encoded in _process_pool(workers).map(_interpret_chunk, chunks, [engine] * len(chunks)):
+            entries.extend(_decode_chunk(strings, encoded))
+    except BrokenProcessPool:
+        # a worker died; start a new pool next time
+        shutdown_workers()
+        raise
+    return entries
+
+def _index_unique(terrain_codes) -> tuple:
+    """
+    Returns (index_of, inverse): the position of every distinct code in order of first
+    appearance, and the position of each input code
+    """
+    index_of = {}
+    inverse = []
+    for code in terrain_codes:
+        position = index_of.get(code)
+        if position is None:
+            position = index_of[code] = len(index_of)
+        inverse.append(position)
+    return index_of, inverse
+
+def _parse_unique(terrain_codes, engine: str = 'legacy', workers: int = None,
+                  chunksize: int = 2000, parallel_min_codes: int = None) -> tuple:
+    """
+    Deduplicates terrain_codes and interprets each distinct code once (see parse_many).
+    Returns (unique_codes, entries, inverse) where entries[i] is the (components, error_msg)
+    pair of unique_codes[i] and unique_codes[inverse[j]] is the j-th input code.
+    """
+    index_of, inverse = _index_unique(terrain_codes)
+    _engine(engine)
+    parsed = {}
+    if workers is not None and workers > 1:
+        with _cache_lock:
+            uncached = [code for code in index_of if (code, engine) not in _cache]
+        if parallel_min_codes is None:
+            parallel_min_codes = PARALLEL_MIN_CODES
+        if len(uncached) >= max(parallel_min_codes, 1):
+            start = time.perf_counter()
+            results = _interpret_parallel(uncached, workers, max(chunksize, 1), engine)
+            elapsed = time.perf_counter() - start
+            for code, entry in zip(uncached, results):
+                parsed[code] = entry = _share(entry)
+                _cache_put(code, engine, entry)
+                if _stats_enabled:
+                    _record(code, engine, entry)
+            if _stats_enabled:
+                with _stats_lock:
+                    _stats['seconds']['interpret'] += elapsed
+
+    unique_codes = list(index_of)
+    entries = [parsed.get(code) or _lookup(code, engine) for code in unique_codes]
+    return unique_codes, entries, inverse
+
+def parse_many(terrain_codes, strictmode: int = 0, return_inverse: bool = False,
+               workers: int = None, chunksize: int = 2000, engine: str = 'legacy', fields=None,
+               canonical: bool = False, parallel_min_codes: int = None):
+    """
+    Parse a whole column of terrain codes, interpreting each distinct code only once.
+
+    Each result is the immutable form of Terrain.parsed: a tuple of TerrainComponent records.
+    Rows with the same code share the same result object, and no Terrain objects are created.
+    Codes with unparsed terms raise a ValueError when strictmode is 1; otherwise their result is None.
+
+    :param terrain_codes : iterable of str
+        BC Terrain Classification Strings, e.g. one attribute table column
+
+    :param strictmode : int
+        Boolean indicating strict mode on/off
+
+    :param return_inverse : bool
+        If True, return (unique_results, inverse_index) in the style of numpy.unique, where
+        unique_results[inverse_index[i]] is the result for the i-th input code
+
+    :param workers : int
+        Number of worker processes. Distinct codes that are not already cached are sent to a
+        process pool in chunks of chunksize codes when workers > 1 and there are at least
+        parallel_min_codes of them; otherwise everything is parsed in this process. The pool
+        is kept for later calls (see shutdown_workers)
+
+    :param chunksize : int
+        Number of distinct codes per task sent to a worker process
+
+    :param engine : str
+        Parse engine, 'legacy' or the faster single-pass 'tokenizer' (see ENGINES)
+
+    :param fields : str or sequence of str
+        Decode only these descriptors (names from FIELDS). Each result is then a tuple with,
+        for every terrain type, a tuple of the requested values. Codes are not checked for
+        unparsed terms, so strictmode must be 0, and everything is decoded in this process.
+
+    :param canonical : bool
+        Interpret the canonical form of every code (see canonicalize), so that variants such
+        as 'Cv/Mb' and 'Cv / Mb' are interpreted and cached once. Every distinct raw code still
+        gets its own result, whose code fields are the caller's spelling; canonical_variants()
+        reports which raw codes share a canonical code.
+
+    :param parallel_min_codes : int
+        Smallest number of distinct, uncached codes sent to worker processes; defaults to
+        PARALLEL_MIN_CODES (see PARALLEL BATCH PARSING)
+
+    >>> results = parse_many(['Cv', 'Rs/Cv-A', 'Cv'])
+    >>> results[0] is results[2]
+    True
+    >>> results[0][0].surficial_material
+    'Colluvium (Active)'
+    >>> unique_results, inverse = parse_many(['Cv', 'oNTA', 'Cv'], return_inverse=True)
+    >>> len(unique_results), inverse
+    (2, [0, 1, 0])
+    >>> unique_results[1] is None
+    True
+    >>> parse_many(['Rs/Cv-A', 'oNTA'], fields='surficial_material')
+    [(('Bedrock (Activity status n/a)',), ('Colluvium (Active)',)), (('',),)]
+    >>> unique_results, inverse = parse_many(['Cv/Mb', 'Cv / Mb', 'Cv/Mb'], canonical=True, return_inverse=True)
+    >>> inverse, [component.code for component in unique_results[1]]
+    ([0, 1, 0], ['Cv /', ' Mb'])
+    >>> parse_many(['Cv-Rdb'], canonical=True) == parse_many(['Cv-Rdb'])
+    True
+    """
+    if canonical:
+        raw_of, inverse = _index_unique(terrain_codes)
+        terrain_codes = [canonicalize(code) for code in raw_of]
+
+    if fields is not None:
+        fields = _check_fields(fields)
+        if strictmode == 1:
+            raise ValueError('unparsed terms are not checked when fields are given, strictmode must be 0')
+        index_of, unique_inverse = _index_unique(terrain_codes)
+        unique_results = [_decode_fields(code, fields, engine) for code in index_of]
+    else:
+        unique_codes, entries, unique_inverse = _parse_unique(terrain_codes, engine, workers, chunksize,
+                                                              parallel_min_codes)
+        unique_results = []
+        for components, error_msg in entries:
+            if error_msg:
+                if strictmode == 1:
+                    if _stats_enabled:
+                        _record_strict_raise()
+                    raise ValueError(error_msg)
+                components = None
+            unique_results.append(components)
+
+    if canonical:
+        unique_results = [_respell(unique_results[position], code, fields)
+                          for code, position in zip(raw_of, unique_inverse)]
+    else:
+        inverse = unique_inverse
+    if return_inverse:
+        return unique_results, inverse
+    return [unique_results[position] for position in inverse]
+
+def _json_group(group: tuple) -> dict:
+    """
+    The dictionary describing one terrain type in Terrain.json()
+    """
+    return dict(surficial_material = group[0],
+                surface_expression =group[1] if group[1] else None,
+                texture = group[2] if group[2] else None,
+                geomorphological_processes = group[3] if group[3] else None,
+                extent = group[4] if group[4] else None,
+                coverage_relative_to_next_terrain_type = group[5] if group[5] else None)
+
 class Terrain:
     """
     British Columbia Terrain Classification System (1997) parser
     """
-    def __init__(self, instr:str, strictmode:int=0)->None:
+    def __init__(self, instr:str, strictmode:int=0, engine:str='legacy')->None:
         '''
         instr : str
             British Columbia Terrain System classification string
 
         strictmode : int
             Boolean indicating strict mode on/off
+
+        engine : str
+            Parse engine, 'legacy' or the faster single-pass 'tokenizer' (see ENGINES)
         '''
         self.instr = instr
         self.strictmode = strictmode
+        self.engine = engine
+        # lazily filled in by _components
+        self._parsed_key = _UNPARSED
+        self._result = None
+        self._error = None
 
     @property
-    def parsed(self, terrain_code : str = None, strictmode: int = 1) -> list :
+    def parsed(self) -> list :
         """
         Given a terrain code, returns a list of lists. Each element contains eight sub elements representing
         ['Surficial Material', 'Surface Expression', 'Texture', 
         'Geomorphological Proccess(es)', 'Extent', 'Coverage Relative to next Terrain Type',
         'Unparsed Terms', 'BCTCS code fragment that was parsed'] 
-        
-        :param terrain_code : str
-            BC Terrain Classification String
-        
-        param strictmode : int
-            Boolean indicating strict mode on/off
+
+        The code is only interpreted the first time it is needed; every later call (and
+        len/[]/str/json/min/max) is served from the stored result. A ValueError raised for
+        unparsed terms is stored too and raised again without re-parsing.
         
         >>> Terrain('Mbv').parsed
         [['Morainal Material(Till) (Inactive)', 'blanket veneer', '', '', 'continuous', '', '', 'Mbv']]
@@ -334,325 +2058,128 @@ class Terrain:
         [['Morainal Material(Till) (Inactive)', 'blanket veneer', '', '', 'continuous', 'greater extent relative to next terrain type', '', 'Mbv/'], ['Colluvium (Active)', 'veneer steep slope depression(s)', '', 'Gully erosion (Active) Rapid mass movements (Active) Snow avalanches (Active) s* ', 'continuous', '', '', 'Cv-VRAsd']]
         
         """
-        #This is just the BCTCSParse function
-        if not terrain_code:
-            terrain_code = self.instr
-       
-        if not strictmode:
-            strictmode = self.strictmode
+        return [list(component) for component in self._components]
 
-        # initialize an empty list called terrain_code_split
-        terrain_code_split = []
+    @property
+    def components(self) -> tuple:
+        """
+        Same as parsed, but as a tuple of immutable, shared TerrainComponent records instead
+        of freshly built lists, which is much lighter when many codes are kept in memory.
 
-        # initialize a variable called current_index and set its value to 0
-        current_index = 0
-        
-        # SPLIT THE CODE WHEN MULTIPLE TERRAIN TYPES ARE CONTAINED IN A CODE
-        # This occurs when code contains '/' '//' or '=' chars (except for
-        # position 0 where '/' indicates discontinuity) loop through the indices of terrain_code
-        for i in range(len(terrain_code)):
-            # if the current character is "/" or "=" and not the first character of terrain_code
-            if terrain_code[i] in ["/", "="] and i != 0:
-                #check for "double //" and perform that case, or single case if not double '//'
-                if i < len(terrain_code) - 1 and terrain_code[i+1] == '/':
-                    terrain_code_split.append(terrain_code[current_index:i+2])
-                    current_index = i + 2
-                else:
-                    # split the string at the current index and append it to terrain_code_split
-                    terrain_code_split.append(terrain_code[current_index:i+1])
-                    # update current_index to be the index after the current split character
-                    current_index = i + 1
+        >>> Terrain('Rha/aCk').components[1].texture
+        'Blocks'
+        """
+        return self._components
 
-        # if there are characters remaining in terrain_code, append them to terrain_code_split
-        if current_index != len(terrain_code):
-            terrain_code_split.append(terrain_code[current_index:])
+    @property
+    def result(self) -> ParseResult:
+        """
+        Non-raising alternative to parsed: a ParseResult holding the TerrainComponent records
+        of every terrain type, even when some terms are undefined, and the TerrainError
+        records of those terms
 
-        # strip any blank entries before moving on
-        terrain_code_split = [item for item in terrain_code_split if item.strip()]
-        
-        ###END SPLITTING SECTION
+        >>> result = Terrain('Cv/oNTA').result
+        >>> result.components[0].surficial_material, result.errors[0]
+        ('Colluvium (Active)', TerrainError(component=1, category='surficial material', chars='NT'))
+        """
+        entry = _lookup(self.instr, self.engine)
+        return ParseResult(entry[0], _entry_errors(entry))
 
-        # PARSE/INTERPRET CODES IN THIS SECTION
-        # Take each split code and make a list containing 6 descriptors describing the terrain
-        # and a 7th descriptor that notes any code characters that are not defined in the BCTCS
-    
-        # create a new list for each item in the terrain_code_split list
-        new_list = []
-        for string in terrain_code_split:
-            # initialize the values for the new list
-            first_val = ""
-            second_val = ""
-            third_val = ""
-            fourth_val = ""
-            fifth_val = ""
-
-            # *SURFICIAL MATERIAL*  check the first uppercase letter in the string
-            first_val = ""
-
-            # this conditional makes sure to include Bedrock modifier codes (if they exist)
-            # this occurs when 'R' is preded by lowercase chars that exist in bedrock_R_subclass_terms dictionary
-            if string.find("R") >= 2:
-                prev_two = string[string.find("R")-2:string.find("R")]
-                if prev_two in bedrock_R_subclass_terms.keys():
-                    first_val += prev_two
-
-            # get all characters before the first hyphen
-            pre_hyphen = string.split('-')[0] if '-' in string else string
-
-            # get the first uppercase letter or consecutive uppercase letters
-            first_val = ''
-            
-            for i in range(len(pre_hyphen)):
-                if pre_hyphen[i].isupper():
-                    first_val = pre_hyphen[i]
-                    for j in range(i+1, len(pre_hyphen)):
-                        if pre_hyphen[j].isupper():
-                            first_val += pre_hyphen[j]
-                        else:
-                            break
-                    break
-        
-            # *SURFACE EXPRESSION*  assign the second value
-            upper_found = False
-            second_val = ''
-            for char in string:
-                if char.isupper():
-                    upper_found = True
-                elif char.islower() and upper_found and '-' not in string[string.index(char)-1:string.index(char)]:
-                    second_val += char
-                elif char == '-':
-                    upper_found = False
-            
-            # *TEXTURE* assign the third value
-            third_val = ""
-            for char in string:
-                if char.isupper():
-                    break
-                elif char.islower():
-                    third_val += char
-            
-            # *GEOMORPHOLOGICAL PROCESS* assign the fourth value
-            fourth_val = ""
-            # strip the '-' that indicates the following chars codify geomorph processes
-            if '-' in string:
-                i = string.index('-')
-                fourth_val = string[i:]
-                #remove / or = or numeric data
-                fourth_val = re.sub('[0-9/=-]', '', fourth_val)
-
-            # *CONTINUITY* assign the fifth value
-            fifth_val = ''
-            if string[0] == '/':
-                fifth_val = "discontinuous"
-            elif string[0] == '':
-                fifth_val = ''
-            else:
-                fifth_val = "continuous"
-
-            # *EXTENT RELATIVE TO NEXT TERRAIN TYPE* assign the sixth value (terrain extent relative to the following terrain)
-            sixth_val = ''
-            if string[-1] == "=":
-                sixth_val = "equal extent relative to next terrain type"
-            elif string[-1] == "/":
-                if len(string) > 1 and string[-2] == "/":
-                    sixth_val = "much greater extent relative to next terrain type"
-                else:
-                    sixth_val = "greater extent relative to next terrain type"
-            elif string[-1].isdigit():
-                sixth_val = string[-1]
+    @property
+    def _components(self) -> tuple:
+        """
+        Immutable parse result (a tuple of TerrainComponent records), computed once per instr and engine.
 
-            # add the values to the new list
-            new_list.append([first_val, second_val, third_val, fourth_val, fifth_val, sixth_val, '', string])
-        
-        # DEBUGGING PRINT UPDATES
-#           print(new_list)
-        # print(new_list[0])
-        # print(new_list[0][0][:2])
+        Unparsed terms always raise a ValueError here: the old `parsed` signature defaulted
+        its strictmode argument to 1, which took precedence over self.strictmode, and that
+        behaviour is kept for compatibility.
+        """
+        if self._parsed_key != (self.instr, self.engine):
+            components, error_msg = _lookup(self.instr, self.engine)
+            self._parsed_key = (self.instr, self.engine)
+            self._result = None if error_msg else components
+            self._error = error_msg or None
+        if self._error is not None:
+            if _stats_enabled:
+                _record_strict_raise()
+            raise ValueError(self._error)
+        return self._result
 
-        # Loop over each list in new_list and replace coded characters with descriptive words in dictionaries
-        
-        for i in range(len(new_list)):
-            
-            # SURFICIAL MATERIAL CODE INTERPRETATION
-            # Replace the first value with the associated value in the surficial_material_terms dictionary
-            first_val = ''
-            if len(new_list[i][0]) > 2 and new_list[i][0][:2] in bedrock_R_subclass_terms:
-                first_val += bedrock_R_subclass_terms[new_list[i][0][:2]] + ' '
-        
-            # Remove any non-uppercase letters from new_list[i][0]
-            upper_case_letters = ''.join([char for char in new_list[i][0] if char.isupper()])
-
-            # Check for an activity modifier (I or A) then strip them from upper_case_letters and process 
-            # the modifiers after terrain expression interpretation is complete
-            activity_modifier = ''
-            # debugging --print(upper_case_letters, " ", len(upper_case_letters), type(upper_case_letters))
-            if len(upper_case_letters) > 1:
-                if 'I' in upper_case_letters[1:]:
-                    activity_modifier = 'I'
-                    upper_case_letters = upper_case_letters.replace('I', '')
-                elif 'A' in upper_case_letters[1:]:
-                    activity_modifier = 'A'
-                    upper_case_letters = upper_case_letters.replace('A', '')
-
-            # Count the number of uppercase letters
-            num_upper_case_letters = len(upper_case_letters)
-
-            if num_upper_case_letters == 1:
-                # Get the single uppercase letter
-                single_letter = upper_case_letters[0]
-
-                # Check if the surficial_material_terms dictionary has a value for that letter
-                if single_letter in surficial_material_terms:
-                    # Add the associated value to new_first_val
-                    first_val += surficial_material_terms[single_letter]
-                else:
-                    # if the code is not found in dictionary, make note of this
-                    new_list[i][6] += upper_case_letters + ': undefined surficial material code; '
+    def _field(self, field: str) -> list:
+        """
+        One descriptor (a name from FIELDS) of every terrain type, decoded on its own unless
+        the code has already been parsed
+        """
+        if self._parsed_key == (self.instr, self.engine) and self._result is not None:
+            return [getattr(component, field) for component in self._result]
+        return [values[0] for values in _decode_fields(self.instr, (field,), self.engine)]
 
-            elif num_upper_case_letters == 2:
-                # Get the two uppercase letters
-                two_letters = ''.join(upper_case_letters)
+    @property
+    def material(self) -> list:
+        """
+        Surficial material of each terrain type, without interpreting the rest of the code.
+        Like the other field accessors it does not raise for unparsed terms; undefined
+        letters are simply left out.
 
-                # Check if the surficial_material_terms dictionary has a value for those two letters taken together
-                if two_letters in surficial_material_terms:
-                    # Add the associated value to new_first_val
-                    first_val += surficial_material_terms[two_letters]
-                else:
-                    # if the code is not found in dictionary, make note of this
-                    new_list[i][6] = new_list[i][6] + two_letters + ': undefined surficial material code; '
-            elif num_upper_case_letters == 0:
-                new_list[i][6] = 'blank surficial material code; '
-            elif num_upper_case_letters > 2:
-                new_list[i][6] = ''.join(upper_case_letters) + ': undefined surficial material code; '
-
-            # Check is there was an Activity modifier in the code, and switch the activity status of the parsed
-            # code accordingly
-            if activity_modifier == 'A' and '(Inactive)' in first_val:
-                first_val = first_val.replace('(Inactive)', '(Active)')
-            elif activity_modifier == 'I' and '(Active)' in first_val:
-                first_val = first_val.replace('(Active)', '(Inactive)')
-            if (activity_modifier == 'A' or activity_modifier == 'I') and '(Activity status n/a)' in first_val:
-                new_list[i][6] += activity_modifier + ": Activity modifier attempting to modify a terrain type where Activity Status is n/a; "
-
-            new_list[i][0] = first_val
-
-            # if there is no terrain material identified, it cannot be continuous, so set blank
-            if first_val == '':
-                new_list[i][4] = ''
-            
-            # SURFACE EXPRESSION CODE INTERPRETATION
-            # first update str to remove any code items not in surface expression dictionary and made note
-            code_not_found = []
-            new_str = ""
-            for c in new_list[i][1]:
-                if c not in surface_expression_terms:
-                    code_not_found.append(c)
-                else:
-                    new_str += c
-
-            if len(code_not_found) > 0:
-                undefined_str = ' '.join([str(elem) for elem in code_not_found])
-                new_list[i][6] += undefined_str + ': undefined surface expression codes; '
-            new_list[i][1] = new_str
-            
-            # Replace the second value with the associated value in the surface_expression_terms dictionary for each character
-            new_list[i][1] = ' '.join([surface_expression_terms[c] if c in surface_expression_terms else c for c in new_list[i][1]])
-
-            # TEXTURE CODE INTERPRETATION
-            # first update str to remove any code items not in texture dictionary and made note
-            code_not_found = []
-            new_str = ""
-            for c in new_list[i][2]:
-                if c not in textural_terms:
-                    code_not_found.append(c)
-                else:
-                    new_str += c
-
-            if len(code_not_found) > 0:
-                undefined_str = ' '.join([str(elem) for elem in code_not_found])
-                new_list[i][6] += undefined_str + ': undefined texture codes; '
-            new_list[i][2] = new_str
-            
-            # Replace the third value in each list with the associated value in the textural_terms dictionary for each character
-            new_list[i][2] = ' '.join([textural_terms[c] if c in textural_terms else c for c in new_list[i][2]])
-
-            # GEOMORPHOLOGICAL PROCESSES CODE INTERPRATATION
-            # Replace 4th value w the associated value in the geomorphological_process_terms dictionary
-            # Initialize new_geomorph to empty string
-            new_geomorph = ''
-            undefined_str = ''
-            undefined_geomorph_process_terms = ''
-            for char in new_list[i][3]:
-                if char.isupper() and char not in geomorphological_process_terms:
-                    undefined_geomorph_process_terms += char + ' '  
-            new_list[i][3] = ''.join([char for char in new_list[i][3] if char.upper() in geomorphological_process_terms])
-
-            if undefined_geomorph_process_terms:
-                new_list[i][6] += undefined_geomorph_process_terms[:-1] + ': undefined geomorphological process terms; '
-
-            # GEOMORPH SUBCLASS INTERPRETATIONS
-            # Loop through each character in new_list[i][3]
-            for char in new_list[i][3]:
-                # If character is uppercase, add the associated term from geomorphological_process_terms
-                if char.isupper():
-                    new_geomorph += geomorphological_process_terms.get(char, char+'*') + ' '
-                # If character is lowercase and follows an 'F', add associated term from slow_mass_movement_F_subclass_terms
-                elif char.islower() and char.isalpha() and new_list[i][3][new_list[i][3].index(char)-1] == 'F':
-                    new_geomorph += slow_mass_movement_F_subclass_terms.get(char, char+'*') + ' '
-                    if slow_mass_movement_F_subclass_terms.get(char, 1) == 1:
-                        new_list[i][6] += char + ': undefined geomorphological subclass modifier for F(slow mass movements)'                                # If character is lowercase and follows an 'R', add associated term from rapid_mass_movement_R_subclass_terms
-                elif char.islower() and char.isalpha() and new_list[i][3][new_list[i][3].index(char)-1] == 'R':
-                    new_geomorph += rapid_mass_movement_R_subclass_terms.get(char, char+'*') + ' '
-                # If character is lowercase and follows an 'A', add associated term from snow_avalanches_A_subclass_terms
-                elif char.islower() and char.isalpha() and new_list[i][3][new_list[i][3].index(char)-1] == 'A':
-                    new_geomorph += snow_avalanches_A_subclass_terms.get(char, char+'*') + ' '
-                # If character is lowercase and follows a 'B', 'I', 'J', or 'M', add associated term from fluvial_B_I_J_M_subclass_terms
-                elif char.islower() and char.isalpha() and new_list[i][3][new_list[i][3].index(char)-1] in ['B', 'I', 'J', 'M']:
-                    new_geomorph += fluvial_B_I_J_M_subclass_terms.get(char, char+'*') + ' '
-                # If character is lowercase and follows a 'X' or 'Z', add associated term from permafrost_X_Z_subclass_terms
-                elif char.islower() and char.isalpha() and new_list[i][3][new_list[i][3].index(char)-1] in ['X', 'Z']:
-                    new_geomorph += permafrost_X_Z_subclass_terms.get(char, char+'*') + ' '
-
-            #update list with english geomorph terms     
-            new_list[i][3] = new_geomorph
-
-            # check the potential error string and remove the training two characters if there potential errors (string clean-up before returning)
-            if new_list[i][6][-2:] == ', ' or new_list[i][6][-2:] == '; ':
-                new_list[i][6] = new_list[i][6][:-2]
-#        print(new_list)
-        
-        if any(len(sublist[6]) > 0 for sublist in new_list):
-            error_msg = ''.join(sublist[6] for sublist in new_list if len(sublist[6]) > 0)
- #           print(error_msg)
-            if strictmode == 1:
-                raise ValueError(error_msg)
-        else: 
-            return(new_list)
-        
-    #     #return as normal if there is no record of unparsed terms in new_list[i][6]
-    #     if new_list[i][6] == '':
-    #         return(new_list)
-    #     else: # goes here if there were unparsed items, treated differently whether it is in strict mode or not
-    #         print(''.join(sublist[6] for sublist in new_list))
-    #         print(range(len(new_list)))
-    #         raise ValueError(new_list[i][6])
+        >>> Terrain('Rs/Cv-A').material
+        ['Bedrock (Activity status n/a)', 'Colluvium (Active)']
+        """
+        return self._field('surficial_material')
 
-    # except ValueError as e:
-    #     print('Exception Raised from unparsed terms from input: ', e)
-    #     if strictmode == 0:
-    #         return(new_list)
+    @property
+    def expression(self) -> list:
+        """
+        Surface expression of each terrain type
+        """
+        return self._field('surface_expression')
+
+    @property
+    def texture(self) -> list:
+        """
+        Texture of each terrain type
+        """
+        return self._field('texture')
 
+    @property
+    def processes(self) -> list:
+        """
+        Geomorphological processes of each terrain type ('' where there are none)
+
+        >>> Terrain('Rs/Cv-A').processes
+        ['', 'Snow avalanches (Active) ']
+        """
+        return self._field('geomorphological_processes')
+
+    @property
+    def extent(self) -> list:
+        """
+        Extent (continuous or discontinuous) of each terrain type
+        """
+        return self._field('extent')
+
+    @property
+    def component_count(self) -> int:
+        """
+        Number of terrain types in the code, found by splitting it only
+
+        >>> Terrain('/Msa=Mw-V//Rsa').component_count
+        3
+        """
+        if self._parsed_key == (self.instr, self.engine) and self._result is not None:
+            return len(self._result)
+        return len(_split_composite(self.instr))
 
     def __len__(self):
         """
-        Returns the amount of terrain types in the given terrain code
+        Returns the amount of terrain types in the given terrain code. Only the composite
+        split is needed, so unlike parsed this does not raise for unparsed terms.
         
         >>> len(Terrain('Rha'))
         1
         >>> len(Terrain('Rha/aCk'))
         2
         """
-        return len(self.parsed)
+        return self.component_count
     
     def __getitem__(self, key):
         """
@@ -667,7 +2194,9 @@ class Terrain:
         ['Colluvium (Active)', 'moderately steep slope', 'Blocks', '', 'continuous', '', '', 'aCk']
 
         """
-        return(self.parsed[key])
+        if isinstance(key, slice):
+            return [list(component) for component in self._components[key]]
+        return list(self._components[key])
     
     def __str__(self):
         """
@@ -685,7 +2214,7 @@ class Terrain:
         # for sublist in parsed_result:
         #     if len(sublist) >= 6 and 'extent' in sublist[5]
         #         sublist[5] += ' than next terrain type'
-        return ' / '.join([' '.join([y for y in x[:7] if y]) for x in self.parsed])
+        return ' / '.join([' '.join([y for y in x[:7] if y]) for x in self._components])
 
     def __int__(self):
         """
@@ -697,7 +2226,7 @@ class Terrain:
         2
 
         """
-        return(len(self.parsed))
+        return self.component_count
     
     def max(self):
         """
@@ -707,7 +2236,7 @@ class Terrain:
         ['Colluvium (Active)', 'moderately steep slope', 'Blocks', '', 'continuous', '', '', 'aCk']
 
         """
-        return self.parsed[-1]
+        return list(self._components[-1])
     
     def min(self):
         """
@@ -718,7 +2247,7 @@ class Terrain:
 
         """
                
-        return self.parsed[0]
+        return list(self._components[0])
 
     def json(self):
         """
@@ -738,16 +2267,7 @@ class Terrain:
         {'rCa/Rs': [{'surficial_material': 'Colluvium (Active)', 'surface_expression': 'Moderate slope', 'texture': 'Rubble', 'geomorphological_processes': None, 'extent': 'continuous', 'coverage_relative_to_next_terrain_type': 'greater extent relative to next terrain type'}, {'surficial_material': 'Bedrock (Activity status n/a)', 'surface_expression': 'steep slope', 'texture': None, 'geomorphological_processes': None, 'extent': 'continuous', 'coverage_relative_to_next_terrain_type': None}]}
         """
         
-        outjson = {self.instr :[]}
-        for group in self.parsed:
-            groupdict = dict(surficial_material = group[0],
-                             surface_expression =group[1] if group[1] else None,
-                             texture = group[2] if group[2] else None,
-                             geomorphological_processes = group[3] if group[3] else None,
-                             extent = group[4] if group[4] else None,
-                             coverage_relative_to_next_terrain_type = group[5] if group[5] else None)
-            outjson[self.instr].append(groupdict)
-        return outjson                    
+        return {self.instr: [_json_group(group) for group in self._components]}
     
 if __name__ == '__main__':
     # Paul's Hard-coded testing/debugging:
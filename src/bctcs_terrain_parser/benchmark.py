@@ -0,0 +1,331 @@
+# Benchmark harness for the BC Terrain Classification System parser
+#
+# Measures the per-code accessors (Terrain(...).parsed, str(), json()) and the batch paths
+# (parse_many, to_columns, query.encode) on the bundled Chilliwack layer, optionally scaled
+# up, and reports for each:
+#
+#   codes_per_sec    throughput (best of --repeat runs)
+#   median_codes_per_sec, noise
+#                    median throughput and its run-to-run noise (3 median absolute deviations,
+#                    as a fraction of the median)
+#   p50_us, p99_us   per-code latency in microseconds (per-code benchmarks only)
+#   peak_kib         peak memory allocated by Python while running (tracemalloc)
+#   cache_hit_rate   share of lookups served by the shared parse cache
+#
+# USAGE:
+# ======
+#   python -m bctcs_terrain_parser.benchmark --scale 100 --save baseline.json
+#   python -m bctcs_terrain_parser.benchmark --scale 100 --compare baseline.json --threshold 0.1
+#   python -m bctcs_terrain_parser.benchmark --synthetic 1000000 --seed 1
+#
+#   python -m bctcs_terrain_parser.benchmark --crossover 4
+#
+# --crossover WORKERS times parse_many() over growing numbers of distinct synthetic codes, in
+# this process and in a warm pool of WORKERS processes, and reports the smallest number from
+# which the pool is faster: the value of PARALLEL_MIN_CODES (or parallel_min_codes) for the host.
+#
+# With --compare the run fails (exit status 1) if any benchmark's median throughput fell by
+# more than the threshold fraction plus the noise of either run relative to the baseline.
+# Comparing needs at least MIN_COMPARE_REPEAT runs per benchmark and the same corpus, which
+# is identified by a hash of its codes.
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from .bctcs_terrain_parser import Terrain, cache_clear, cache_info, parse_many, shutdown_workers, start_workers
+
+# Fewest runs per benchmark whose median and noise are worth comparing
+MIN_COMPARE_REPEAT = 5
+
+# Numbers of distinct codes timed by --crossover
+CROSSOVER_SIZES = (1000, 2000, 5000, 10000, 20000, 50000)
+
+CHILLIWACK_CSV = os.path.join(os.path.dirname(__file__), 'tests', 'ChilliwackTerrainCodes.csv')
+
+
+def load_codes(path: str = CHILLIWACK_CSV, column: str = 'terrain') -> list:
+    """
+    Reads the terrain code column of a CSV file
+    """
+    with open(path, newline='') as csvfile:
+        return [row[column] for row in csv.DictReader(csvfile)]
+
+
+def _per_code(accessor):
+    def run(code):
+        try:
+            accessor(code)
+        except ValueError:
+            pass
+    return run
+
+
+def _columns(codes):
+    from .columnar import to_columns
+    to_columns(codes)
+
+
+def _encode(codes):
+    from .query import encode
+    encode(codes)
+
+
+# name -> (function, True if it is called once per code rather than once per corpus)
+BENCHMARKS = {
+    'terrain.parsed': (_per_code(lambda code: Terrain(code).parsed), True),
+    'terrain.parsed[tokenizer]': (_per_code(lambda code: Terrain(code, engine='tokenizer').parsed), True),
+    'terrain.str': (_per_code(lambda code: str(Terrain(code))), True),
+    'terrain.json': (_per_code(lambda code: Terrain(code).json()), True),
+    'parse_many': (parse_many, False),
+    'parse_many[tokenizer]': (lambda codes: parse_many(codes, engine='tokenizer'), False),
+    'columnar.to_columns': (_columns, False),
+    'query.encode': (_encode, False),
+}
+
+
+def _percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def corpus_hash(codes: list) -> str:
+    """
+    Short hex digest identifying a corpus by its codes, in order
+
+    >>> corpus_hash(['Cv', 'Mb']) == corpus_hash(['Mb', 'Cv'])
+    False
+    """
+    digest = hashlib.sha256()
+    for code in codes:
+        digest.update(code.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()[:16]
+
+
+def run_benchmark(name: str, codes: list, repeat: int = MIN_COMPARE_REPEAT) -> dict:
+    """
+    Runs one benchmark from BENCHMARKS over codes and returns its measurements. The parse cache
+    is cleared before every run, so each run starts cold.
+    """
+    function, per_code = BENCHMARKS[name]
+    runs = []
+    latencies = []
+    for _ in range(max(repeat, 1)):
+        cache_clear()
+        if per_code:
+            clock = time.perf_counter_ns
+            latencies = []
+            start = clock()
+            for code in codes:
+                before = clock()
+                function(code)
+                latencies.append(clock() - before)
+            elapsed = (clock() - start) / 1e9
+        else:
+            start = time.perf_counter()
+            function(codes)
+            elapsed = time.perf_counter() - start
+        runs.append(elapsed)
+    info = cache_info()
+    lookups = info.hits + info.misses
+
+    # memory is measured in a separate run, tracemalloc slows everything down
+    cache_clear()
+    tracemalloc.start()
+    if per_code:
+        for code in codes:
+            function(code)
+    else:
+        function(codes)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies.sort()
+    runs.sort()
+    best = runs[0]
+    median = _percentile(runs, 0.5) if len(runs) % 2 else (runs[len(runs) // 2 - 1] + runs[len(runs) // 2]) / 2
+    deviations = sorted(abs(run - median) for run in runs)
+    return dict(codes=len(codes),
+                seconds=round(best, 6),
+                codes_per_sec=round(len(codes) / best, 1) if best else None,
+                median_codes_per_sec=round(len(codes) / median, 1) if median else None,
+                noise=round(3 * _percentile(deviations, 0.5) / median, 4) if median and len(runs) > 1 else None,
+                p50_us=round(_percentile(latencies, 0.50) / 1000, 3) if per_code else None,
+                p99_us=round(_percentile(latencies, 0.99) / 1000, 3) if per_code else None,
+                peak_kib=round(peak / 1024, 1),
+                cache_hit_rate=round(info.hits / lookups, 4) if lookups else None)
+
+
+def run_all(codes: list, names=None, repeat: int = MIN_COMPARE_REPEAT) -> dict:
+    """
+    Runs the named benchmarks (all of BENCHMARKS by default) and returns a JSON-ready report
+    """
+    results = {name: run_benchmark(name, codes, repeat) for name in (names or BENCHMARKS)}
+    return dict(python=platform.python_version(),
+                platform=platform.platform(),
+                corpus=dict(codes=len(codes), distinct_codes=len(set(codes)), sha256=corpus_hash(codes)),
+                results=results)
+
+
+def compare(report: dict, baseline: dict, threshold: float = 0.1) -> list:
+    """
+    Returns a list of (name, baseline codes/sec, current codes/sec, change) for benchmarks whose
+    median throughput dropped by more than threshold (a fraction) plus the larger noise of the
+    two runs, relative to the baseline report
+
+    >>> base = {'results': {'a': {'median_codes_per_sec': 100.0, 'noise': 0.02}}}
+    >>> compare({'results': {'a': {'median_codes_per_sec': 80.0, 'noise': 0.03}}}, base)
+    [('a', 100.0, 80.0, -0.2)]
+    >>> compare({'results': {'a': {'median_codes_per_sec': 88.0, 'noise': 0.05}}}, base)
+    []
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        previous = baseline.get('results', {}).get(name, {})
+        before = previous.get('median_codes_per_sec')
+        after = result.get('median_codes_per_sec')
+        if before and after is not None:
+            change = round(after / before - 1, 4)
+            noise = max(previous.get('noise') or 0.0, result.get('noise') or 0.0)
+            if change < -(threshold + noise):
+                regressions.append((name, before, after, change))
+    return regressions
+
+
+def _median(values: list) -> float:
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def crossover(workers: int, sizes=CROSSOVER_SIZES, repeat: int = MIN_COMPARE_REPEAT, seed: int = 0) -> list:
+    """
+    Times parse_many() over each number of distinct synthetic codes in sizes, once in this
+    process and once in a pool of workers processes (started beforehand, as a long-running
+    process would keep it); returns a list of (size, serial seconds, parallel seconds), medians
+    of repeat cold-cache runs
+    """
+    from .synthetic import CodeGenerator
+    pool = CodeGenerator(seed=seed, cardinality=max(sizes)).pool
+    start_workers(workers)
+    timings = []
+    try:
+        for size in sizes:
+            codes = pool[:size]
+            medians = []
+            for parallel_workers in (None, workers):
+                runs = []
+                for _ in range(max(repeat, 1)):
+                    cache_clear()
+                    start = time.perf_counter()
+                    parse_many(codes, workers=parallel_workers, parallel_min_codes=1)
+                    runs.append(time.perf_counter() - start)
+                medians.append(_median(runs))
+            timings.append((size,) + tuple(medians))
+    finally:
+        shutdown_workers()
+        cache_clear()
+    return timings
+
+
+def crossover_size(timings: list):
+    """
+    Smallest size from which every larger size of crossover() timings was faster in parallel,
+    or None if the largest was not
+
+    >>> crossover_size([(1000, 0.01, 0.02), (2000, 0.02, 0.01), (5000, 0.05, 0.03)])
+    2000
+    >>> crossover_size([(1000, 0.01, 0.02), (2000, 0.02, 0.03)]) is None
+    True
+    """
+    size = None
+    for size_, serial, parallel in reversed(timings):
+        if parallel >= serial:
+            break
+        size = size_
+    return size
+
+
+def _print_report(report: dict, baseline: dict = None, out=sys.stdout) -> None:
+    print('corpus: %(codes)d codes, %(distinct_codes)d distinct' % report['corpus'], file=out)
+    print('%-28s %14s %10s %10s %12s %10s %10s' % ('benchmark', 'codes/sec', 'p50 us', 'p99 us',
+                                                  'peak KiB', 'hit rate', 'vs base'), file=out)
+    for name, result in report['results'].items():
+        change = ''
+        before = (baseline or {}).get('results', {}).get(name, {}).get('median_codes_per_sec')
+        if before:
+            change = '%+.1f%%' % ((result['median_codes_per_sec'] / before - 1) * 100)
+        print('%-28s %14.0f %10s %10s %12.1f %10s %10s' % (
+            name, result['codes_per_sec'], result['p50_us'] if result['p50_us'] is not None else '-',
+            result['p99_us'] if result['p99_us'] is not None else '-', result['peak_kib'],
+            result['cache_hit_rate'] if result['cache_hit_rate'] is not None else '-', change), file=out)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m bctcs_terrain_parser.benchmark',
+                                     description='Benchmark the BCTCS parser.')
+    parser.add_argument('--csv', default=CHILLIWACK_CSV, help='CSV corpus (default: the bundled Chilliwack layer)')
+    parser.add_argument('--column', default='terrain', help="terrain code column (default 'terrain')")
+    parser.add_argument('--scale', type=int, default=1, help='repeat the corpus this many times')
+    parser.add_argument('--synthetic', type=int, metavar='N',
+                        help='use N synthetic codes (see bctcs_terrain_parser.synthetic) instead of --csv')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic corpus')
+    parser.add_argument('--repeat', type=int, default=MIN_COMPARE_REPEAT,
+                        help='runs per benchmark (default and minimum for --compare: %d)' % MIN_COMPARE_REPEAT)
+    parser.add_argument('--only', action='append', choices=list(BENCHMARKS), help='run only these benchmarks')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed throughput drop as a fraction of the baseline (default 0.1)')
+    parser.add_argument('--crossover', type=int, metavar='WORKERS',
+                        help='find the number of distinct codes from which WORKERS processes beat one')
+    args = parser.parse_args(argv)
+    if args.crossover:
+        timings = crossover(args.crossover, repeat=args.repeat, seed=args.seed)
+        print('%12s %12s %12s' % ('distinct', 'serial s', 'parallel s'))
+        for size, serial, parallel in timings:
+            print('%12d %12.4f %12.4f' % (size, serial, parallel))
+        size = crossover_size(timings)
+        print('crossover: %s' % ('%d distinct codes' % size if size else 'none up to %d' % timings[-1][0]))
+        return 0
+    if args.compare and args.repeat < MIN_COMPARE_REPEAT:
+        parser.error('--compare needs --repeat %d or more to tell changes from noise' % MIN_COMPARE_REPEAT)
+
+    if args.synthetic:
+        from .synthetic import CodeGenerator
+        codes = list(CodeGenerator(seed=args.seed).rows(args.synthetic)) * max(args.scale, 1)
+    else:
+        codes = load_codes(args.csv, args.column) * max(args.scale, 1)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        corpus = baseline.get('corpus', {})
+        if corpus.get('sha256') != corpus_hash(codes):
+            print('error: the baseline was measured on a different corpus %r' % (corpus,), file=sys.stderr)
+            return 1
+    report = run_all(codes, args.only, args.repeat)
+    _print_report(report, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if baseline is not None:
+        regressions = compare(report, baseline, args.threshold)
+        for name, before, after, change in regressions:
+            print('REGRESSION %s: %.0f -> %.0f codes/sec (%+.1f%%)' % (name, before, after, change * 100),
+                  file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
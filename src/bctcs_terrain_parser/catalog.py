@@ -0,0 +1,180 @@
+# Persistent, indexed catalog of terrain polygons
+#
+# A TerrainCatalog ingests (feature_id, terrain code) pairs once and keeps an inverted index
+# from every vocabulary term used by a code to the features using it, stored in a local
+# SQLite file. Features can then be found by material, process, subclass, bedrock lithology,
+# etc. with conjunctive/disjunctive queries and counts, without parsing anything again.
+#
+# TERMS:
+# ======
+# Terms are written 'category:letters', e.g.
+#   'material:C'     Colluvium                    'process:R'      Rapid mass movements
+#   'expression:v'   veneer                       'subclass:Rd'    debris flow
+#   'texture:g'      Gravel                       'bedrock:gr'     granite (from bedrock_R_subclass_terms)
+#   'extent:discontinuous'
+# Only letters defined in the vocabularies are indexed. Codes are read as by query.encode(),
+# which follows the parser: 'F^G' is indexed as 'material:FG', the process qualifier of '-F^I'
+# is left out, and '-Rdb' is indexed as 'subclass:Rd' (and, like 'Cv-Rd', 'expression:d').
+#
+# EXAMPLE:
+# ========
+# catalog = TerrainCatalog('chilliwack.sqlite')
+# catalog.add(zip(df['fid'], df['terrain']))
+# catalog.query(all_of=['material:C'], any_of=['process:R', 'process:A'])
+
+import sqlite3
+
+from .bctcs_terrain_parser import (surficial_material_terms, surface_expression_terms,
+                                   textural_terms, bedrock_R_subclass_terms, _split_composite,
+                                   _strip_qualifiers)
+from .query import SUBCLASS_BITS, _read_component
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS features (feature_id PRIMARY KEY, code TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, feature_id NOT NULL,
+                                     PRIMARY KEY (term, feature_id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_feature ON postings (feature_id);
+'''
+
+
+def component_terms(string: str) -> frozenset:
+    """
+    Returns the set of vocabulary terms used by the string of a single terrain type
+
+    >>> sorted(component_terms('/Cv-Rd'))
+    ['expression:d', 'expression:v', 'extent:discontinuous', 'material:C', 'process:R', 'subclass:Rd']
+    >>> sorted(component_terms('sgF^Gt-F^I'))
+    ['expression:t', 'extent:continuous', 'material:FG', 'process:F', 'texture:g', 'texture:s']
+    """
+    material, texture, expression, processes = _read_component(string)
+    if '^' in string:
+        string = _strip_qualifiers(string)[0]
+    terms = set()
+    if material in surficial_material_terms:
+        terms.add('material:' + material)
+    # a bedrock lithology is written as two lowercase letters in front of the 'R'
+    if material == 'R' and ''.join(texture[-2:]) in bedrock_R_subclass_terms:
+        terms.add('bedrock:' + ''.join(texture[-2:]))
+        texture = texture[:-2]
+    terms.update('texture:' + letter for letter in texture if letter in textural_terms)
+    terms.update('expression:' + letter for letter in expression if letter in surface_expression_terms)
+    for process, subclass in processes:
+        terms.add('process:' + process)
+        if (process, subclass) in SUBCLASS_BITS:
+            terms.add('subclass:' + process + subclass)
+    terms.add('extent:discontinuous' if string[0] == '/' else 'extent:continuous')
+    return frozenset(terms)
+
+
+def code_terms(terrain_code: str) -> frozenset:
+    """
+    Returns the set of vocabulary terms used by a terrain code
+
+    >>> sorted(code_terms('grRs/Cv-Rd'))
+    ['bedrock:gr', 'expression:d', 'expression:s', 'expression:v', 'extent:continuous', 'material:C', 'material:R', 'process:R', 'subclass:Rd']
+    """
+    return frozenset().union(*map(component_terms, _split_composite(terrain_code)))
+
+
+class TerrainCatalog:
+    """
+    Inverted index of terrain codes by vocabulary term, stored in SQLite ('path' is a file name
+    or ':memory:')
+
+    >>> catalog = TerrainCatalog()
+    >>> catalog.add([(1, 'Cv-Rd'), (2, 'Rs/Cv-A'), (3, 'Mb'), (4, 'grRs')])
+    >>> catalog.query(all_of=['material:C'], any_of=['process:R', 'process:A'])
+    [1, 2]
+    >>> catalog.count(all_of=['material:R'], none_of=['bedrock:gr'])
+    1
+    >>> catalog.add([(3, 'Cv-Rd')])
+    >>> catalog.query(['subclass:Rd'])
+    [1, 3]
+    """
+
+    def __init__(self, path: str = ':memory:') -> None:
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> 'TerrainCatalog':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __len__(self) -> int:
+        return self._connection.execute('SELECT count(*) FROM features').fetchone()[0]
+
+    def add(self, features) -> None:
+        """
+        Adds (feature_id, terrain code) pairs. A feature that is already in the catalog has its
+        code and index entries replaced.
+        """
+        terms_of = {}
+        with self._connection:
+            for feature_id, code in features:
+                terms = terms_of.get(code)
+                if terms is None:
+                    terms = terms_of[code] = code_terms(code)
+                self._connection.execute('DELETE FROM postings WHERE feature_id = ?', (feature_id,))
+                self._connection.execute('INSERT OR REPLACE INTO features VALUES (?, ?)', (feature_id, code))
+                self._connection.executemany('INSERT INTO postings VALUES (?, ?)',
+                                             [(term, feature_id) for term in terms])
+
+    def remove(self, feature_ids) -> None:
+        """
+        Removes features and their index entries
+        """
+        with self._connection:
+            for feature_id in feature_ids:
+                self._connection.execute('DELETE FROM postings WHERE feature_id = ?', (feature_id,))
+                self._connection.execute('DELETE FROM features WHERE feature_id = ?', (feature_id,))
+
+    def code(self, feature_id):
+        """
+        Returns the terrain code of a feature (None if it is not in the catalog)
+        """
+        row = self._connection.execute('SELECT code FROM features WHERE feature_id = ?', (feature_id,)).fetchone()
+        return row[0] if row else None
+
+    def terms(self) -> dict:
+        """
+        Returns the number of features using each indexed term
+        """
+        return dict(self._connection.execute('SELECT term, count(*) FROM postings GROUP BY term ORDER BY term'))
+
+    def _select(self, all_of, any_of, none_of) -> tuple:
+        parts = []
+        parameters = []
+        for term in all_of:
+            parts.append('SELECT feature_id FROM postings WHERE term = ?')
+            parameters.append(term)
+        any_of = list(any_of)
+        if any_of:
+            parts.append('SELECT feature_id FROM postings WHERE term IN (%s)' % ', '.join('?' * len(any_of)))
+            parameters.extend(any_of)
+        sql = ' INTERSECT '.join(parts) if parts else 'SELECT feature_id FROM features'
+        none_of = list(none_of)
+        if none_of:
+            sql += ' EXCEPT SELECT feature_id FROM postings WHERE term IN (%s)' % ', '.join('?' * len(none_of))
+            parameters.extend(none_of)
+        return sql, parameters
+
+    def query(self, all_of=(), any_of=(), none_of=()) -> list:
+        """
+        Feature IDs of the features using every term of all_of, at least one term of any_of
+        (if given) and no term of none_of, in feature ID order
+        """
+        sql, parameters = self._select(all_of, any_of, none_of)
+        return [row[0] for row in self._connection.execute(sql + ' ORDER BY 1', parameters)]
+
+    def count(self, all_of=(), any_of=(), none_of=()) -> int:
+        """
+        Number of features query() would return
+        """
+        sql, parameters = self._select(all_of, any_of, none_of)
+        return self._connection.execute('SELECT count(*) FROM (%s)' % sql, parameters).fetchone()[0]
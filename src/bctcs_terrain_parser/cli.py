@@ -0,0 +1,213 @@
+# Command line enrichment tool for the BC Terrain Classification System parser
+#
+# Streams a CSV/TSV attribute table from a file or stdin, parses the terrain code column
+# and writes every input row back out with the parsed descriptors appended. Rows are
+# handled one at a time by generators (and written in buffered chunks), so memory use
+# does not grow with the size of the input.
+#
+# USAGE:
+# ======
+#   python -m bctcs_terrain_parser ChilliwackTerrainCodes.csv --column terrain --stats
+#   cat layer.tsv | python -m bctcs_terrain_parser --delimiter tab -o enriched.tsv
+#
+# Composite codes are written on a single row; the descriptors of each terrain type
+# are separated by ' / ' as in str(Terrain(code)).
+
+import argparse
+import csv
+import functools
+import io
+import sys
+import time
+
+from .bctcs_terrain_parser import ENGINES, _lookup
+from .persistent_cache import PersistentCache
+from .vocabulary import Vocabulary, use
+
+# Columns appended to every input row
+OUTPUT_FIELDS = ['terrain_types', 'surficial_material', 'surface_expression', 'texture',
+                 'geomorphological_processes', 'extent',
+                 'coverage_relative_to_next_terrain_type', 'unparsed_terms']
+
+DELIMITERS = {'comma': ',', 'tab': '\t', 'semicolon': ';', 'pipe': '|'}
+
+
+@functools.lru_cache(maxsize=4096)
+def enriched_fields(terrain_code: str, engine: str = 'legacy') -> tuple:
+    """
+    Returns the values of OUTPUT_FIELDS for a single terrain code. Unparsed terms are
+    reported in the last field rather than raised.
+
+    >>> enriched_fields('Rs/Cv-A')
+    ('2', 'Bedrock (Activity status n/a) / Colluvium (Active)', 'steep slope / veneer', ' / ', ' / Snow avalanches (Active) ', 'continuous / continuous', 'greater extent relative to next terrain type / ', '')
+    >>> enriched_fields('oNTA')[-1]
+    'NT: undefined surficial material code; o: undefined texture codes'
+    """
+    components, error_msg = _lookup(terrain_code, engine)
+    fields = [str(len(components))]
+    for i in range(6):
+        fields.append(' / '.join(component[i] for component in components))
+    fields.append(error_msg)
+    return tuple(fields)
+
+
+def read_rows(infile, delimiter: str = ','):
+    """
+    Yields rows of a delimited text stream one at a time
+    """
+    yield from csv.reader(infile, delimiter=delimiter)
+
+
+def enrich_rows(rows, column: str = 'terrain', strictmode: int = 0, stats: dict = None,
+                engine: str = 'legacy'):
+    """
+    Generator taking rows (the first one being the header) and yielding them with
+    OUTPUT_FIELDS appended. With strictmode 1 a ValueError is raised for the first code
+    with unparsed terms.
+
+    >>> rows = [['fid', 'terrain'], ['1', 'Cv'], ['2', 'oNTA']]
+    >>> out = list(enrich_rows(rows))
+    >>> out[0][-2:], out[1][:4]
+    (['coverage_relative_to_next_terrain_type', 'unparsed_terms'], ['1', 'Cv', '1', 'Colluvium (Active)'])
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    try:
+        column_index = header.index(column)
+    except ValueError:
+        raise ValueError('column %r not found in header %r' % (column, header)) from None
+    yield header + OUTPUT_FIELDS
+
+    distinct = set()
+    for row in rows:
+        code = row[column_index] if column_index < len(row) else ''
+        fields = enriched_fields(code, engine)
+        if fields[-1]:
+            if strictmode == 1:
+                raise ValueError('%s: %s' % (code, fields[-1]))
+            if stats is not None:
+                stats['errors'] += 1
+        if stats is not None:
+            stats['rows'] += 1
+            distinct.add(code)
+            stats['distinct_codes'] = len(distinct)
+        yield row + list(fields)
+
+
+def write_rows(rows, outfile, delimiter: str = ',', chunksize: int = 1000) -> None:
+    """
+    Writes rows to a delimited text stream, chunksize rows at a time
+    """
+    writer = csv.writer(outfile, delimiter=delimiter, lineterminator='\n')
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunksize:
+            writer.writerows(chunk)
+            chunk.clear()
+    writer.writerows(chunk)
+
+
+def _delimiter(name: str, path: str) -> str:
+    if name:
+        return DELIMITERS.get(name, name)
+    if path and path.lower().endswith(('.tsv', '.tab', '.txt')):
+        return '\t'
+    return ','
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='python -m bctcs_terrain_parser',
+        description='Append English descriptions of BC Terrain Classification System codes '
+                    'to every row of a CSV/TSV table.')
+    parser.add_argument('input', nargs='?', default='-',
+                        help="input table (default '-' reads stdin)")
+    parser.add_argument('-o', '--output', default='-',
+                        help="output table (default '-' writes stdout)")
+    parser.add_argument('-c', '--column', default='terrain',
+                        help="name of the column holding terrain codes (default 'terrain')")
+    parser.add_argument('-d', '--delimiter', default=None,
+                        help="field delimiter: a character or one of %s (default: tab for "
+                             ".tsv/.tab/.txt inputs, comma otherwise)" % ', '.join(DELIMITERS))
+    parser.add_argument('--output-delimiter', default=None,
+                        help='field delimiter of the output (default: same as the input)')
+    parser.add_argument('--strict', action='store_true',
+                        help='stop with an error at the first code with unparsed terms')
+    parser.add_argument('--engine', choices=list(ENGINES), default='legacy',
+                        help="parse engine (default 'legacy')")
+    parser.add_argument('--chunksize', type=int, default=1000,
+                        help='number of rows buffered per write (default 1000)')
+    parser.add_argument('--encoding', default='utf-8', help="text encoding (default 'utf-8')")
+    parser.add_argument('--stats', action='store_true',
+                        help='report rows/sec, distinct codes, error count and cache hits on stderr')
+    parser.add_argument('--cache', metavar='PATH',
+                        help='SQLite file of parsed codes kept between runs (see persistent_cache.py)')
+    parser.add_argument('--vocabulary', metavar='PATH',
+                        help='JSON vocabulary file to parse with instead of the built-in terms (see vocabulary.py)')
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    in_delimiter = _delimiter(args.delimiter, args.input)
+    out_delimiter = _delimiter(args.output_delimiter, None) if args.output_delimiter else in_delimiter
+    if args.vocabulary:
+        try:
+            use(Vocabulary.load(args.vocabulary))
+        except (OSError, ValueError) as e:
+            print('error: %s' % e, file=sys.stderr)
+            return 1
+
+    if args.input == '-':
+        infile = io.TextIOWrapper(sys.stdin.buffer, encoding=args.encoding, newline='')
+    else:
+        infile = open(args.input, encoding=args.encoding, newline='')
+    if args.output == '-':
+        outfile = io.TextIOWrapper(sys.stdout.buffer, encoding=args.encoding, newline='',
+                                   write_through=False)
+    else:
+        outfile = open(args.output, 'w', encoding=args.encoding, newline='', buffering=1 << 16)
+
+    stats = dict(rows=0, distinct_codes=0, errors=0)
+    start = time.perf_counter()
+    cache = PersistentCache(args.cache) if args.cache else None
+    try:
+        if cache is not None:
+            cache.load(args.engine)
+        rows = enrich_rows(read_rows(infile, in_delimiter), args.column,
+                           strictmode=1 if args.strict else 0, stats=stats, engine=args.engine)
+        write_rows(rows, outfile, out_delimiter, max(args.chunksize, 1))
+        if cache is not None:
+            cache.save(args.engine)
+    except ValueError as e:
+        print('error: %s' % e, file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # the reader went away (e.g. piped into head); stop quietly
+        return 1
+    finally:
+        # close our own files but only detach the wrappers around stdin/stdout
+        for stream, path in ((infile, args.input), (outfile, args.output)):
+            try:
+                if path == '-':
+                    stream.flush()
+                    stream.detach()
+                else:
+                    stream.close()
+            except (BrokenPipeError, ValueError):
+                pass
+        if cache is not None:
+            cache.close()
+
+    if args.stats:
+        elapsed = time.perf_counter() - start
+        rate = stats['rows'] / elapsed if elapsed > 0 else float('inf')
+        # repeated codes are answered by enriched_fields() before they reach the parse cache
+        info = enriched_fields.cache_info()
+        print('rows: %d  seconds: %.3f  rows/sec: %.0f  distinct codes: %d  errors: %d  cache hits: %d  misses: %d'
+              % (stats['rows'], elapsed, rate, stats['distinct_codes'], stats['errors'],
+                 info.hits, info.misses), file=sys.stderr)
+    return 0
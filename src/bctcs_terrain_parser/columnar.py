@@ -0,0 +1,152 @@
+# Columnar bulk export of parsed BC Terrain Classification System codes
+#
+# Instead of one json() dict per row, to_columns() parses a whole column of terrain codes
+# and returns one array per descriptor. Each descriptor is dictionary encoded: an integer
+# code per terrain type plus a small table of the distinct descriptions (categories), with
+# -1 standing for an empty descriptor like pandas.Categorical codes do. Because composite
+# codes describe several terrain types, the arrays hold one entry per terrain type and
+# offsets[i]:offsets[i+1] selects the terrain types of the i-th input code.
+#
+# BACKENDS:
+# =========
+# 'array' : stdlib array.array (always available)
+# 'numpy' : numpy.ndarray, expanded with vectorised take operations (needs numpy)
+# 'arrow' : pyarrow.DictionaryArray per descriptor and an int64 offsets array, which
+#           pandas/polars/duckdb can consume without copying (needs numpy and pyarrow)
+#
+# EXAMPLE:
+# ========
+# Input = ['Cv', 'Rs/Cv-A', 'Cv']
+# offsets = [0, 1, 3, 4]
+# fields['surficial_material'] = [0, 1, 0, 0]
+# categories['surficial_material'] = ['Colluvium (Active)', 'Bedrock (Activity status n/a)']
+
+from array import array
+from collections import namedtuple
+
+from .bctcs_terrain_parser import TerrainComponent, _parse_unique
+
+# Descriptors exported by to_columns(), in TerrainComponent order
+COLUMN_FIELDS = TerrainComponent._fields[:7]
+
+BACKENDS = ('array', 'numpy', 'arrow')
+
+TerrainColumns = namedtuple('TerrainColumns', ['offsets', 'fields', 'categories'])
+TerrainColumns.__doc__ = """
+Columnar parse result: offsets (one more than the number of input codes), fields (descriptor
+name -> integer codes, one per terrain type) and categories (descriptor name -> list of the
+descriptions the codes refer to)
+"""
+
+
+def to_columns(terrain_codes, backend: str = 'array', strictmode: int = 0,
+               engine: str = 'legacy', workers: int = None) -> TerrainColumns:
+    """
+    Parse a column of terrain codes into dictionary-encoded descriptor arrays.
+
+    Each distinct code is parsed once (see parse_many). Codes with unparsed terms raise a
+    ValueError when strictmode is 1; otherwise their terrain types are exported as far as
+    they could be read and the problem is kept in the 'unparsed_terms' descriptor.
+
+    :param terrain_codes : iterable of str
+        BC Terrain Classification Strings
+
+    :param backend : str
+        'array', 'numpy' or 'arrow' (see BACKENDS)
+
+    >>> columns = to_columns(['Cv', 'Rs/Cv-A', 'Cv'])
+    >>> list(columns.offsets), list(columns.fields['surficial_material'])
+    ([0, 1, 3, 4], [0, 1, 0, 0])
+    >>> columns.categories['surficial_material']
+    ['Colluvium (Active)', 'Bedrock (Activity status n/a)']
+    >>> list(columns.fields['geomorphological_processes'])
+    [-1, -1, 0, -1]
+    >>> columns = to_columns(['Mbv', 'oNTA'])
+    >>> [columns.categories['unparsed_terms'][code] for code in columns.fields['unparsed_terms'] if code >= 0]
+    ['NT: undefined surficial material code; o: undefined texture codes']
+    """
+    if backend not in BACKENDS:
+        raise ValueError('unknown backend %r, expected one of %s' % (backend, ', '.join(BACKENDS)))
+    unique_codes, entries, inverse = _parse_unique(terrain_codes, engine, workers)
+
+    # encode the terrain types of every distinct code once
+    category_index = {field: {} for field in COLUMN_FIELDS}
+    unique_lengths = array('q')
+    unique_fields = {field: array('i') for field in COLUMN_FIELDS}
+    for components, error_msg in entries:
+        if error_msg and strictmode == 1:
+            raise ValueError(error_msg)
+        unique_lengths.append(len(components))
+        for component in components:
+            for i, field in enumerate(COLUMN_FIELDS):
+                value = component[i]
+                if value:
+                    index = category_index[field]
+                    unique_fields[field].append(index.setdefault(value, len(index)))
+                else:
+                    unique_fields[field].append(-1)
+    categories = {field: list(category_index[field]) for field in COLUMN_FIELDS}
+
+    if backend == 'array':
+        offsets, fields = _expand_array(unique_lengths, unique_fields, inverse)
+        return TerrainColumns(offsets, fields, categories)
+
+    offsets, fields = _expand_numpy(unique_lengths, unique_fields, inverse)
+    if backend == 'numpy':
+        return TerrainColumns(offsets, fields, categories)
+
+    import pyarrow as pa
+    arrow_fields = {}
+    for field in COLUMN_FIELDS:
+        codes = fields[field]
+        indices = pa.array(codes, mask=codes < 0, type=pa.int32())
+        arrow_fields[field] = pa.DictionaryArray.from_arrays(indices, pa.array(categories[field], type=pa.string()))
+    return TerrainColumns(pa.array(offsets, type=pa.int64()), arrow_fields, categories)
+
+
+def _expand_array(unique_lengths: array, unique_fields: dict, inverse: list) -> tuple:
+    """
+    Fans the per distinct code arrays out to one entry per input row with stdlib arrays
+    """
+    unique_offsets = [0]
+    for length in unique_lengths:
+        unique_offsets.append(unique_offsets[-1] + length)
+    offsets = array('q', [0])
+    fields = {field: array(codes.typecode) for field, codes in unique_fields.items()}
+    total = 0
+    for position in inverse:
+        start = unique_offsets[position]
+        end = unique_offsets[position + 1]
+        total += end - start
+        offsets.append(total)
+        if end > start:
+            for field, codes in fields.items():
+                codes.extend(unique_fields[field][start:end])
+    return offsets, fields
+
+
+def _expand_numpy(unique_lengths: array, unique_fields: dict, inverse: list) -> tuple:
+    """
+    Same as _expand_array, vectorised with numpy take operations
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("the 'numpy' and 'arrow' backends of to_columns() need numpy installed") from None
+    lengths = np.frombuffer(unique_lengths, dtype=np.int64) if len(unique_lengths) else np.zeros(0, np.int64)
+    unique_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=unique_offsets[1:])
+    inverse = np.asarray(inverse, dtype=np.int64)
+
+    row_lengths = lengths[inverse]
+    offsets = np.zeros(len(inverse) + 1, dtype=np.int64)
+    np.cumsum(row_lengths, out=offsets[1:])
+    # position of every exported terrain type within the arrays of the distinct codes
+    take = np.repeat(unique_offsets[:-1][inverse] - offsets[:-1], row_lengths) + np.arange(offsets[-1])
+
+    fields = {}
+    for field, codes in unique_fields.items():
+        dtype = np.dtype(codes.typecode)
+        codes = np.frombuffer(codes, dtype=dtype) if len(codes) else np.zeros(0, dtype)
+        fields[field] = codes.take(take)
+    return offsets, fields
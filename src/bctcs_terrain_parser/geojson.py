@@ -0,0 +1,352 @@
+# Streaming enrichment of GeoJSON and newline-delimited GeoJSON terrain polygons
+#
+# Reads features one at a time, parses the terrain code property of each and writes the
+# feature back out with the descriptors of cli.OUTPUT_FIELDS added to its properties, e.g.
+#
+#   {"type": "Feature", "properties": {"terrain": "Cv", "terrain_types": 1,
+#    "surficial_material": "Colluvium (Active)", ...}, "geometry": {...}}
+#
+# Composite codes are written on one feature; the descriptors of each terrain type are
+# separated by ' / ' as in the command line tool. Empty descriptors are null.
+#
+# Features are never fully decoded. A small scanner finds the span of each feature and of its
+# "properties" member by matching brackets and skipping strings, only the code value is
+# decoded, and the new members are spliced in just before the closing brace of the
+# properties. Everything else, geometry included, is copied through byte for byte, so memory
+# use is bounded by the largest single feature. Rendered members are cached per code.
+#
+# A FeatureCollection is streamed from its "features" array; its other members are copied
+# through unchanged.
+#
+# USAGE:
+# ======
+#   python -m bctcs_terrain_parser.geojson polygons.geojson -o enriched.geojson --property terrain
+#   cat polygons.ndjson | python -m bctcs_terrain_parser.geojson --format ndjson > enriched.ndjson
+
+import argparse
+import functools
+import io
+import json
+import re
+import shutil
+import sys
+import time
+
+from .bctcs_terrain_parser import ENGINES
+from .cli import OUTPUT_FIELDS, enriched_fields
+
+_structure = re.compile(r'[{}\[\]"]')
+# a run of arrays holding no strings, objects or arrays, such as coordinate pairs
+_flat_arrays = re.compile(r'(?:\[[^{}\[\]"]*\][\s,]*)+')
+_string = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_scalar_end = re.compile(r'[\s,:}\]]')
+_separators = re.compile(r'[\s,:]*')
+_whitespace = re.compile(r'\s*')
+
+
+def _value_end(text: str, pos: int) -> int:
+    """
+    Index just past the JSON value starting at text[pos], or -1 if text ends before it does
+
+    >>> _value_end('{"a": [1, "]"]}, 2', 0)
+    15
+    """
+    char = text[pos]
+    if char == '"':
+        match = _string.match(text, pos)
+        return match.end() if match else -1
+    if char not in '{[':
+        match = _scalar_end.search(text, pos)
+        return match.start() if match else -1
+    depth = 0
+    search = _structure.search
+    while True:
+        match = search(text, pos)
+        if match is None:
+            return -1
+        char = match.group()
+        if char == '"':
+            string = _string.match(text, match.start())
+            if string is None:
+                return -1
+            pos = string.end()
+            continue
+        pos = match.end()
+        if char == '{' or char == '[':
+            depth += 1
+            flat = _flat_arrays.match(text, pos)
+            if flat is not None:
+                pos = flat.end()
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+
+
+def _members(text: str, start: int = 0):
+    """
+    Yields (key, value start, value end) for every member of the complete JSON object
+    starting at text[start]
+    """
+    pos = _whitespace.match(text, start + 1).end()
+    while text[pos] != '}':
+        key_end = _value_end(text, pos)
+        key = text[pos + 1:key_end - 1]
+        if '\\' in key:
+            key = json.loads(text[pos:key_end])
+        pos = _separators.match(text, key_end).end()
+        end = _value_end(text, pos)
+        yield key, pos, end
+        pos = _separators.match(text, end).end()
+
+
+@functools.lru_cache(maxsize=65536)
+def _rendered(terrain_code, engine: str = 'legacy') -> tuple:
+    """
+    Returns (members, unparsed terms): the JSON text of the OUTPUT_FIELDS members for a code
+
+    >>> _rendered('Cv')[0][:63]
+    '"terrain_types": 1, "surficial_material": "Colluvium (Active)",'
+    """
+    if isinstance(terrain_code, str):
+        fields = enriched_fields(terrain_code, engine)
+        values = [int(fields[0])] + [field or None for field in fields[1:]]
+    else:
+        fields = ('',)
+        values = [0] + [None] * (len(OUTPUT_FIELDS) - 1)
+    members = ', '.join('%s: %s' % (json.dumps(name), json.dumps(value))
+                        for name, value in zip(OUTPUT_FIELDS, values))
+    return members, fields[-1]
+
+
+def enrich_feature(text: str, code_property: str = 'terrain', strictmode: int = 0,
+                   engine: str = 'legacy', stats: dict = None) -> str:
+    """
+    Returns the JSON text of a single feature with the parsed descriptors of its terrain code
+    added to its properties; the rest of the text, geometry included, is left as it is.
+    stats, if given, is a dict whose 'features' and 'errors' counts are updated.
+
+    >>> feature = '{"type": "Feature", "properties": {"terrain": "Rs/Cv-A"}, "geometry": {"type": "Point", "coordinates": [1.50, 2]}}'
+    >>> enriched = enrich_feature(feature)
+    >>> enriched.endswith('"geometry": {"type": "Point", "coordinates": [1.50, 2]}}')
+    True
+    >>> json.loads(enriched)['properties']['geomorphological_processes']
+    ' / Snow avalanches (Active) '
+    >>> json.loads(enrich_feature('{"type": "Feature", "properties": {"terrain": ["Cv"]}, "geometry": null}'))['properties']['terrain_types']
+    0
+    """
+    properties = None
+    for key, start, end in _members(text):
+        if key == 'properties':
+            properties = (start, end)
+            break
+    if properties is None:
+        # no properties at all: add them at the end of the feature
+        end = text.rindex('}')
+        members, error_msg = _rendered(None, engine)
+        separator = ', ' if text[:end].rstrip()[-1] != '{' else ''
+        return '%s%s"properties": {%s}%s' % (text[:end].rstrip(), separator, members, text[end:])
+
+    start, end = properties
+    code = None
+    existing = False
+    if text[start] == '{':
+        for key, value_start, value_end in _members(text, start):
+            if key == code_property:
+                code = json.loads(text[value_start:value_end])
+                if not isinstance(code, str):
+                    # a list or object cannot be a code (nor a key of the _rendered cache)
+                    code = None
+            elif key in OUTPUT_FIELDS:
+                existing = True
+    members, error_msg = _rendered(code, engine)
+    if error_msg:
+        if strictmode == 1:
+            raise ValueError('%s: %s' % (code, error_msg))
+        if stats is not None:
+            stats['errors'] += 1
+    if stats is not None:
+        stats['features'] += 1
+
+    if text[start] != '{':
+        # "properties": null
+        return '%s{%s}%s' % (text[:start], members, text[end:])
+    if existing:
+        # enriched before: replace the old values, which needs the properties decoded
+        values = json.loads(text[start:end])
+        values.update(json.loads('{%s}' % members))
+        return text[:start] + json.dumps(values) + text[end:]
+    body = text[start:end - 1].rstrip()
+    separator = ', ' if body[-1] != '{' else ''
+    return '%s%s%s}%s' % (text[:start], body, separator + members, text[end:])
+
+
+def enrich_ndjson(infile, outfile, code_property: str = 'terrain', strictmode: int = 0,
+                  engine: str = 'legacy', stats: dict = None) -> None:
+    """
+    Enriches newline-delimited GeoJSON, one feature per line; blank lines are kept
+
+    >>> out = io.StringIO()
+    >>> enrich_ndjson(io.StringIO('{"properties": {"terrain": "Cv"}, "geometry": null}\\n'), out)
+    >>> json.loads(out.getvalue())['properties']['surficial_material']
+    'Colluvium (Active)'
+    """
+    for line in infile:
+        stripped = line.strip()
+        if stripped:
+            line = line.replace(stripped, enrich_feature(stripped, code_property, strictmode, engine, stats), 1)
+        outfile.write(line)
+
+
+class _Reader:
+    """
+    Sliding text buffer over a stream; text[pos:] is what has not been written out yet
+    """
+
+    def __init__(self, infile, outfile, chunksize: int) -> None:
+        self.infile = infile
+        self.outfile = outfile
+        self.chunksize = chunksize
+        self.text = ''
+        self.pos = 0
+
+    def more(self) -> bool:
+        chunk = self.infile.read(self.chunksize)
+        if not chunk:
+            return False
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def copy_to(self, end: int) -> None:
+        self.outfile.write(self.text[self.pos:end])
+        self.pos = end
+
+    def skip(self) -> str:
+        """
+        Copies whitespace, ',' and ':' through and returns the next character ('' at the end)
+        """
+        while True:
+            self.copy_to(_separators.match(self.text, self.pos).end())
+            if self.pos < len(self.text) or not self.more():
+                return self.text[self.pos:self.pos + 1]
+
+    def value(self) -> int:
+        """
+        End of the JSON value at pos, reading more of the stream as needed
+        """
+        while True:
+            end = _value_end(self.text, self.pos)
+            if end >= 0:
+                return end
+            if not self.more():
+                raise ValueError('unexpected end of GeoJSON input')
+
+
+def enrich_feature_collection(infile, outfile, code_property: str = 'terrain', strictmode: int = 0,
+                              engine: str = 'legacy', stats: dict = None, chunksize: int = 1 << 20) -> None:
+    """
+    Enriches a GeoJSON FeatureCollection feature by feature, reading chunksize characters at
+    a time; members other than "features" are copied through unchanged
+
+    >>> out = io.StringIO()
+    >>> collection = '{"type": "FeatureCollection", "features": [{"properties": {"terrain": "Mb"}, "geometry": null}]}'
+    >>> enrich_feature_collection(io.StringIO(collection), out, chunksize=7)
+    >>> json.loads(out.getvalue())['features'][0]['properties']['surficial_material']
+    'Morainal Material(Till) (Inactive)'
+    """
+    reader = _Reader(infile, outfile, chunksize)
+    if reader.skip() != '{':
+        raise ValueError('expected a GeoJSON FeatureCollection object')
+    reader.copy_to(reader.pos + 1)
+    while True:
+        char = reader.skip()
+        if char in ('}', ''):
+            break
+        end = reader.value()
+        key = json.loads(reader.text[reader.pos:end])
+        reader.copy_to(end)
+        if key == 'features' and reader.skip() == '[':
+            reader.copy_to(reader.pos + 1)
+            while True:
+                char = reader.skip()
+                if char == ']':
+                    reader.copy_to(reader.pos + 1)
+                    break
+                if char == '':
+                    raise ValueError('unexpected end of GeoJSON input')
+                end = reader.value()
+                outfile.write(enrich_feature(reader.text[reader.pos:end], code_property, strictmode,
+                                             engine, stats))
+                reader.pos = end
+        else:
+            reader.skip()
+            reader.copy_to(reader.value())
+    reader.copy_to(len(reader.text))
+    shutil.copyfileobj(infile, outfile)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m bctcs_terrain_parser.geojson',
+                                     description='Add English descriptions of BC Terrain Classification '
+                                                 'System codes to GeoJSON or NDJSON features.')
+    parser.add_argument('input', nargs='?', default='-', help="input file (default '-' reads stdin)")
+    parser.add_argument('-o', '--output', default='-', help="output file (default '-' writes stdout)")
+    parser.add_argument('-p', '--property', default='terrain',
+                        help="name of the property holding terrain codes (default 'terrain')")
+    parser.add_argument('--format', choices=['geojson', 'ndjson'],
+                        help='input format (default: ndjson for .ndjson/.geojsonl/.jsonl inputs, '
+                             'geojson otherwise)')
+    parser.add_argument('--strict', action='store_true',
+                        help='stop with an error at the first code with unparsed terms')
+    parser.add_argument('--engine', choices=list(ENGINES), default='legacy',
+                        help="parse engine (default 'legacy')")
+    parser.add_argument('--encoding', default='utf-8', help="text encoding (default 'utf-8')")
+    parser.add_argument('--stats', action='store_true',
+                        help='report features/sec and error count on stderr')
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        fmt = 'ndjson' if args.input.lower().endswith(('.ndjson', '.geojsonl', '.jsonl')) else 'geojson'
+    if args.input == '-':
+        infile = io.TextIOWrapper(sys.stdin.buffer, encoding=args.encoding)
+    else:
+        infile = open(args.input, encoding=args.encoding)
+    if args.output == '-':
+        outfile = io.TextIOWrapper(sys.stdout.buffer, encoding=args.encoding, write_through=False)
+    else:
+        outfile = open(args.output, 'w', encoding=args.encoding, buffering=1 << 16)
+
+    enrich = enrich_ndjson if fmt == 'ndjson' else enrich_feature_collection
+    stats = dict(features=0, errors=0)
+    start = time.perf_counter()
+    try:
+        enrich(infile, outfile, args.property, strictmode=1 if args.strict else 0, engine=args.engine,
+               stats=stats)
+    except ValueError as e:
+        print('error: %s' % e, file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        return 1
+    finally:
+        for stream, path in ((infile, args.input), (outfile, args.output)):
+            try:
+                if path == '-':
+                    stream.flush()
+                    stream.detach()
+                else:
+                    stream.close()
+            except (BrokenPipeError, ValueError):
+                pass
+
+    if args.stats:
+        elapsed = time.perf_counter() - start
+        rate = stats['features'] / elapsed if elapsed > 0 else float('inf')
+        print('features: %d  seconds: %.3f  features/sec: %.0f  errors: %d'
+              % (stats['features'], elapsed, rate, stats['errors']), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
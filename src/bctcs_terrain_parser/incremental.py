@@ -0,0 +1,300 @@
+# Incremental re-enrichment of terrain layers from a change manifest
+#
+# Layers are edited a few hundred polygons at a time, so a nightly run does not need to parse
+# every feature again. A manifest, kept next to the enriched output, records for every feature
+# the hash of its code and the engine and version_hash() that produced its descriptors. The
+# next run compares the new (feature id, code) table with it and:
+#
+#   added      features not in the manifest                        parsed
+#   changed    features whose code hash differs                    parsed
+#   deleted    features of the manifest missing from the table     dropped
+#   reparsed   same code, but made by another parser or vocabulary parsed again if affected (see
+#              below); reported only if its descriptors actually differ
+#   unchanged  everything else                                     copied from the previous output
+#
+# Each distinct code is parsed at most once per run. The result is either the full, updated
+# output (the same columns as the command line tool) or a delta with a leading 'change' column
+# and one row per added, changed, reparsed or deleted feature. Either way the rewritten
+# manifest describes the full output with the changes applied, so after a delta run the next
+# run's --previous must be the previous output updated with that delta.
+#
+# VOCABULARY CHANGES:
+# ===================
+# Next to the manifest, '<manifest>.vocabulary.json' keeps the vocabulary dictionaries behind
+# its version. After a vocabulary change only the codes that contain every letter (in either
+# case) of a code added, removed or redescribed in some dictionary are parsed again: adding a
+# 'W' material re-parses the codes with a 'W' or 'w' only. The other codes are copied from the
+# previous output.
+# Everything is parsed again when the engine or PARSER_REVISION changed, or when that file is
+# missing or does not match the manifest.
+#
+# USAGE:
+# ======
+#   python -m bctcs_terrain_parser.incremental layer.csv --previous enriched.csv \
+#       --manifest enriched.manifest.csv -o enriched.csv
+#   python -m bctcs_terrain_parser.incremental layer.csv --previous enriched.csv \
+#       --manifest enriched.manifest.csv -o changes.csv --delta
+#
+# Give --vocabulary on every run if the layer is parsed with another vocabulary.
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+
+from . import bctcs_terrain_parser as _parser
+from .bctcs_terrain_parser import ENGINES, VOCABULARIES, _engine, _terms_hash, version_hash
+from .cli import OUTPUT_FIELDS, enriched_fields
+from .vocabulary import Vocabulary, use
+
+MANIFEST_FIELDS = ['feature_id', 'code_hash', 'engine', 'version']
+
+CHANGES = ('added', 'changed', 'deleted', 'reparsed', 'unchanged')
+
+
+def code_hash(terrain_code: str) -> str:
+    """
+    Short, stable hash of a terrain code
+
+    >>> code_hash('Cv')
+    'b12accb2880d36b7'
+    """
+    return hashlib.blake2b(terrain_code.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def read_manifest(path: str) -> dict:
+    """
+    Reads a manifest file into a dict of feature id -> (code hash, engine, version); a missing
+    file gives an empty manifest
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = csv.reader(f)
+        if next(rows, None) != MANIFEST_FIELDS:
+            raise ValueError('%s: not a terrain manifest (expected columns %s)' % (path, ', '.join(MANIFEST_FIELDS)))
+        return {row[0]: tuple(row[1:4]) for row in rows if len(row) >= 4}
+
+
+def write_manifest(path: str, manifest: dict) -> None:
+    """
+    Writes a manifest, replacing the file only once it is complete, and the vocabulary in
+    use to '<path>.vocabulary.json'
+    """
+    terms = {name: getattr(_parser, name) for name in VOCABULARIES}
+    for target, write in ((path + '.vocabulary.json',
+                           lambda f: json.dump(dict(version=version_hash(), terms=terms), f, ensure_ascii=False)),
+                          (path, lambda f: _write_manifest_rows(f, manifest))):
+        temporary = target + '.tmp'
+        with open(temporary, 'w', newline='', encoding='utf-8') as f:
+            write(f)
+        os.replace(temporary, target)
+
+
+def _write_manifest_rows(f, manifest: dict) -> None:
+    writer = csv.writer(f, lineterminator='\n')
+    writer.writerow(MANIFEST_FIELDS)
+    writer.writerows([feature_id] + list(entry) for feature_id, entry in manifest.items())
+
+
+def read_vocabularies(path: str) -> dict:
+    """
+    Reads the vocabulary written next to a manifest; returns {version: dictionaries by name},
+    empty if the file is missing or was written by another parser revision
+    """
+    try:
+        with open(path + '.vocabulary.json', encoding='utf-8') as f:
+            data = json.load(f)
+        terms = data['terms']
+        if _terms_hash(terms) == data['version']:
+            return {data['version']: terms}
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return {}
+
+
+def changed_codes(old: dict, new: dict) -> list:
+    """
+    Returns the letters of every code added, removed or redescribed between two sets of
+    vocabulary dictionaries, as frozensets of lowercase letters
+
+    >>> old = {name: dict(getattr(_parser, name)) for name in VOCABULARIES}
+    >>> new = dict(old, surficial_material_terms=dict(old['surficial_material_terms'], W='Wet'))
+    >>> changed_codes(old, new)
+    [frozenset({'w'})]
+    """
+    changed = []
+    for name in VOCABULARIES:
+        before, after = old.get(name, {}), new.get(name, {})
+        for code in before.keys() | after.keys():
+            if before.get(code) != after.get(code):
+                changed.append(frozenset(code.lower()))
+    return changed
+
+
+def _columns(header: list, id_column: str, column: str) -> tuple:
+    try:
+        return header.index(id_column), header.index(column)
+    except ValueError:
+        raise ValueError('columns %r and %r expected in header %r' % (id_column, column, header)) from None
+
+
+def previous_fields(rows, manifest: dict, id_column: str = 'fid', column: str = 'terrain') -> dict:
+    """
+    Reads previously enriched rows (the first one being the header) and returns their
+    descriptors by (code, engine, version) that produced them, one entry per distinct code
+
+    >>> manifest = {'1': (code_hash('Cv'), 'legacy', 'v1')}
+    >>> previous = previous_fields([['fid', 'terrain'] + OUTPUT_FIELDS, ['1', 'Cv'] + list(enriched_fields('Cv'))], manifest)
+    >>> list(previous)
+    [('Cv', 'legacy', 'v1')]
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return {}
+    if header[-len(OUTPUT_FIELDS):] != OUTPUT_FIELDS:
+        raise ValueError('the previous output does not end with the columns %s' % ', '.join(OUTPUT_FIELDS))
+    id_index, column_index = _columns(header, id_column, column)
+    previous = {}
+    for row in rows:
+        if len(row) != len(header):
+            continue
+        entry = manifest.get(row[id_index])
+        code = row[column_index]
+        if entry is not None and entry[0] == code_hash(code):
+            previous.setdefault((code, entry[1], entry[2]), tuple(row[-len(OUTPUT_FIELDS):]))
+    return previous
+
+
+def incremental_rows(rows, manifest: dict, previous: dict, id_column: str = 'fid', column: str = 'terrain',
+                     delta: bool = False, engine: str = 'legacy', counts: dict = None, vocabularies: dict = None):
+    """
+    Generator taking the rows of the new table (the first one being the header) and yielding
+    the full enriched output, or only the changes if delta is true. manifest is updated in
+    place to describe the new output; counts, if given, receives the number of features of
+    every kind in CHANGES. vocabularies (see read_vocabularies) holds the dictionaries behind
+    earlier versions, so that a vocabulary change re-parses only the codes it affects.
+
+    >>> manifest = {'1': (code_hash('Cv'), 'legacy', version_hash()), '2': (code_hash('Mb'), 'legacy', version_hash())}
+    >>> previous = {('Cv', 'legacy', version_hash()): enriched_fields('Cv')}
+    >>> rows = [['fid', 'terrain'], ['1', 'Cv'], ['3', 'Rs']]
+    >>> [row[:3] for row in incremental_rows(rows, manifest, previous, delta=True)]
+    [['change', 'fid', 'terrain'], ['added', '3', 'Rs'], ['deleted', '2', '']]
+    >>> sorted(manifest)
+    ['1', '3']
+    """
+    _engine(engine)
+    version = version_hash()
+    terms = {name: getattr(_parser, name) for name in VOCABULARIES}
+    vocabularies = vocabularies or {}
+    if counts is None:
+        counts = {}
+    counts.update(dict.fromkeys(CHANGES, 0))
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    id_index, column_index = _columns(header, id_column, column)
+    yield (['change'] if delta else []) + header + OUTPUT_FIELDS
+
+    parsed = {}       # descriptors of every code parsed in this run
+    changes = {}      # (engine, version) of the manifest -> changed_codes(), None if unknown
+
+    def parse(code: str) -> tuple:
+        fields = parsed.get(code)
+        if fields is None:
+            fields = parsed[code] = enriched_fields(code, engine)
+        return fields
+
+    seen = set()
+    for row in rows:
+        feature_id = row[id_index] if id_index < len(row) else ''
+        code = row[column_index] if column_index < len(row) else ''
+        hashed = code_hash(code)
+        entry = manifest.get(feature_id)
+        fields = None
+        if entry is None:
+            change = 'added'
+        elif entry[0] != hashed:
+            change = 'changed'
+        else:
+            fields = previous.get((code, entry[1], entry[2]))
+            change = 'unchanged'
+            if (entry[1], entry[2]) != (engine, version):
+                # made by another parser or vocabulary: parse again where it may differ
+                made_by = entry[1:3]
+                if made_by not in changes:
+                    changes[made_by] = (changed_codes(vocabularies[entry[2]], terms)
+                                        if entry[1] == engine and entry[2] in vocabularies else None)
+                changed = changes[made_by]
+                letters = set(code.lower())
+                if fields is None or changed is None or any(codes <= letters for codes in changed):
+                    reparsed = parse(code)
+                    if fields != reparsed:
+                        change = 'reparsed'
+                    fields = reparsed
+        if fields is None:
+            fields = parse(code)
+        seen.add(feature_id)
+        manifest[feature_id] = (hashed, engine, version)
+        counts[change] += 1
+        if not delta:
+            yield row + list(fields)
+        elif change != 'unchanged':
+            yield [change] + row + list(fields)
+
+    for feature_id in [feature_id for feature_id in manifest if feature_id not in seen]:
+        del manifest[feature_id]
+        counts['deleted'] += 1
+        if delta:
+            deleted = [''] * (len(header) + len(OUTPUT_FIELDS))
+            deleted[id_index] = feature_id
+            yield ['deleted'] + deleted
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m bctcs_terrain_parser.incremental',
+                                     description='Re-enrich only the features of a CSV layer that changed.')
+    parser.add_argument('input', help='CSV table of feature ids and terrain codes')
+    parser.add_argument('--previous', help='enriched output of the previous run')
+    parser.add_argument('--manifest', required=True, help='manifest of the previous run, rewritten for this one')
+    parser.add_argument('-o', '--output', default='-', help="output CSV (default '-' writes stdout)")
+    parser.add_argument('--delta', action='store_true', help='write only added, changed, reparsed and deleted features')
+    parser.add_argument('-i', '--id-column', default='fid', help="feature id column (default 'fid')")
+    parser.add_argument('-c', '--column', default='terrain', help="terrain code column (default 'terrain')")
+    parser.add_argument('--engine', choices=list(ENGINES), default='legacy')
+    parser.add_argument('--vocabulary', metavar='PATH', help='JSON vocabulary file (see vocabulary.py)')
+    args = parser.parse_args(argv)
+
+    counts = {}
+    try:
+        if args.vocabulary:
+            use(Vocabulary.load(args.vocabulary))
+        manifest = read_manifest(args.manifest)
+        vocabularies = read_vocabularies(args.manifest)
+        previous = {}
+        if args.previous and os.path.exists(args.previous):
+            with open(args.previous, newline='', encoding='utf-8') as f:
+                previous = previous_fields(csv.reader(f), manifest, args.id_column, args.column)
+        with open(args.input, newline='', encoding='utf-8') as infile:
+            out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+            try:
+                csv.writer(out, lineterminator='\n').writerows(
+                    incremental_rows(csv.reader(infile), manifest, previous, args.id_column, args.column,
+                                     args.delta, args.engine, counts, vocabularies))
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+        write_manifest(args.manifest, manifest)
+    except (OSError, ValueError) as e:
+        print('error: %s' % e, file=sys.stderr)
+        return 1
+    print('  '.join('%s: %d' % (change, counts.get(change, 0)) for change in CHANGES), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
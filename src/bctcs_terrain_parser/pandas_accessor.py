@@ -0,0 +1,128 @@
+# pandas accessor for columns of BC Terrain Classification System codes
+#
+# Importing this module registers a `bctcs` accessor on pandas Series:
+#
+#   import bctcs_terrain_parser.pandas_accessor
+#   df['terrain'].bctcs.parse()        # DataFrame of descriptors, one row per input row
+#   df['terrain'].bctcs.material()     # categorical surficial material of the first terrain type
+#   df['terrain'].bctcs.processes()    # categorical geomorphological processes
+#
+# Unlike df['terrain'].apply(lambda c: Terrain(c).json()), the column is factorized first,
+# every distinct code is parsed once and the results are expanded back to the rows with
+# vectorized take operations into categorical columns.
+#
+# Descriptors that are empty (or rows whose code is missing or not a string) come back as NaN.
+# Composite codes give the descriptors of all terrain types joined with ' / ' unless a
+# component (0 for the first terrain type) is asked for.
+
+import numpy as np
+import pandas as pd
+
+from .bctcs_terrain_parser import TerrainComponent, _parse_unique
+
+# Descriptor columns returned by TerrainAccessor.parse()
+FIELDS = TerrainComponent._fields[:7]
+
+
+@pd.api.extensions.register_series_accessor('bctcs')
+class TerrainAccessor:
+    """
+    Parses a Series of BC Terrain Classification System codes
+
+    >>> s = pd.Series(['Cv', 'Rs/Cv-A', None, 'Cv'])
+    >>> s.bctcs.material().tolist()
+    ['Colluvium (Active)', 'Bedrock (Activity status n/a)', nan, 'Colluvium (Active)']
+    >>> s.bctcs.processes().tolist()
+    [nan, ' / Snow avalanches (Active) ', nan, nan]
+    >>> s.bctcs.parse()['terrain_types'].tolist()
+    [1, 2, 0, 1]
+    >>> pd.Series(['Cv', 3.0, 'Cv']).bctcs.material().tolist()
+    ['Colluvium (Active)', nan, 'Colluvium (Active)']
+    """
+
+    def __init__(self, series: pd.Series) -> None:
+        self._series = series
+
+    def _unique(self, strictmode: int, engine: str) -> tuple:
+        """
+        Factorizes the series and parses its distinct codes; returns (row codes, entries)
+        """
+        codes, uniques = pd.factorize(self._series)
+        # values that are not strings (e.g. numbers in an object column) are missing codes
+        is_code = np.array([isinstance(code, str) for code in uniques], dtype=bool)
+        if not is_code.all():
+            positions = np.where(is_code, np.cumsum(is_code) - 1, -1)
+            codes = np.where(codes >= 0, positions.take(np.maximum(codes, 0)), -1)
+            uniques = uniques[is_code]
+        unique_codes, entries, inverse = _parse_unique(uniques, engine)
+        if strictmode == 1:
+            for components, error_msg in entries:
+                if error_msg:
+                    raise ValueError(error_msg)
+        # factorize has already made uniques distinct, so inverse is the identity
+        return codes, entries
+
+    def _expand(self, codes: np.ndarray, values: list) -> pd.Series:
+        """
+        Expands one value per distinct code to a categorical Series aligned with the input
+        """
+        value_codes, categories = pd.factorize(pd.Series(values, dtype=object))
+        row_codes = np.where(codes >= 0, value_codes.take(np.maximum(codes, 0)) if len(value_codes) else -1, -1)
+        categorical = pd.Categorical.from_codes(row_codes, categories=categories)
+        return pd.Series(categorical, index=self._series.index, name=self._series.name)
+
+    @staticmethod
+    def _value(components: tuple, i: int, component: int):
+        if component is None:
+            value = ' / '.join(part[i] for part in components)
+            return value if any(part[i] for part in components) else None
+        if -len(components) <= component < len(components):
+            return components[component][i] or None
+        return None
+
+    def field(self, name: str, component: int = None, strictmode: int = 0,
+              engine: str = 'legacy') -> pd.Series:
+        """
+        One descriptor (a name from FIELDS) as a categorical Series. component selects a single
+        terrain type of composite codes (0 for the first); by default all are joined with ' / '.
+        """
+        i = FIELDS.index(name)
+        codes, entries = self._unique(strictmode, engine)
+        values = [self._value(components, i, component) for components, error_msg in entries]
+        return self._expand(codes, values)
+
+    def material(self, component: int = 0, **kwargs) -> pd.Series:
+        """
+        Surficial material of the first terrain type (or of the given component)
+        """
+        return self.field('surficial_material', component, **kwargs)
+
+    def expression(self, component: int = None, **kwargs) -> pd.Series:
+        return self.field('surface_expression', component, **kwargs)
+
+    def texture(self, component: int = None, **kwargs) -> pd.Series:
+        return self.field('texture', component, **kwargs)
+
+    def processes(self, component: int = None, **kwargs) -> pd.Series:
+        return self.field('geomorphological_processes', component, **kwargs)
+
+    def parse(self, component: int = None, strictmode: int = 0, engine: str = 'legacy') -> pd.DataFrame:
+        """
+        DataFrame with the number of terrain types and every descriptor in FIELDS for each row.
+        Codes with unparsed terms raise a ValueError when strictmode is 1; otherwise the
+        problem is reported in the 'unparsed_terms' column.
+
+        >>> pd.Series(['Mbv', 'oNTA']).bctcs.parse()[['surficial_material', 'unparsed_terms']].values.tolist()
+        [['Morainal Material(Till) (Inactive)', nan], [nan, 'NT: undefined surficial material code; o: undefined texture codes']]
+        """
+        codes, entries = self._unique(strictmode, engine)
+        lengths = np.array([len(components) for components, error_msg in entries] or [0], dtype=np.int64)
+        columns = {'terrain_types': pd.Series(np.where(codes >= 0, lengths.take(np.maximum(codes, 0)), 0),
+                                              index=self._series.index)}
+        for i, name in enumerate(FIELDS):
+            if name == 'unparsed_terms':
+                values = [error_msg or None for components, error_msg in entries]
+            else:
+                values = [self._value(components, i, component) for components, error_msg in entries]
+            columns[name] = self._expand(codes, values)
+        return pd.DataFrame(columns, index=self._series.index)
@@ -0,0 +1,139 @@
+# Persistent parse cache for warm starts across runs
+#
+# Stores interpreted codes in a local SQLite file, keyed on (version hash, engine, code), so a
+# nightly run over a layer that has barely changed starts with its parse cache already full:
+#
+#   with PersistentCache('parse-cache.sqlite') as cache:
+#       cache.load()                       # fill the in-memory cache in one query
+#       results = parse_many(df['terrain'])
+#       cache.save()                       # store what was parsed this time
+#
+# An open PersistentCache records every code interpreted in this process, so save() stores all
+# of them (and whatever the in-memory cache still holds), not only the codes the in-memory
+# cache has not evicted yet. Saved codes are no longer held by the recording.
+#
+# Entries are stored under version_hash(), so they are ignored automatically (and dropped by
+# the next save) once the parser or any vocabulary dictionary changes. As in memory, one
+# entry holds the descriptors and the unparsed terms of a code, which serves strict and
+# non-strict callers alike, so strictmode is not part of the key.
+#
+# load() adds at most as many codes as the in-memory cache holds; raise its size with
+# set_cache_maxsize() first for layers with more distinct codes than that.
+
+import json
+import sqlite3
+
+from .bctcs_terrain_parser import (_cache_entries, _cache_fill, _engine, _start_recording, _stop_recording,
+                                   _take_recorded, version_hash)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (version TEXT NOT NULL, engine TEXT NOT NULL, code TEXT NOT NULL,
+                                    data TEXT NOT NULL, PRIMARY KEY (version, engine, code)) WITHOUT ROWID;
+'''
+
+
+def _encode(entry: tuple) -> str:
+    components, error_msg = entry
+    return json.dumps([error_msg] + [value for component in components for value in component])
+
+
+def _decode(data: str) -> tuple:
+    flat = json.loads(data)
+    return tuple(tuple(flat[k:k + 8]) for k in range(1, len(flat), 8)), flat[0]
+
+
+class PersistentCache:
+    """
+    On-disk store of interpreted codes ('path' is a file name or ':memory:')
+
+    >>> from .bctcs_terrain_parser import Terrain, cache_clear, cache_info
+    >>> cache = PersistentCache()
+    >>> cache_clear()
+    >>> Terrain('Cv').json() == Terrain('Rs/Cv-A').json()
+    False
+    >>> cache.save()
+    2
+    >>> cache_clear()
+    >>> cache.load()
+    2
+    >>> Terrain('Rs/Cv-A').parsed == [list(component) for component in Terrain('Rs/Cv-A').components]
+    True
+    >>> cache_info().misses
+    0
+    >>> cache.close()
+
+    Codes evicted from the in-memory cache are saved as well:
+
+    >>> from .bctcs_terrain_parser import set_cache_maxsize
+    >>> cache = PersistentCache()
+    >>> cache_clear()
+    >>> set_cache_maxsize(1)
+    >>> Terrain('Cv').json() == Terrain('Mb').json()
+    False
+    >>> cache.save()
+    2
+    >>> set_cache_maxsize()
+    >>> cache.close()
+    """
+
+    def __init__(self, path: str = ':memory:') -> None:
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(_SCHEMA)
+        self._recorded = _start_recording()
+
+    def __enter__(self) -> 'PersistentCache':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        _stop_recording(self._recorded)
+        self._connection.close()
+
+    def __len__(self) -> int:
+        """
+        Number of stored codes valid for the current parser and vocabularies
+        """
+        return self._connection.execute('SELECT count(*) FROM entries WHERE version = ?',
+                                        (version_hash(),)).fetchone()[0]
+
+    def load(self, engine: str = 'legacy') -> int:
+        """
+        Fills the in-memory parse cache with the stored codes of an engine; returns how many
+        """
+        from .bctcs_terrain_parser import _cache_maxsize
+        _engine(engine)
+        sql = 'SELECT code, data FROM entries WHERE version = ? AND engine = ?'
+        parameters = [version_hash(), engine]
+        if _cache_maxsize is not None:
+            sql += ' LIMIT ?'
+            parameters.append(_cache_maxsize)
+        rows = self._connection.execute(sql, parameters)
+        return _cache_fill(engine, ((code, _decode(data)) for code, data in rows))
+
+    def save(self, engine: str = 'legacy') -> int:
+        """
+        Stores the codes of an engine interpreted since the last save (or since this cache was
+        opened) and those held in the in-memory parse cache, and drops entries made by other
+        parser or vocabulary versions; returns the number of codes written
+        """
+        _engine(engine)
+        version = version_hash()
+        entries = dict(_cache_entries(engine))
+        entries.update(_take_recorded(self._recorded, engine))
+        with self._connection:
+            self._connection.execute('DELETE FROM entries WHERE version != ?', (version,))
+            before = self._connection.total_changes
+            self._connection.executemany('INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?)',
+                                         [(version, engine, code, _encode(entry))
+                                          for code, entry in entries.items()])
+            return self._connection.total_changes - before
+
+    def clear(self) -> None:
+        """
+        Removes every stored code
+        """
+        with self._connection:
+            self._connection.execute('DELETE FROM entries')
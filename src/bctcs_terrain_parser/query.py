@@ -0,0 +1,376 @@
+# Bitmask encoding of BC Terrain Classification System codes and fast predicate queries
+#
+# encode() turns every terrain type of a column of codes into a handful of integers:
+#
+#   material    : ID of the surficial material letters (index in surficial_material_terms + 1,
+#                 0 if blank or undefined)
+#   expression  : bitmask of surface expression letters
+#   texture     : bitmask of texture letters
+#   process     : bitmask of geomorphological process letters
+#   subclass    : bitmask of process subclass letters; letters of processes sharing a subclass
+#                 dictionary share bits (e.g. '-Bp' and '-Mp'), so test the process as well
+#   extent      : EXTENT_FLAGS of the terrain type
+#
+# Questions such as "which polygons are Colluvium with rapid mass movements?" then become
+# bitwise operations over those arrays instead of parsing and substring checks:
+#
+#   encoded = encode(df['terrain'], backend='numpy')
+#   rows = (material('C') & has_process('R')).rows(encoded)
+#
+# Predicates test one terrain type at a time; a row (code) matches if any of its terrain
+# types matches. Combine predicates with &, | and ~ before calling rows().
+#
+# The IDs and bits follow the order of the installed vocabulary and are rebuilt by
+# vocabulary.use(), so encode again after switching vocabularies. The material column holds
+# IDs up to 127 and the bitmask columns 63 bits, so encode() raises a ValueError for a
+# vocabulary with more surficial materials or letters than that.
+#
+# Codes are read as the parser reads them, so that a predicate matches the terrain types whose
+# parsed descriptions it names (the legacy engine differs on the few codes described under
+# SINGLE-PASS TOKENIZER ENGINE in bctcs_terrain_parser.py):
+#   - material qualifiers ('F^G') are read as material letters and process qualifiers ('-F^I')
+#     are ignored
+#   - only the first lowercase letter after a process letter is its subclass ('-Rdb' is debris
+#     flow), and only if its uppercase form is a process letter; the parser skips others
+#   - lowercase letters after the process letters are also read as surface expression
+#     ('Cv-Rd' is 'veneer depression(s)' with debris flow)
+
+from array import array
+from collections import namedtuple
+
+from .bctcs_terrain_parser import (surficial_material_terms, surface_expression_terms,
+                                   textural_terms, geomorphological_process_terms,
+                                   slow_mass_movement_F_subclass_terms,
+                                   rapid_mass_movement_R_subclass_terms,
+                                   snow_avalanches_A_subclass_terms,
+                                   fluvial_B_I_J_M_subclass_terms,
+                                   permafrost_X_Z_subclass_terms,
+                                   _index_unique, _split_activity_modifier, _split_composite,
+                                   _strip_qualifiers, _tokenize_component)
+from .columnar import _expand_array, _expand_numpy
+
+# Largest material ID and number of bits held by the columns of encode() ('b' and 'q' arrays)
+_MAX_MATERIAL_ID = 127
+_MAX_BITS = 63
+
+MATERIAL_IDS = {}
+EXPRESSION_BITS = {}
+TEXTURE_BITS = {}
+PROCESS_BITS = {}
+# (process letter, subclass letter) -> bit
+SUBCLASS_BITS = {}
+
+# Why encode() cannot encode codes of the installed vocabulary, or None
+_unencodable = None
+
+
+def _build_encodings() -> None:
+    """
+    Fills the encoding tables above from the installed vocabulary. They are updated in place,
+    so modules that imported them see the new codes; vocabulary.use() calls this again.
+    """
+    global _unencodable
+    MATERIAL_IDS.clear()
+    MATERIAL_IDS.update((letters, i + 1) for i, letters in enumerate(surficial_material_terms))
+    for table, terms in ((EXPRESSION_BITS, surface_expression_terms), (TEXTURE_BITS, textural_terms),
+                         (PROCESS_BITS, geomorphological_process_terms)):
+        table.clear()
+        table.update((letter, 1 << i) for i, letter in enumerate(terms))
+    SUBCLASS_BITS.clear()
+    bit = 0
+    for letters, terms in (('F', slow_mass_movement_F_subclass_terms),
+                           ('R', rapid_mass_movement_R_subclass_terms),
+                           ('A', snow_avalanches_A_subclass_terms),
+                           ('BIJM', fluvial_B_I_J_M_subclass_terms),
+                           ('XZ', permafrost_X_Z_subclass_terms)):
+        for subclass in terms:
+            for letter in letters:
+                SUBCLASS_BITS[(letter, subclass)] = 1 << bit
+            bit += 1
+
+    _unencodable = None
+    if len(MATERIAL_IDS) > _MAX_MATERIAL_ID:
+        _unencodable = '%d surficial materials' % len(MATERIAL_IDS)
+    for name, count in (('surface expression', len(EXPRESSION_BITS)), ('texture', len(TEXTURE_BITS)),
+                        ('geomorphological process', len(PROCESS_BITS)), ('process subclass', bit)):
+        if count > _MAX_BITS:
+            _unencodable = '%d %s letters' % (count, name)
+    if _unencodable:
+        _unencodable = ('the vocabulary defines %s, more than encode() can hold (%d surficial materials, '
+                        '%d letters of each kind)' % (_unencodable, _MAX_MATERIAL_ID, _MAX_BITS))
+
+
+_build_encodings()
+
+EXTENT_FLAGS = {
+    'continuous': 1,
+    'discontinuous': 2,
+    'equal': 4,           # '=' equal extent relative to next terrain type
+    'greater': 8,         # '/' greater extent relative to next terrain type
+    'much greater': 16,   # '//' much greater extent relative to next terrain type
+}
+
+ENCODED_FIELDS = ('material', 'expression', 'texture', 'process', 'subclass', 'extent')
+
+EncodedTerrain = namedtuple('EncodedTerrain', ('offsets',) + ENCODED_FIELDS)
+EncodedTerrain.__doc__ = """
+Encoded terrain types of a column of codes: one integer per terrain type in each of
+ENCODED_FIELDS, and offsets[i]:offsets[i+1] selecting the terrain types of the i-th code
+"""
+
+
+def _read_component(string: str) -> tuple:
+    """
+    Reads the string of a single terrain type as the parser does (see above); returns
+    (material, texture letters, expression letters, processes) where processes is a list of
+    (process letter, subclass letter or '')
+
+    >>> _read_component('Cv-Rdb')
+    ('C', [], ['v', 'd', 'b'], [('R', 'd')])
+    >>> _read_component('sgF^GAt-Fg')
+    ('FG', ['s', 'g'], ['t', 'g'], [('F', '')])
+    """
+    if '^' in string:
+        # qualifiers: material ones become material letters, process ones are dropped
+        string = _strip_qualifiers(string)[0]
+    material, texture, expression, tokens = _tokenize_component(string)[:4]
+    processes = []
+    for i, token in enumerate(tokens):
+        if token.isupper():
+            # the tokens hold defined process letters and the lowercase letters that can follow them
+            subclass = tokens[i + 1] if i + 1 < len(tokens) and tokens[i + 1].islower() else ''
+            processes.append((token, subclass))
+    return _split_activity_modifier(material)[0], texture, expression, processes
+
+
+def encode_component(string: str) -> tuple:
+    """
+    Encodes the string of a single terrain type as a tuple of ENCODED_FIELDS
+
+    >>> material_id, expression, texture, process, subclass, extent = encode_component('Cv-Rd')
+    >>> material_id == MATERIAL_IDS['C'], expression == EXPRESSION_BITS['v'] | EXPRESSION_BITS['d']
+    (True, True)
+    >>> process == PROCESS_BITS['R'], subclass == SUBCLASS_BITS[('R', 'd')]
+    (True, True)
+    >>> encode_component('Cv-Rdb')[4] == SUBCLASS_BITS[('R', 'd')]
+    True
+    >>> material_id, expression, texture, process = encode_component('sgF^Gt-F^I')[:4]
+    >>> material_id == MATERIAL_IDS['FG'], process == PROCESS_BITS['F']
+    (True, True)
+    """
+    material, texture, expression, processes = _read_component(string)
+    if '^' in string:
+        string = _strip_qualifiers(string)[0]
+
+    expression_mask = 0
+    for letter in expression:
+        expression_mask |= EXPRESSION_BITS.get(letter, 0)
+    texture_mask = 0
+    for letter in texture:
+        texture_mask |= TEXTURE_BITS.get(letter, 0)
+    process_mask = 0
+    subclass_mask = 0
+    for process, subclass in processes:
+        process_mask |= PROCESS_BITS.get(process, 0)
+        subclass_mask |= SUBCLASS_BITS.get((process, subclass), 0)
+
+    extent = EXTENT_FLAGS['discontinuous'] if string[0] == '/' else EXTENT_FLAGS['continuous']
+    if string[-1] == '=':
+        extent |= EXTENT_FLAGS['equal']
+    elif string.endswith('//'):
+        extent |= EXTENT_FLAGS['much greater']
+    elif string[-1] == '/':
+        extent |= EXTENT_FLAGS['greater']
+    return (MATERIAL_IDS.get(material, 0), expression_mask, texture_mask, process_mask,
+            subclass_mask, extent)
+
+
+def encode(terrain_codes, backend: str = 'array') -> EncodedTerrain:
+    """
+    Encodes a column of terrain codes, each distinct code once. backend is 'array' (stdlib
+    array.array) or 'numpy', which makes predicate evaluation vectorised.
+
+    >>> encoded = encode(['Cv-Rd', 'Rs/Cv-A', 'Mb'])
+    >>> list(encoded.offsets)
+    [0, 1, 3, 4]
+    """
+    if backend not in ('array', 'numpy'):
+        raise ValueError("unknown backend %r, expected 'array' or 'numpy'" % (backend,))
+    if _unencodable:
+        raise ValueError(_unencodable)
+    index_of, inverse = _index_unique(terrain_codes)
+
+    unique_lengths = array('q')
+    unique_fields = {field: array('b' if field == 'material' else 'q') for field in ENCODED_FIELDS}
+    columns = [unique_fields[field] for field in ENCODED_FIELDS]
+    for code in index_of:
+        strings = _split_composite(code)
+        unique_lengths.append(len(strings))
+        for string in strings:
+            for column, value in zip(columns, encode_component(string)):
+                column.append(value)
+
+    expand = _expand_array if backend == 'array' else _expand_numpy
+    offsets, fields = expand(unique_lengths, unique_fields, inverse)
+    return EncodedTerrain(offsets, *(fields[field] for field in ENCODED_FIELDS))
+
+
+# PREDICATES
+
+def _is_numpy(column) -> bool:
+    return hasattr(column, 'dtype')
+
+
+class Predicate:
+    """
+    A condition on a single terrain type. Combine with &, | and ~, then evaluate with
+    components() (one bool per terrain type) or rows() (one bool per code).
+
+    >>> encoded = encode(['Cv-Rd', 'Rs/Cv-A', 'Mb', 'Cv'])
+    >>> list((material('C') & has_process('R', 'A')).rows(encoded))
+    [True, True, False, False]
+    >>> list((material('C') & ~has_process()).rows(encoded))
+    [False, False, False, True]
+    >>> list(has_subclass('R', 'd').rows(encoded))
+    [True, False, False, False]
+    """
+
+    def __init__(self, test, description: str) -> None:
+        self._test = test
+        self.description = description
+
+    def __repr__(self) -> str:
+        return 'Predicate(%s)' % self.description
+
+    def __and__(self, other: 'Predicate') -> 'Predicate':
+        def test(encoded):
+            a, b = self._test(encoded), other._test(encoded)
+            return a & b if _is_numpy(a) else [x and y for x, y in zip(a, b)]
+        return Predicate(test, '(%s & %s)' % (self.description, other.description))
+
+    def __or__(self, other: 'Predicate') -> 'Predicate':
+        def test(encoded):
+            a, b = self._test(encoded), other._test(encoded)
+            return a | b if _is_numpy(a) else [x or y for x, y in zip(a, b)]
+        return Predicate(test, '(%s | %s)' % (self.description, other.description))
+
+    def __invert__(self) -> 'Predicate':
+        def test(encoded):
+            a = self._test(encoded)
+            return ~a if _is_numpy(a) else [not x for x in a]
+        return Predicate(test, '~%s' % self.description)
+
+    def components(self, encoded: EncodedTerrain):
+        """
+        One bool per terrain type of the encoded codes
+        """
+        return self._test(encoded)
+
+    def rows(self, encoded: EncodedTerrain):
+        """
+        One bool per encoded code: True if any of its terrain types matches
+        """
+        mask = self._test(encoded)
+        offsets = encoded.offsets
+        if _is_numpy(mask):
+            import numpy as np
+            matches = np.zeros(len(mask) + 1, dtype=np.int64)
+            np.cumsum(mask, out=matches[1:])
+            return matches[offsets[1:]] > matches[offsets[:-1]]
+        return [any(mask[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)]
+
+    def where(self, encoded: EncodedTerrain) -> list:
+        """
+        Indices of the encoded codes matching the predicate
+
+        >>> has_process('V').where(encode(['Cv', 'Mv=Cv-V', 'Cv-V']))
+        [1, 2]
+        """
+        return [i for i, match in enumerate(self.rows(encoded)) if match]
+
+
+def _bits_predicate(field: str, bits: int, description: str) -> Predicate:
+    def test(encoded):
+        column = getattr(encoded, field)
+        if _is_numpy(column):
+            return (column & bits) != 0
+        return [value & bits != 0 for value in column]
+    return Predicate(test, description)
+
+
+def _lookup_bits(table: dict, letters, kind: str) -> int:
+    bits = 0
+    for letter in letters:
+        if letter not in table:
+            raise ValueError('undefined %s code %r' % (kind, letter))
+        bits |= table[letter]
+    return bits
+
+
+def material(*letters: str) -> Predicate:
+    """
+    Terrain types whose surficial material is any of the given codes, e.g. material('C', 'FG')
+    """
+    ids = [MATERIAL_IDS[code] if code in MATERIAL_IDS else None for code in letters]
+    if None in ids or not ids:
+        raise ValueError('undefined surficial material code in %r' % (letters,))
+
+    def test(encoded):
+        column = encoded.material
+        if _is_numpy(column):
+            import numpy as np
+            return np.isin(column, ids)
+        wanted = set(ids)
+        return [value in wanted for value in column]
+    return Predicate(test, 'material%r' % (letters,))
+
+
+def has_expression(*letters: str) -> Predicate:
+    """
+    Terrain types with any of the given surface expression letters
+    """
+    bits = _lookup_bits(EXPRESSION_BITS, letters, 'surface expression')
+    return _bits_predicate('expression', bits, 'has_expression%r' % (letters,))
+
+
+def has_texture(*letters: str) -> Predicate:
+    """
+    Terrain types with any of the given texture letters
+    """
+    bits = _lookup_bits(TEXTURE_BITS, letters, 'texture')
+    return _bits_predicate('texture', bits, 'has_texture%r' % (letters,))
+
+
+def has_process(*letters: str) -> Predicate:
+    """
+    Terrain types modified by any of the given geomorphological processes, or by any process
+    at all when no letter is given
+    """
+    bits = _lookup_bits(PROCESS_BITS, letters or PROCESS_BITS, 'geomorphological process')
+    return _bits_predicate('process', bits, 'has_process%r' % (letters,))
+
+
+def has_subclass(process: str, *letters: str) -> Predicate:
+    """
+    Terrain types with the given process carrying any of the given subclass letters,
+    e.g. has_subclass('R', 'd') for debris flows. The parser reads only lowercase subclass
+    letters whose uppercase form is a process letter, so other subclass codes raise a ValueError.
+
+    >>> has_subclass('R', '"')
+    Traceback (most recent call last):
+     ...
+    ValueError: process subclass code '"' is never read by the parser and is not encoded
+    """
+    for letter in letters:
+        if not letter.islower() or letter.upper() not in PROCESS_BITS:
+            raise ValueError('process subclass code %r is never read by the parser and is not encoded' % (letter,))
+    bits = _lookup_bits(SUBCLASS_BITS, [(process, letter) for letter in letters], 'process subclass')
+    return has_process(process) & _bits_predicate('subclass', bits, 'has_subclass%r' % ((process,) + letters,))
+
+
+def extent(*names: str) -> Predicate:
+    """
+    Terrain types with any of the given EXTENT_FLAGS, e.g. extent('discontinuous')
+    """
+    bits = _lookup_bits(EXTENT_FLAGS, names, 'extent')
+    return _bits_predicate('extent', bits, 'extent%r' % (names,))
@@ -0,0 +1,142 @@
+# Fast writers of parsed terrain codes to NDJSON, JSON and CSV
+#
+# Terrain layers repeat a small vocabulary of codes and terrain types, so instead of building
+# a dict per row and running it through json.dumps, the writers render every distinct terrain
+# type and every distinct code once, keep the encoded bytes and write them straight to a
+# buffered binary file, chunksize rows at a time.
+#
+# The output is byte-for-byte what the straightforward code produces:
+#
+#   write_ndjson   one json.dumps(Terrain(code).json()) per line
+#   write_json     json.dumps([Terrain(code).json() for code in codes])
+#   write_csv      the code column followed by cli.OUTPUT_FIELDS, as written by the
+#                  command line tool
+#
+# Codes with unparsed terms raise a ValueError when strictmode is 1. Otherwise they are
+# written as {code: null} in NDJSON/JSON and reported in the unparsed_terms column of CSV.
+#
+# EXAMPLE:
+# ========
+#   with open('enriched.ndjson', 'wb') as f:
+#       write_ndjson(df['terrain'], f)
+
+import csv
+import functools
+import io
+import json
+
+from .bctcs_terrain_parser import Terrain, _json_group, _lookup
+from .cli import OUTPUT_FIELDS, enriched_fields
+
+
+@functools.lru_cache(maxsize=65536)
+def _group_json(component: tuple) -> str:
+    """
+    JSON text of one terrain type as in Terrain.json()
+    """
+    return json.dumps(_json_group(component))
+
+
+@functools.lru_cache(maxsize=65536)
+def _code_json(terrain_code: str, engine: str = 'legacy') -> tuple:
+    """
+    Returns (bytes, unparsed terms): the UTF-8 JSON text of {code: [terrain types]}
+
+    >>> _code_json('Cv')[0] == json.dumps(Terrain('Cv').json()).encode()
+    True
+    """
+    components, error_msg = _lookup(terrain_code, engine)
+    if error_msg:
+        text = '{%s: null}' % json.dumps(terrain_code)
+    else:
+        text = '{%s: [%s]}' % (json.dumps(terrain_code), ', '.join(map(_group_json, components)))
+    return text.encode('utf-8'), error_msg
+
+
+@functools.lru_cache(maxsize=65536)
+def _csv_row(terrain_code: str, engine: str = 'legacy', delimiter: str = ',') -> tuple:
+    """
+    Returns (bytes, unparsed terms): the UTF-8 CSV line of a code and its OUTPUT_FIELDS
+    """
+    fields = enriched_fields(terrain_code, engine)
+    line = io.StringIO()
+    csv.writer(line, delimiter=delimiter, lineterminator='\n').writerow((terrain_code,) + fields)
+    return line.getvalue().encode('utf-8'), fields[-1]
+
+
+def _write(fragments, outfile, strictmode: int, chunksize: int, separator: bytes = b'',
+           terminator: bytes = b'') -> int:
+    """
+    Writes the (bytes, unparsed terms) pairs of fragments in chunks, with separator between
+    and terminator after each of them; returns their number
+    """
+    chunk = []
+    rows = 0
+    for data, error_msg in fragments:
+        if error_msg and strictmode == 1:
+            raise ValueError(error_msg)
+        if separator and rows:
+            chunk.append(separator)
+        chunk.append(data)
+        if terminator:
+            chunk.append(terminator)
+        rows += 1
+        if len(chunk) >= chunksize:
+            outfile.write(b''.join(chunk))
+            chunk.clear()
+    outfile.write(b''.join(chunk))
+    return rows
+
+
+def write_ndjson(terrain_codes, outfile, strictmode: int = 0, engine: str = 'legacy',
+                 chunksize: int = 1000) -> int:
+    """
+    Writes one JSON object per line, in the shape of Terrain.json(), to a binary file;
+    returns the number of lines
+
+    >>> out = io.BytesIO()
+    >>> write_ndjson(['Cv', 'oNTA'], out)
+    2
+    >>> out.getvalue().splitlines()[1]
+    b'{"oNTA": null}'
+    """
+    return _write((_code_json(code, engine) for code in terrain_codes), outfile, strictmode,
+                  max(chunksize, 1), terminator=b'\n')
+
+
+def write_json(terrain_codes, outfile, strictmode: int = 0, engine: str = 'legacy',
+               chunksize: int = 1000) -> int:
+    """
+    Writes a JSON array of objects in the shape of Terrain.json() to a binary file; returns
+    the number of objects
+
+    >>> out = io.BytesIO()
+    >>> write_json(['Rs/Cv-A', 'Cv'], out)
+    2
+    >>> out.getvalue() == json.dumps([Terrain('Rs/Cv-A').json(), Terrain('Cv').json()]).encode()
+    True
+    """
+    outfile.write(b'[')
+    rows = _write((_code_json(code, engine) for code in terrain_codes), outfile, strictmode,
+                  max(chunksize, 1), separator=b', ')
+    outfile.write(b']')
+    return rows
+
+
+def write_csv(terrain_codes, outfile, strictmode: int = 0, engine: str = 'legacy',
+              delimiter: str = ',', column: str = 'terrain', chunksize: int = 1000) -> int:
+    """
+    Writes a header and one row per code (the code followed by cli.OUTPUT_FIELDS) to a binary
+    file; returns the number of rows
+
+    >>> out = io.BytesIO()
+    >>> write_csv(['Cv'], out)
+    1
+    >>> out.getvalue().decode().splitlines()[1]
+    'Cv,1,Colluvium (Active),veneer,,,continuous,,'
+    """
+    header = io.StringIO()
+    csv.writer(header, delimiter=delimiter, lineterminator='\n').writerow([column] + OUTPUT_FIELDS)
+    outfile.write(header.getvalue().encode('utf-8'))
+    return _write((_csv_row(code, engine, delimiter) for code in terrain_codes), outfile, strictmode,
+                  max(chunksize, 1))
@@ -0,0 +1,283 @@
+# Local HTTP/JSON service for the BC Terrain Classification System parser
+#
+# Keeps one warm parser process (and its parse cache) for applications that would otherwise
+# start Python and import the parser for every call. Built on the standard library only and
+# bound to 127.0.0.1 by default.
+#
+# ENDPOINTS:
+# ==========
+#   GET  /parse?code=Cv-A[&engine=tokenizer]   {"Cv-A": [{...}]}, the shape of Terrain.json()
+#   POST /parse  {"codes": [...], "engine": "legacy"}  (or just a JSON list of codes)
+#                -> {"results": {code: [{...}] or null}, "errors": {code: "unparsed terms"}}
+#   GET  /health                                  status, cache and batching statistics
+#
+# A code with unparsed terms answers 422 on the single-code endpoint; in a batch its result
+# is null and its message is listed under "errors".
+#
+# MICRO-BATCHING:
+# ===============
+# Requests arriving within --window-ms of each other are coalesced into one deduplicated
+# batch, so a burst of map tiles asking for the same few codes is parsed once. Batches of at
+# least PARALLEL_MIN_CODES new codes are spread over --workers processes, started with the
+# server and kept warm until it closes. A request whose batch is not parsed within --timeout
+# seconds answers 503.
+#
+# USAGE:
+# ======
+#   python -m bctcs_terrain_parser.service --port 8765 --window-ms 2 --workers 4
+
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .bctcs_terrain_parser import (_engine, _json_group, _parse_unique, cache_info, shutdown_workers,
+                                   start_workers, stats)
+
+
+class MicroBatcher:
+    """
+    Coalesces the codes of concurrent requests into deduplicated batches, parsed by a single
+    background thread. submit() returns a Future of a dict mapping each code to its
+    (components, error_msg) pair.
+
+    >>> batcher = MicroBatcher(window=0.01)
+    >>> first, second = batcher.submit(['Cv', 'Mb']), batcher.submit(['Cv'])
+    >>> first.result()['Mb'][0][0].surficial_material, len(second.result())
+    ('Morainal Material(Till) (Inactive)', 1)
+    >>> batcher.info()['batches'], batcher.info()['distinct_codes']
+    (1, 2)
+    >>> batcher.close()
+    """
+
+    def __init__(self, window: float = 0.002, max_batch: int = 50000, workers: int = None) -> None:
+        self.window = window
+        self.max_batch = max_batch
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._info = dict(requests=0, batches=0, codes=0, distinct_codes=0)
+        self._thread = threading.Thread(target=self._run, name='bctcs-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, codes: list, engine: str = 'legacy') -> Future:
+        _engine(engine)
+        future = Future()
+        self._queue.put((list(codes), engine, future))
+        return future
+
+    def info(self) -> dict:
+        with self._lock:
+            return dict(self._info)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            pending = [item]
+            size = len(item[0])
+            deadline = time.monotonic() + self.window
+            stop = False
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                pending.append(item)
+                size += len(item[0])
+            self._parse(pending)
+            if stop:
+                return
+
+    def _parse(self, pending: list) -> None:
+        by_engine = {}
+        for item in pending:
+            by_engine.setdefault(item[1], []).append(item)
+        for engine, items in by_engine.items():
+            codes = [code for item in items for code in item[0]]
+            try:
+                unique_codes, entries, inverse = _parse_unique(codes, engine, self.workers)
+            except Exception as exc:
+                for item in items:
+                    item[2].set_exception(exc)
+                continue
+            parsed = dict(zip(unique_codes, entries))
+            with self._lock:
+                self._info['requests'] += len(items)
+                self._info['batches'] += 1
+                self._info['codes'] += len(codes)
+                self._info['distinct_codes'] += len(unique_codes)
+            for item_codes, _, future in items:
+                future.set_result({code: parsed[code] for code in item_codes})
+
+
+def results_json(parsed: dict) -> dict:
+    """
+    Batch response body for a dict of code -> (components, error_msg) pairs
+    """
+    results = {}
+    errors = {}
+    for code, (components, error_msg) in parsed.items():
+        if error_msg:
+            results[code] = None
+            errors[code] = error_msg
+        else:
+            results[code] = [_json_group(component) for component in components]
+    return dict(results=results, errors=errors)
+
+
+class TerrainRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'bctcs-terrain-parser'
+
+    def log_message(self, format, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body) -> None:
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _parse(self, codes: list, engine: str) -> dict:
+        return self.server.batcher.submit(codes, engine).result(timeout=self.server.parse_timeout)
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/health':
+            self._send(200, dict(status='ok', cache=cache_info()._asdict(),
+                                 batching=self.server.batcher.info(), stats=stats()))
+        elif url.path == '/parse':
+            if 'code' not in query:
+                self._send(400, dict(error="missing 'code' parameter"))
+                return
+            code = query['code'][0]
+            try:
+                components, error_msg = self._parse([code], query.get('engine', ['legacy'])[0])[code]
+            except ValueError as exc:
+                self._send(400, dict(error=str(exc)))
+                return
+            except FutureTimeoutError:
+                self._send(503, dict(error='parsing timed out'))
+                return
+            if error_msg:
+                self._send(422, dict(error=error_msg))
+            else:
+                self._send(200, {code: [_json_group(component) for component in components]})
+        else:
+            self._send(404, dict(error='not found'))
+
+    def do_POST(self) -> None:
+        if urlsplit(self.path).path != '/parse':
+            self._send(404, dict(error='not found'))
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length < 0:
+                raise ValueError('invalid Content-Length %d' % length)
+            body = json.loads(self.rfile.read(length) or b'null')
+            if isinstance(body, dict):
+                codes, engine = body.get('codes'), body.get('engine', 'legacy')
+            else:
+                codes, engine = body, 'legacy'
+            if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+                raise ValueError('expected a list of terrain code strings')
+            if not isinstance(engine, str):
+                raise ValueError('expected the engine name as a string')
+            parsed = self._parse(codes, engine)
+        except ValueError as exc:
+            self._send(400, dict(error=str(exc)))
+            return
+        except FutureTimeoutError:
+            self._send(503, dict(error='parsing timed out'))
+            return
+        self._send(200, results_json(parsed))
+
+
+def make_server(host: str = '127.0.0.1', port: int = 8765, window: float = 0.002,
+                workers: int = None, verbose: bool = False, timeout: float = 30.0) -> ThreadingHTTPServer:
+    """
+    Creates (but does not start) the service; call serve_forever() on the result. The worker
+    processes, if any, are started here and stopped by server_close().
+
+    >>> import urllib.request
+    >>> server = make_server(port=0)
+    >>> thread = threading.Thread(target=server.serve_forever, daemon=True)
+    >>> thread.start()
+    >>> url = 'http://127.0.0.1:%d/parse' % server.server_address[1]
+    >>> json.load(urllib.request.urlopen(url + '?code=Cv'))
+    {'Cv': [{'surficial_material': 'Colluvium (Active)', 'surface_expression': 'veneer', 'texture': None, 'geomorphological_processes': None, 'extent': 'continuous', 'coverage_relative_to_next_terrain_type': None}]}
+    >>> request = urllib.request.Request(url, data=json.dumps(['Mb', 'oNTA']).encode())
+    >>> json.load(urllib.request.urlopen(request))['errors']
+    {'oNTA': 'NT: undefined surficial material code; o: undefined texture codes'}
+    >>> request = urllib.request.Request(url, data=json.dumps({'codes': ['Cv'], 'engine': ['legacy']}).encode())
+    >>> urllib.request.urlopen(request)
+    Traceback (most recent call last):
+     ...
+    urllib.error.HTTPError: HTTP Error 400: Bad Request
+    >>> server.shutdown(); server.server_close()
+    """
+    server = ThreadingHTTPServer((host, port), TerrainRequestHandler)
+    server.daemon_threads = True
+    server.batcher = MicroBatcher(window, workers=workers)
+    server.verbose = verbose
+    server.parse_timeout = timeout
+    if workers is not None and workers > 1:
+        start_workers(workers)
+    server_close = server.server_close
+
+    def close() -> None:
+        server_close()
+        server.batcher.close()
+        if workers is not None and workers > 1:
+            shutdown_workers()
+    server.server_close = close
+    return server
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m bctcs_terrain_parser.service',
+                                     description='Serve the BCTCS parser over local HTTP/JSON.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to bind (default 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on (default 8765)')
+    parser.add_argument('--window-ms', type=float, default=2.0,
+                        help='coalesce requests arriving within this many milliseconds (default 2)')
+    parser.add_argument('--workers', type=int, help='worker processes for large batches')
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help='seconds a request waits for its batch before answering 503 (default 30)')
+    parser.add_argument('--verbose', action='store_true', help='log every request to stderr')
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, args.window_ms / 1000, args.workers, args.verbose,
+                         args.timeout)
+    print('serving on http://%s:%d' % server.server_address[:2], file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,231 @@
+# Synthetic BC Terrain Classification System codes for scale testing
+#
+# Generates terrain codes from the vocabularies in bctcs_terrain_parser.py following the
+# code syntax  texture SURFICIAL_MATERIAL expression - PROCESSES subclass,  joined into
+# composites with '/', '//' and '='. A pool of `cardinality` distinct codes is built first,
+# then rows are drawn from it with Zipf-like repetition (rank r has weight 1 / r**zipf), which
+# mimics real layers where a few codes such as 'Cv' dominate. A share of the distinct codes
+# (error_rate) is deliberately malformed.
+#
+# Everything is driven by one seed, so a given set of options always produces the same rows,
+# and rows are generated lazily, so tens of millions can be streamed to a file.
+#
+# Well-formed codes are checked with is_valid() and malformed ones with not is_valid(), so
+# exactly round(error_rate * cardinality) codes of the pool have unparsed terms.
+#
+# USAGE:
+# ======
+#   python -m bctcs_terrain_parser.synthetic -n 10000000 --cardinality 20000 --zipf 1.1 -o layer.csv
+
+import argparse
+import csv
+import itertools
+import random
+import sys
+
+from .bctcs_terrain_parser import (textural_terms, surficial_material_terms,
+                                   surface_expression_terms, geomorphological_process_terms,
+                                   slow_mass_movement_F_subclass_terms,
+                                   rapid_mass_movement_R_subclass_terms,
+                                   snow_avalanches_A_subclass_terms,
+                                   fluvial_B_I_J_M_subclass_terms,
+                                   permafrost_X_Z_subclass_terms, is_valid)
+
+_SUBCLASSES = {
+    'F': slow_mass_movement_F_subclass_terms,
+    'R': rapid_mass_movement_R_subclass_terms,
+    'A': snow_avalanches_A_subclass_terms,
+    'B': fluvial_B_I_J_M_subclass_terms,
+    'I': fluvial_B_I_J_M_subclass_terms,
+    'J': fluvial_B_I_J_M_subclass_terms,
+    'M': fluvial_B_I_J_M_subclass_terms,
+    'X': permafrost_X_Z_subclass_terms,
+    'Z': permafrost_X_Z_subclass_terms,
+}
+
+# Characters used to corrupt codes when generating malformed ones
+_NOISE = 'NTQYqy$!?0'
+
+
+class CodeGenerator:
+    """
+    Seeded generator of synthetic terrain codes.
+
+    :param seed : int
+        Random seed; the same options and seed always give the same codes
+    :param cardinality : int
+        Number of distinct codes rows are drawn from
+    :param zipf : float
+        Skew of the repetition; 0 draws every distinct code equally often
+    :param max_depth : int
+        Maximum number of terrain types in a composite code
+    :param composite_rate : float
+        Probability that a code has more than one terrain type
+    :param separators : dict
+        Relative weights of the composite separators '/', '//' and '='
+    :param process_density : float
+        Probability that a terrain type has geomorphological processes
+    :param subclass_density : float
+        Probability that a process letter with subclasses gets a subclass letter
+    :param texture_rate : float
+        Probability that a terrain type has texture letters
+    :param discontinuous_rate : float
+        Probability that a code starts with '/' (discontinuous)
+    :param error_rate : float
+        Share of the distinct codes that are malformed
+
+    >>> generator = CodeGenerator(seed=7, cardinality=50)
+    >>> codes = list(generator.rows(5))
+    >>> codes == list(CodeGenerator(seed=7, cardinality=50).rows(5))
+    True
+    >>> len(generator.pool)
+    50
+    >>> generator = CodeGenerator(seed=7, cardinality=200, error_rate=0.1)
+    >>> sum(not is_valid(code) for code in generator.pool) / len(generator.pool)
+    0.1
+    """
+
+    def __init__(self, seed: int = 0, cardinality: int = 1000, zipf: float = 1.0,
+                 max_depth: int = 3, composite_rate: float = 0.5, separators: dict = None,
+                 process_density: float = 0.4, subclass_density: float = 0.3,
+                 texture_rate: float = 0.2, discontinuous_rate: float = 0.02,
+                 error_rate: float = 0.0) -> None:
+        if cardinality < 1:
+            raise ValueError('cardinality must be at least 1')
+        self.seed = seed
+        self.cardinality = cardinality
+        self.zipf = zipf
+        self.max_depth = max(max_depth, 1)
+        self.composite_rate = composite_rate
+        self.separators = separators or {'/': 5, '//': 2, '=': 3}
+        self.process_density = process_density
+        self.subclass_density = subclass_density
+        self.texture_rate = texture_rate
+        self.discontinuous_rate = discontinuous_rate
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._textures = [letter for letter in textural_terms if letter.islower()]
+        self._materials = list(surficial_material_terms)
+        self._expressions = list(surface_expression_terms)
+        self._processes = list(geomorphological_process_terms)
+        self._subclasses = {process: list(terms) for process, terms in _SUBCLASSES.items()}
+        self.pool = self._build_pool()
+        self._cum_weights = list(itertools.accumulate(1.0 / rank ** zipf
+                                                      for rank in range(1, len(self.pool) + 1)))
+
+    def component(self) -> str:
+        """
+        Returns the code of a single, well-formed terrain type
+        """
+        rnd = self._random
+        code = ''
+        if rnd.random() < self.texture_rate:
+            code += ''.join(rnd.sample(self._textures, rnd.randint(1, 2)))
+        code += rnd.choice(self._materials)
+        code += ''.join(rnd.sample(self._expressions, rnd.choice((0, 1, 1, 1, 2))))
+        if rnd.random() < self.process_density:
+            code += '-'
+            for process in rnd.sample(self._processes, rnd.choice((1, 1, 1, 2, 2, 3))):
+                code += process
+                if process in _SUBCLASSES and rnd.random() < self.subclass_density:
+                    code += rnd.choice(self._subclasses[process])
+        return code
+
+    def code(self) -> str:
+        """
+        Returns a new well-formed (possibly composite) terrain code
+        """
+        rnd = self._random
+        depth = 1
+        if self.max_depth > 1 and rnd.random() < self.composite_rate:
+            depth = rnd.randint(2, self.max_depth)
+        separators = list(self.separators)
+        weights = [self.separators[separator] for separator in separators]
+        code = '/' if rnd.random() < self.discontinuous_rate else ''
+        for i in range(depth):
+            if i:
+                code += rnd.choices(separators, weights)[0]
+            code += self.component()
+        return code
+
+    def malformed(self) -> str:
+        """
+        Returns a code corrupted with an undefined or misplaced character, so that it has
+        unparsed terms
+        """
+        rnd = self._random
+        for _ in range(100):
+            code = self.code()
+            position = rnd.randint(0, len(code))
+            code = code[:position] + rnd.choice(_NOISE) + code[position:]
+            if not is_valid(code):
+                return code
+        raise ValueError('could not corrupt codes with %r, the vocabulary defines them' % _NOISE)
+
+    def _build_pool(self) -> list:
+        pool = []
+        seen = set()
+        malformed = round(self.error_rate * self.cardinality)
+        attempts = 0
+        while len(pool) < self.cardinality and attempts < self.cardinality * 50:
+            attempts += 1
+            # exactly `malformed` codes of the pool, at random positions
+            corrupt = self._random.random() * (self.cardinality - len(pool)) < malformed
+            if corrupt:
+                code = self.malformed()
+            else:
+                code = self.code()
+                if not is_valid(code):
+                    continue
+            if code not in seen:
+                seen.add(code)
+                pool.append(code)
+                malformed -= corrupt
+        if len(pool) < self.cardinality:
+            raise ValueError('could not generate %d distinct codes with these options' % self.cardinality)
+        return pool
+
+    def rows(self, n: int, batch: int = 65536):
+        """
+        Yields n codes drawn from the pool with Zipf-like repetition
+        """
+        rnd = self._random
+        while n > 0:
+            k = min(batch, n)
+            yield from rnd.choices(self.pool, cum_weights=self._cum_weights, k=k)
+            n -= k
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m bctcs_terrain_parser.synthetic',
+                                     description='Write a CSV of synthetic BCTCS terrain codes.')
+    parser.add_argument('-n', '--rows', type=int, default=100000, help='number of rows (default 100000)')
+    parser.add_argument('-o', '--output', default='-', help="output CSV (default '-' writes stdout)")
+    parser.add_argument('--column', default='terrain', help="name of the code column (default 'terrain')")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cardinality', type=int, default=1000, help='number of distinct codes')
+    parser.add_argument('--zipf', type=float, default=1.0, help='repetition skew, 0 for uniform')
+    parser.add_argument('--max-depth', type=int, default=3, help='maximum terrain types per code')
+    parser.add_argument('--composite-rate', type=float, default=0.5)
+    parser.add_argument('--process-density', type=float, default=0.4)
+    parser.add_argument('--subclass-density', type=float, default=0.3)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    generator = CodeGenerator(seed=args.seed, cardinality=args.cardinality, zipf=args.zipf,
+                              max_depth=args.max_depth, composite_rate=args.composite_rate,
+                              process_density=args.process_density,
+                              subclass_density=args.subclass_density, error_rate=args.error_rate)
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', buffering=1 << 16)
+    try:
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(['fid', args.column])
+        writer.writerows(enumerate(generator.rows(args.rows), 1))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# Tests of incremental re-enrichment (incremental.py): edits, deletions and vocabulary changes
+#
+#   python -m pytest src/bctcs_terrain_parser/tests
+
+import csv
+import json
+
+import pytest
+
+from bctcs_terrain_parser import incremental
+from bctcs_terrain_parser.bctcs_terrain_parser import cache_clear
+from bctcs_terrain_parser.benchmark import load_codes
+from bctcs_terrain_parser.cli import enriched_fields
+from bctcs_terrain_parser.vocabulary import Vocabulary, use
+
+
+@pytest.fixture(autouse=True)
+def builtin_vocabulary():
+    yield
+    use(Vocabulary.builtin())
+
+
+@pytest.fixture
+def layer(tmp_path):
+    """
+    Paths of a layer of Chilliwack codes, its enriched output and manifest
+    """
+    paths = dict(layer=tmp_path / 'layer.csv', output=tmp_path / 'enriched.csv',
+                 manifest=tmp_path / 'enriched.manifest.csv', vocabulary=tmp_path / 'regional.json')
+    write_layer(paths['layer'], enumerate(load_codes()))
+    return paths
+
+
+def write_layer(path, rows) -> None:
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['fid', 'terrain'])
+        writer.writerows(rows)
+
+
+def read_rows(path) -> list:
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def run(paths, capsys, *options, output=None) -> dict:
+    """
+    Runs the command line tool on the layer; returns the counts it reports
+    """
+    argv = [str(paths['layer']), '--previous', str(paths['output']), '--manifest', str(paths['manifest']),
+            '-o', str(output or paths['output'])] + list(options)
+    assert incremental.main(argv) == 0
+    report = capsys.readouterr().err.split()
+    return {change.rstrip(':'): int(count) for change, count in zip(report[::2], report[1::2])}
+
+
+def full_run(paths, tmp_path, capsys, *options) -> list:
+    """
+    Output of a run from scratch with the given options
+    """
+    fresh = dict(paths, output=tmp_path / 'fresh.csv', manifest=tmp_path / 'fresh.manifest.csv')
+    run(fresh, capsys, *options)
+    return read_rows(fresh['output'])
+
+
+@pytest.fixture
+def parse_counter(monkeypatch):
+    """
+    Counts the codes incremental_rows() parses
+    """
+    parsed = []
+
+    def counting_enriched_fields(code, engine='legacy'):
+        parsed.append(code)
+        return enriched_fields(code, engine)
+
+    monkeypatch.setattr(incremental, 'enriched_fields', counting_enriched_fields)
+    return parsed
+
+
+def test_first_run_adds_everything(layer, capsys):
+    counts = run(layer, capsys)
+    codes = load_codes()
+    assert counts['added'] == len(codes)
+    rows = read_rows(layer['output'])
+    assert len(rows) == len(codes) + 1
+    assert rows[1][2:] == list(enriched_fields(codes[0]))
+    assert (layer['manifest'].parent / (layer['manifest'].name + '.vocabulary.json')).exists()
+
+
+def test_second_run_parses_nothing(layer, capsys, parse_counter):
+    run(layer, capsys)
+    first = read_rows(layer['output'])
+    parse_counter.clear()
+    counts = run(layer, capsys)
+    assert counts['unchanged'] == len(first) - 1
+    assert parse_counter == []
+    assert read_rows(layer['output']) == first
+
+
+def test_edits(layer, tmp_path, capsys):
+    run(layer, capsys)
+    codes = load_codes()
+    rows = [(fid, code) for fid, code in enumerate(codes) if fid != 1]
+    rows[0] = (0, 'Rs/Cv-A')
+    rows.append((len(codes), 'Mb'))
+    write_layer(layer['layer'], rows)
+
+    delta = tmp_path / 'delta.csv'
+    counts = run(layer, capsys, '--delta', output=delta)
+    assert (counts['added'], counts['changed'], counts['deleted']) == (1, 1, 1)
+    changes = {(row[0], row[1]) for row in read_rows(delta)[1:]}
+    assert changes == {('changed', '0'), ('added', str(len(codes))), ('deleted', '1')}
+
+    # the manifest now describes the new layer: a full run against it changes nothing
+    counts = run(dict(layer, output=tmp_path / 'full.csv'), capsys)
+    assert counts['unchanged'] == len(rows)
+
+
+def test_vocabulary_change_reparses_affected_codes(layer, tmp_path, capsys, parse_counter):
+    run(layer, capsys)
+    with open(layer['vocabulary'], 'w') as f:
+        json.dump({'name': 'regional', 'extends': 'builtin',
+                   'terms': {'surface_expression_terms': {'v': 'thin veneer'}}}, f)
+
+    parse_counter.clear()
+    cache_clear()
+    counts = run(layer, capsys, '--vocabulary', str(layer['vocabulary']))
+    # only codes with a 'v' or 'V' were parsed again, each once
+    assert parse_counter and all('v' in code.lower() for code in parse_counter)
+    assert len(parse_counter) == len(set(parse_counter))
+    assert counts['reparsed'] == sum('v' in row[1] for row in read_rows(layer['output'])[1:]
+                                     if 'thin veneer' in row[4])
+    assert read_rows(layer['output']) == full_run(layer, tmp_path, capsys, '--vocabulary', str(layer['vocabulary']))
+
+
+def test_missing_vocabulary_file_reparses_everything(layer, capsys, parse_counter):
+    run(layer, capsys)
+    (layer['manifest'].parent / (layer['manifest'].name + '.vocabulary.json')).unlink()
+    use(Vocabulary.builtin().extend({'textural_terms': {'q': 'Quartz'}}, 'regional'))
+    parse_counter.clear()
+    counts = run(layer, capsys)
+    assert counts['unchanged'] + counts['reparsed'] == len(load_codes())
+    assert len(parse_counter) == len(set(load_codes()))
+
+
+def test_engine_change_reparses_everything(layer, tmp_path, capsys, parse_counter):
+    run(layer, capsys)
+    parse_counter.clear()
+    run(layer, capsys, '--engine', 'tokenizer')
+    assert len(parse_counter) == len(set(load_codes()))
+    assert read_rows(layer['output']) == full_run(layer, tmp_path, capsys, '--engine', 'tokenizer')
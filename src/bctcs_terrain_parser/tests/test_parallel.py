@@ -0,0 +1,102 @@
+# Tests of parallel parse_many(): the shared process pool and the parallel threshold
+#
+#   python -m pytest src/bctcs_terrain_parser/tests
+
+import pytest
+
+from bctcs_terrain_parser import bctcs_terrain_parser as parser
+from bctcs_terrain_parser import service
+from bctcs_terrain_parser.benchmark import load_codes
+from bctcs_terrain_parser.bctcs_terrain_parser import cache_clear, parse_many, shutdown_workers, start_workers
+from bctcs_terrain_parser.vocabulary import Vocabulary, use
+
+
+@pytest.fixture(autouse=True)
+def clean_pool():
+    shutdown_workers()
+    cache_clear()
+    yield
+    shutdown_workers()
+    cache_clear()
+
+
+@pytest.fixture(scope='module')
+def codes():
+    return load_codes()
+
+
+@pytest.mark.parametrize('engine', ['legacy', 'tokenizer'])
+def test_parallel_results_match_serial(codes, engine):
+    serial = parse_many(codes, engine=engine)
+    cache_clear()
+    parallel = parse_many(codes, workers=2, chunksize=100, engine=engine, parallel_min_codes=1)
+    assert parser._pool is not None
+    assert parallel == serial
+
+
+def test_parallel_results_are_cached(codes):
+    parse_many(codes, workers=2, parallel_min_codes=1)
+    info = parser.cache_info()
+    assert info.misses == 0
+    assert info.currsize == len(set(codes))
+    parse_many(codes)
+    assert parser.cache_info().misses == 0
+
+
+def test_below_threshold_stays_in_process(codes):
+    parse_many(codes, workers=2, parallel_min_codes=len(set(codes)) + 1)
+    assert parser._pool is None
+    parse_many(codes, workers=2)
+    assert parser._pool is None
+
+
+def test_cached_codes_are_not_sent(codes):
+    parse_many(codes)
+    parse_many(codes, workers=2, parallel_min_codes=1)
+    assert parser._pool is None
+
+
+def test_pool_is_reused(codes):
+    start_workers(2)
+    pool = parser._pool
+    parse_many(codes[:500], workers=2, parallel_min_codes=1)
+    cache_clear()
+    parse_many(codes[500:], workers=2, parallel_min_codes=1)
+    assert parser._pool is pool
+    parse_many(codes, workers=3, parallel_min_codes=1)
+    assert parser._pool is not pool and parser._pool_workers == 3
+
+
+def test_shutdown_workers(codes):
+    parse_many(codes, workers=2, parallel_min_codes=1)
+    shutdown_workers()
+    assert parser._pool is None
+    cache_clear()
+    assert parse_many(['Cv'], workers=2, parallel_min_codes=1)[0][0].surface_expression == 'veneer'
+    assert parser._pool is not None
+
+
+def test_workers_use_the_installed_vocabulary():
+    start_workers(2)
+    try:
+        use(Vocabulary.builtin().extend({'surficial_material_terms': {'MG': 'Glacial Till (Inactive)'}}, 'regional'))
+        # use() stops the workers holding the previous vocabulary
+        assert parser._pool is None
+        result = parse_many(['MGv', 'Cv'], workers=2, parallel_min_codes=1)
+        assert result[0][0].surficial_material == 'Glacial Till (Inactive)'
+    finally:
+        use(Vocabulary.builtin())
+    cache_clear()
+    assert parse_many(['MGv'], workers=2, parallel_min_codes=1) == [None]
+
+
+def test_service_keeps_workers_warm():
+    server = service.make_server(port=0, workers=2)
+    try:
+        pool = parser._pool
+        assert pool is not None
+        server.batcher.submit(['Cv', 'Mb']).result(timeout=10)
+        assert parser._pool is pool
+    finally:
+        server.server_close()
+    assert parser._pool is None
@@ -0,0 +1,144 @@
+# Tests of the local HTTP/JSON service (service.py): malformed requests and batch timeouts
+#
+#   python -m pytest src/bctcs_terrain_parser/tests
+
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from bctcs_terrain_parser import service
+
+
+@pytest.fixture
+def serve():
+    """
+    Starts services on free ports; yields a function making one and returning its port
+    """
+    servers = []
+
+    def start(**kwargs):
+        server = service.make_server(port=0, **kwargs)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server.server_address[1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def request(port: int, method: str, path: str, body: bytes = None, headers: dict = None) -> tuple:
+    """
+    Sends one request with exactly the given headers; returns (status, decoded JSON body)
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        connection.putrequest(method, path)
+        for name, value in (headers or {}).items():
+            connection.putheader(name, value)
+        connection.endheaders()
+        if body:
+            connection.send(body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def post(port: int, body: bytes) -> tuple:
+    return request(port, 'POST', '/parse', body, {'Content-Length': str(len(body))})
+
+
+def test_batch(serve):
+    port = serve()
+    status, body = post(port, json.dumps({'codes': ['Cv', 'oNTA'], 'engine': 'tokenizer'}).encode())
+    assert status == 200
+    assert body['results']['Cv'][0]['surficial_material'] == 'Colluvium (Active)'
+    assert body['results']['oNTA'] is None
+    assert body['errors'] == {'oNTA': 'NT: undefined surficial material code; o: undefined texture codes'}
+
+
+@pytest.mark.parametrize('length', ['abc', '-1', '1.5'])
+def test_bad_content_length(serve, length):
+    port = serve()
+    status, body = request(port, 'POST', '/parse', b'["Cv"]', {'Content-Length': length})
+    assert status == 400
+    assert 'error' in body
+
+
+def test_missing_content_length(serve):
+    port = serve()
+    status, body = request(port, 'POST', '/parse')
+    assert status == 400
+    assert body == {'error': 'expected a list of terrain code strings'}
+
+
+@pytest.mark.parametrize('data', [b'["Cv"', b'{codes: ["Cv"]}', b'\xff\xfe'])
+def test_bad_json(serve, data):
+    port = serve()
+    status, body = post(port, data)
+    assert status == 400
+    assert 'error' in body
+
+
+@pytest.mark.parametrize('payload', [{'codes': 'Cv'}, {'codes': ['Cv', 3]}, {'engine': 'legacy'}, 'Cv'])
+def test_not_a_list_of_codes(serve, payload):
+    port = serve()
+    status, body = post(port, json.dumps(payload).encode())
+    assert status == 400
+    assert body == {'error': 'expected a list of terrain code strings'}
+
+
+@pytest.mark.parametrize('engine', [['legacy'], 1, None, {'name': 'legacy'}])
+def test_non_string_engine(serve, engine):
+    port = serve()
+    status, body = post(port, json.dumps({'codes': ['Cv'], 'engine': engine}).encode())
+    assert status == 400
+    assert body == {'error': 'expected the engine name as a string'}
+
+
+def test_unknown_engine(serve):
+    port = serve()
+    status, body = post(port, json.dumps({'codes': ['Cv'], 'engine': 'fast'}).encode())
+    assert status == 400
+    assert body['error'].startswith("unknown parse engine 'fast'")
+    status, body = request(port, 'GET', '/parse?code=Cv&engine=fast')
+    assert status == 400
+
+
+def test_single_code(serve):
+    port = serve()
+    assert request(port, 'GET', '/parse?code=Cv')[0] == 200
+    assert request(port, 'GET', '/parse?code=oNTA')[0] == 422
+    assert request(port, 'GET', '/parse')[0] == 400
+    assert request(port, 'GET', '/nowhere')[0] == 404
+
+
+def test_batch_timeout(serve, monkeypatch):
+    parse_unique = service._parse_unique
+
+    def slow_parse_unique(*args, **kwargs):
+        time.sleep(0.5)
+        return parse_unique(*args, **kwargs)
+
+    monkeypatch.setattr(service, '_parse_unique', slow_parse_unique)
+    port = serve(timeout=0.05)
+    status, body = post(port, json.dumps(['Cv']).encode())
+    assert status == 503
+    assert body == {'error': 'parsing timed out'}
+    status, body = request(port, 'GET', '/parse?code=Mb')
+    assert status == 503
+
+
+def test_batches_within_timeout(serve):
+    port = serve(timeout=5.0)
+    status, body = post(port, json.dumps(['Cv', 'Mb', 'Cv']).encode())
+    assert status == 200
+    assert sorted(body['results']) == ['Cv', 'Mb']
+    status, body = request(port, 'GET', '/health')
+    assert status == 200
+    assert body['batching']['requests'] == 1
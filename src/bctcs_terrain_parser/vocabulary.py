@@ -0,0 +1,229 @@
+# Pluggable, versioned vocabularies for the BC Terrain Classification System parser
+#
+# The parser reads its terms from the dictionaries at the top of bctcs_terrain_parser.py, the
+# built-in vocabulary. A Vocabulary holds another set of those dictionaries, e.g. a regional
+# extension loaded from a JSON file, checks that the parser can read them and installs them
+# in place of the built-in ones:
+#
+#   use(Vocabulary.load('northeast.json'))   # every engine, cache and writer now uses it
+#   ...
+#   use(Vocabulary.builtin())
+#
+# Vocabulary.builtin().save('bctcs.json') writes the built-in vocabulary as a starting point.
+#
+# FILE FORMAT:
+# ============
+#   {"name": "northeast", "version": "2", "extends": "builtin",
+#    "terms": {"surficial_material_terms": {"MG": "Glacial Till (Inactive)"}}}
+#
+# "terms" maps names from VOCABULARIES to dictionaries of code: description. With "extends"
+# ('builtin', or the path of another vocabulary file relative to this one) the dictionaries
+# are merged into that vocabulary, adding or replacing codes; without it every dictionary
+# must be given.
+#
+# Installing a vocabulary compiles the lookup tables of the parser from its dictionaries, which
+# takes well under a millisecond, in this process and in each worker process of a parallel
+# parse_many().
+#
+# use() clears the parse cache and the caches of cli, geojson, serializers and aggregate, and
+# rebuilds the integer encodings of query.py. Terrain objects that were already parsed keep
+# their result, and columns encoded before keep the IDs and bits of the previous vocabulary.
+
+import json
+import os
+
+from . import bctcs_terrain_parser as _parser
+from .bctcs_terrain_parser import VOCABULARIES, _build_tables, _terms_hash
+
+# Characters with a meaning of their own in the code syntax
+_SYNTAX = '-/=^'
+
+# Shape of the codes of each dictionary: (description, test of a single code)
+_CODE_RULES = {
+    'textural_terms': ('a single ASCII character other than an uppercase letter, digit or ' + _SYNTAX,
+                       lambda code: len(code) == 1 and code.isascii() and not code.isupper()
+                       and not code.isdigit() and code not in _SYNTAX),
+    'surficial_material_terms': ('one or two uppercase ASCII letters',
+                                 lambda code: 1 <= len(code) <= 2 and code.isascii()
+                                 and code.isalpha() and code.isupper()),
+    'surface_expression_terms': ('a single lowercase ASCII letter',
+                                 lambda code: len(code) == 1 and code.isascii() and code.islower()),
+    'geomorphological_process_terms': ('a single uppercase ASCII letter',
+                                       lambda code: len(code) == 1 and code.isascii() and code.isupper()),
+    'bedrock_R_subclass_terms': ('two lowercase ASCII letters',
+                                 lambda code: len(code) == 2 and code.isascii() and code.isalpha()
+                                 and code.islower()),
+    'qualifier_terms': ('a single uppercase ASCII letter',
+                        lambda code: len(code) == 1 and code.isascii() and code.isupper()),
+}
+for _name in ('slow_mass_movement_F_subclass_terms', 'rapid_mass_movement_R_subclass_terms',
+              'snow_avalanches_A_subclass_terms', 'fluvial_B_I_J_M_subclass_terms',
+              'permafrost_X_Z_subclass_terms'):
+    _CODE_RULES[_name] = _CODE_RULES['textural_terms']
+del _name
+
+# The vocabulary shipped with the parser, as it was at import
+_BUILTIN = {name: dict(getattr(_parser, name)) for name in VOCABULARIES}
+
+
+def _check_terms(terms: dict) -> list:
+    """
+    Returns a description of every problem that keeps the parser from reading terms
+
+    >>> _check_terms(dict(_BUILTIN, surface_expression_terms={'V': 'veneer'}, extra_terms={}))
+    ["unknown dictionary 'extra_terms'", "surface_expression_terms: 'V' is not a single lowercase ASCII letter"]
+    """
+    problems = ['unknown dictionary %r' % name for name in terms if name not in _CODE_RULES]
+    for name, (rule, test) in _CODE_RULES.items():
+        if name not in terms:
+            problems.append('missing dictionary %r' % name)
+            continue
+        if not isinstance(terms[name], dict):
+            problems.append('%s: expected a dictionary of code: description' % name)
+            continue
+        for code, description in terms[name].items():
+            if not isinstance(code, str) or not test(code):
+                problems.append('%s: %r is not %s' % (name, code, rule))
+            if not isinstance(description, str) or not description:
+                problems.append('%s: the description of %r is not a non-empty string' % (name, code))
+    return problems
+
+
+class Vocabulary:
+    """
+    A complete set of vocabulary dictionaries (one for each name in VOCABULARIES), checked
+    when it is created; raises a ValueError listing every problem found.
+
+    :param terms : dict
+        Dictionaries of code: description by name
+    :param name : str
+        Name of the vocabulary, e.g. a region
+    :param version : str
+        Version of the vocabulary
+
+    >>> regional = Vocabulary.builtin().extend({'surficial_material_terms': {'MG': 'Glacial Till (Inactive)'}})
+    >>> regional.hash != Vocabulary.builtin().hash
+    True
+    >>> Vocabulary(dict(regional.terms, bedrock_R_subclass_terms={'g': 'granite'}))
+    Traceback (most recent call last):
+     ...
+    ValueError: invalid vocabulary: bedrock_R_subclass_terms: 'g' is not two lowercase ASCII letters
+    """
+
+    def __init__(self, terms: dict, name: str = '', version: str = '') -> None:
+        problems = _check_terms(terms)
+        if problems:
+            raise ValueError('invalid vocabulary: ' + '; '.join(problems))
+        self.terms = {vocabulary: dict(terms[vocabulary]) for vocabulary in VOCABULARIES}
+        self.name = name
+        self.version = version
+        self.hash = _terms_hash(self.terms)
+
+    def __repr__(self) -> str:
+        return 'Vocabulary(name=%r, version=%r, hash=%r)' % (self.name, self.version, self.hash)
+
+    @classmethod
+    def builtin(cls) -> 'Vocabulary':
+        """
+        The vocabulary shipped with the parser
+        """
+        return cls(_BUILTIN, 'builtin')
+
+    @classmethod
+    def load(cls, path: str) -> 'Vocabulary':
+        """
+        Reads a vocabulary file (see FILE FORMAT above)
+        """
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not isinstance(data.get('terms'), dict):
+            raise ValueError('%s: expected a JSON object with a "terms" object' % path)
+        base = data.get('extends')
+        if base is None:
+            return cls(data['terms'], data.get('name', ''), data.get('version', ''))
+        if base == 'builtin':
+            base = cls.builtin()
+        else:
+            base = cls.load(os.path.join(os.path.dirname(path), base))
+        return base.extend(data['terms'], data.get('name', ''), data.get('version', ''))
+
+    def extend(self, terms: dict, name: str = '', version: str = '') -> 'Vocabulary':
+        """
+        Returns a new vocabulary with the codes of terms (dictionaries by name) added to, or
+        replacing, those of this one
+        """
+        merged = {vocabulary: dict(codes) for vocabulary, codes in self.terms.items()}
+        for vocabulary, codes in terms.items():
+            if vocabulary in merged and isinstance(codes, dict):
+                merged[vocabulary].update(codes)
+            else:
+                merged[vocabulary] = codes
+        return Vocabulary(merged, name or self.name, version or self.version)
+
+    def save(self, path: str) -> None:
+        """
+        Writes the complete vocabulary to a file that load() reads back
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(dict(name=self.name, version=self.version, terms=self.terms), f,
+                      indent=2, ensure_ascii=False)
+            f.write('\n')
+
+    def compile(self) -> dict:
+        """
+        Returns the compiled lookup tables of this vocabulary (by name, see TABLES)
+        """
+        return _build_tables(self.terms)
+
+
+def _use_terms(terms: dict) -> None:
+    """
+    Process pool initializer: installs the vocabulary of the parent process in a worker
+    """
+    _parser._install_vocabulary(terms)
+
+
+_current = None
+
+
+def current() -> Vocabulary:
+    """
+    The vocabulary in use
+
+    >>> current().name
+    'builtin'
+    """
+    return _current or Vocabulary.builtin()
+
+
+def use(vocabulary: Vocabulary) -> None:
+    """
+    Installs a vocabulary for every parse engine and clears the caches that hold results of
+    the previous one. Not safe to call while other threads are parsing.
+
+    >>> from .bctcs_terrain_parser import Terrain
+    >>> use(Vocabulary.builtin().extend({'surficial_material_terms': {'MG': 'Glacial Till (Inactive)'}}, 'regional'))
+    >>> Terrain('M^Gv').parsed[0][:2], current().name
+    (['Glacial Till (Inactive)', 'veneer'], 'regional')
+    >>> from .query import encode, material
+    >>> list(material('MG').rows(encode(['MGv', 'Mv'])))
+    [True, False]
+    >>> use(Vocabulary.builtin())
+    >>> Terrain('M^Gv', strictmode=0).result.errors
+    (TerrainError(component=0, category='surficial material', chars='MG'),)
+    """
+    global _current
+    from . import aggregate, cli, geojson, query, serializers
+
+    tables = vocabulary.compile()
+    worker_init = None
+    if vocabulary.hash != _terms_hash(_BUILTIN):
+        worker_init = (_use_terms, (vocabulary.terms,))
+    # the worker processes of parallel parses still hold the previous vocabulary
+    _parser.shutdown_workers()
+    _parser._install_vocabulary(vocabulary.terms, tables, worker_init)
+    for cached in (cli.enriched_fields, geojson._rendered, serializers._group_json,
+                   serializers._code_json, serializers._csv_row, aggregate._code_shares):
+        cached.cache_clear()
+    query._build_encodings()
+    _current = vocabulary